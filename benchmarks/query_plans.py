@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+Show the query plans and timings of the queries that read the album list,
+the pages of an album and the neighbours of an item, before and after the
+composite indexes of migration 0015, on a seeded SQLite database. (The
+partial indexes on the album photos are only created on PostgreSQL.)
+
+    ./benchmarks/query_plans.py --albums 1000 --photos 1000000
+
+Seeding a million photos takes a few minutes. The database is deleted
+afterwards unless `--keep` is given.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import django
+from django.conf import settings
+
+sys.path.insert(
+    0,
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+)
+
+SEED_BATCH_SIZE = 10000
+TIMING_RUNS = 20
+
+
+def configure(db_path):
+    settings.configure(
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': db_path,
+            }
+        },
+        INSTALLED_APPS=(
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'media_albums',
+        ),
+        MEDIA_ALBUMS={
+            'renditions': {},
+        },
+    )
+    django.setup()
+
+
+def seed(num_albums, num_photos, stdout):
+    from media_albums.models import Album, Photo
+
+    Album.objects.bulk_create(
+        Album(
+            name='Album %06d' % i,
+            slug='album-%06d' % i,
+            # One album in four is private.
+            visibility=(
+                Album.VISIBILITY_PRIVATE if i % 4 == 0 else
+                Album.VISIBILITY_PUBLIC
+            ),
+            ordering=i % 10,
+        )
+        for i in range(num_albums)
+    )
+    album_ids = list(Album.objects.values_list('pk', flat=True))
+    batch = []
+
+    for i in range(num_photos):
+        batch.append(Photo(
+            album_id=album_ids[i % len(album_ids)],
+            name='Photo %07d' % i,
+            ordering=i % 5,
+            image='media_albums/photo-%07d.jpg' % i,
+            # The first photo in each album is its album photo.
+            album_photo=i < len(album_ids),
+            processing_state=Photo.PROCESSING_DONE,
+        ))
+
+        if len(batch) == SEED_BATCH_SIZE:
+            Photo.objects.bulk_create(batch)
+            batch = []
+            stdout.write('\rSeeded %d photos' % (i + 1))
+            stdout.flush()
+
+    Photo.objects.bulk_create(batch)
+    stdout.write('\rSeeded %d photos in %d albums.\n' % (
+        num_photos,
+        num_albums,
+    ))
+
+
+def get_queries():
+    """
+    Return a list of `(description, sql, params)` tuples for the queries that
+    are measured, on the first public album.
+    """
+    from media_albums.models import Album, Photo
+
+    album = Album.objects.filter(
+        visibility=Album.VISIBILITY_PUBLIC,
+    ).order_by(
+        'pk',
+    )[0]
+    items = album.lazy_items
+    page_offset = (items.count() // 2) // 10 * 10
+    item = items[page_offset]
+    next_item = Photo.objects.filter(
+        items.keyset_filter(item, 0, True),
+        album=album,
+    ).order_by(
+        'ordering',
+        'name',
+        'pk',
+    )[:1]
+    album_list = Album.objects.filter(
+        visibility=Album.VISIBILITY_PUBLIC,
+    ).order_by(
+        'ordering',
+        'name',
+    )[:10]
+
+    return [
+        ('Album list, first page',) + album_list.query.sql_with_params(),
+        ('Album page in the middle of the album',) + items.get_sql(
+            page_offset,
+            10,
+        ),
+        ('Next item in the album',) + next_item.query.sql_with_params(),
+    ]
+
+
+def explain(queries, stdout):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        for description, sql, params in queries:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+
+            timings = []
+
+            for i in range(TIMING_RUNS):
+                start = time.time()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                timings.append(time.time() - start)
+
+            timings.sort()
+            stdout.write('%s (median %.3f ms)\n' % (
+                description,
+                timings[len(timings) // 2] * 1000,
+            ))
+
+            for line in plan:
+                stdout.write('    %s\n' % line)
+
+        stdout.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--albums', type=int, default=1000)
+    parser.add_argument('--photos', type=int, default=1000000)
+    parser.add_argument(
+        '--db',
+        help='The path of the SQLite database (a temporary file by default).',
+    )
+    parser.add_argument('--keep', action='store_true', default=False)
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(
+        tempfile.mkdtemp(),
+        'media_albums_benchmark.sqlite3',
+    )
+    configure(db_path)
+
+    from django.core.management import call_command
+    from django.db import connection
+
+    stdout = sys.stdout
+
+    try:
+        call_command('migrate', 'media_albums', '0014', verbosity=0)
+        seed(args.albums, args.photos, stdout)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        queries = get_queries()
+
+        stdout.write('\nBefore migration 0015:\n\n')
+        explain(queries, stdout)
+
+        start = time.time()
+        call_command('migrate', 'media_albums', '0015', verbosity=0)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        stdout.write('After migration 0015 (applied in %.1f s):\n\n' % (
+            time.time() - start
+        ))
+        explain(queries, stdout)
+    finally:
+        if not args.keep:
+            connection.close()
+            os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
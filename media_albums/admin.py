@@ -1,10 +1,25 @@
-from django.contrib import admin
+from django.conf.urls import url
+from django.contrib import admin, messages
 from django.contrib.admin.sites import AlreadyRegistered, NotRegistered
+from django.contrib.admin.utils import unquote
+from django.contrib.auth import get_permission_codename
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.db import transaction
+from django.db.models import Count
+from django.forms.models import modelform_factory
+from django.http import Http404, HttpResponseRedirect
 from django.template.defaultfilters import linebreaksbr
-from django.utils.translation import ugettext_lazy as _
+from django.template.response import TemplateResponse
+from django.utils.html import format_html
+from django.utils.translation import ugettext_lazy as _, ungettext
 
+from .duplicates import find_near_duplicates
 from .forms import AudioFileForm, PhotoForm, VideoFileForm
 from .models import AudioFile, Album, Photo, UserPhoto, VideoFile
+from .moderation import approve_user_photos
+from .pagination import EstimatedCountPaginator
 from .settings import MEDIA_ALBUMS_SETTINGS
 
 
@@ -43,6 +58,11 @@ class AlbumAdmin(admin.ModelAdmin):
     list_display = ('name', 'num_items', 'ordering', 'created', 'visibility')
     prepopulated_fields = {'slug': ('name',)}
     save_on_top = True
+    change_form_template = 'media_albums/admin/album_change_form.html'
+    media_template = 'media_albums/admin/album_media.html'
+    # The fields of each item that can be changed from the media manager.
+    # The files are changed on each item's own change page.
+    media_item_fields = ('name', 'caption', 'ordering', 'album_photo')
 
     def __init__(self, *args, **kwargs):
         super(AlbumAdmin, self).__init__(*args, **kwargs)
@@ -60,21 +80,450 @@ class AlbumAdmin(admin.ModelAdmin):
 
         self.inlines = inlines
 
-
-class AudioFileAdmin(admin.ModelAdmin):
+    def get_queryset(self, request):
+        qs = super(AlbumAdmin, self).get_queryset(request)
+
+        if MEDIA_ALBUMS_SETTINGS['item_counts_live']:
+            qs = qs.annotate(
+                live_audio_file_count=Count('audiofile', distinct=True),
+                live_photo_count=Count('photo', distinct=True),
+                live_video_file_count=Count('videofile', distinct=True),
+            )
+
+        return qs
+
+    def get_inline_instances(self, request, obj=None):
+        # The items of an existing album are managed a page at a time by
+        # `media_view()`, so an album of any size has the same change page.
+        if obj is not None:
+            return []
+
+        return super(AlbumAdmin, self).get_inline_instances(request, obj)
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+
+        return [
+            url(
+                r'^(.+)/media/$',
+                self.admin_site.admin_view(self.media_view),
+                name='%s_%s_media' % info,
+            ),
+        ] + super(AlbumAdmin, self).get_urls()
+
+    def get_media_models(self, album):
+        return [model for item_type, model in album.lazy_items.models]
+
+    def render_change_form(self, request, context, add=False, change=False,
+                           form_url='', obj=None):
+        if obj is not None:
+            context['media_models'] = [
+                {
+                    'name': model._meta.model_name,
+                    'verbose_name_plural': model._meta.verbose_name_plural,
+                    'count': obj.item_count(model),
+                }
+                for model in self.get_media_models(obj)
+            ]
+            context['media_url'] = reverse(
+                'admin:%s_%s_media' % (
+                    self.model._meta.app_label,
+                    self.model._meta.model_name,
+                ),
+                args=[obj.pk],
+                current_app=self.admin_site.name,
+            )
+
+        return super(AlbumAdmin, self).render_change_form(
+            request,
+            context,
+            add=add,
+            change=change,
+            form_url=form_url,
+            obj=obj,
+        )
+
+    def has_item_permission(self, request, action, model):
+        opts = model._meta
+        return request.user.has_perm('%s.%s' % (
+            opts.app_label,
+            get_permission_codename(action, opts),
+        ))
+
+    def media_view(self, request, object_id):
+        """
+        Show one page of the photos, video files or audio files in an album,
+        each with a thumbnail and a small form that saves just that item,
+        along with actions that delete the selected items or move them to
+        another album.
+        """
+        album = self.get_object(request, unquote(object_id))
+
+        if album is None:
+            raise Http404
+
+        if not self.has_change_permission(request, album):
+            raise PermissionDenied
+
+        media_models = self.get_media_models(album)
+
+        if not media_models:
+            raise Http404
+
+        model = media_models[0]
+
+        if request.GET.get('type'):
+            model = next(
+                (m for m in media_models if
+                 m._meta.model_name == request.GET['type']),
+                None,
+            )
+
+            if model is None:
+                raise Http404
+
+        queryset = model.objects.filter(
+            album=album,
+        ).order_by(
+            'ordering',
+            'name',
+            'pk',
+        )
+        ItemForm = modelform_factory(model, fields=self.media_item_fields)
+        bound_form = None
+
+        if request.method == 'POST':
+            if 'action' in request.POST:
+                done = self.media_action(request, model, queryset)
+            else:
+                if not self.has_item_permission(request, 'change', model):
+                    raise PermissionDenied
+
+                try:
+                    item = queryset.get(pk=request.POST.get('item'))
+                except (model.DoesNotExist, ValueError):
+                    raise Http404
+
+                bound_form = ItemForm(
+                    request.POST,
+                    instance=item,
+                    prefix='item-%s' % item.pk,
+                )
+                done = bound_form.is_valid()
+
+                if done:
+                    bound_form.save()
+                    self.message_user(
+                        request,
+                        _('The %(name)s "%(obj)s" was changed successfully.')
+                        % {'name': model._meta.verbose_name, 'obj': item},
+                        messages.SUCCESS,
+                    )
+
+            if done:
+                return HttpResponseRedirect(request.get_full_path())
+
+        paginator = Paginator(
+            queryset,
+            MEDIA_ALBUMS_SETTINGS['admin_items_per_page'],
+        )
+
+        try:
+            page = paginator.page(request.GET.get('p', 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+
+        rendition_name = (
+            MEDIA_ALBUMS_SETTINGS['admin_thumbnail_rendition'] or 'thumbnail'
+        )
+        panels = []
+
+        for item in page.object_list:
+            if bound_form is not None and bound_form.instance.pk == item.pk:
+                form = bound_form
+            else:
+                form = ItemForm(instance=item, prefix='item-%s' % item.pk)
+
+            try:
+                change_url = reverse(
+                    'admin:%s_%s_change' % (
+                        model._meta.app_label,
+                        model._meta.model_name,
+                    ),
+                    args=[item.pk],
+                    current_app=self.admin_site.name,
+                )
+            except NoReverseMatch:
+                change_url = None
+
+            panels.append({
+                'item': item,
+                'form': form,
+                'thumbnail': item.get_rendition(rendition_name),
+                'change_url': change_url,
+            })
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Manage %(items)s in %(album)s') % {
+                'items': model._meta.verbose_name_plural,
+                'album': album,
+            },
+            opts=self.model._meta,
+            original=album,
+            item_opts=model._meta,
+            media_models=[
+                {
+                    'name': m._meta.model_name,
+                    'verbose_name_plural': m._meta.verbose_name_plural,
+                    'count': album.item_count(m),
+                    'selected': m is model,
+                }
+                for m in media_models
+            ],
+            paginator=paginator,
+            page_obj=page,
+            panels=panels,
+            has_item_change_permission=self.has_item_permission(
+                request,
+                'change',
+                model,
+            ),
+            has_item_delete_permission=self.has_item_permission(
+                request,
+                'delete',
+                model,
+            ),
+        )
+
+        return TemplateResponse(request, self.media_template, context)
+
+    def media_action(self, request, model, queryset):
+        """
+        Apply a bulk action from the media manager to the selected items,
+        and return whether it was applied.
+        """
+        action = request.POST['action']
+        items = list(queryset.filter(
+            pk__in=[
+                pk for pk in request.POST.getlist('_selected') if pk.isdigit()
+            ],
+        ))
+
+        if not items:
+            self.message_user(
+                request,
+                _('Items must be selected in order to perform actions on '
+                  'them. No items have been changed.'),
+                messages.WARNING,
+            )
+            return False
+
+        if action == 'delete':
+            if not self.has_item_permission(request, 'delete', model):
+                raise PermissionDenied
+
+            # The items are deleted one at a time (there is at most a page of
+            # them), so that their files and the album's counts are updated.
+            with transaction.atomic():
+                for item in items:
+                    item.delete()
+
+            message = ungettext(
+                'Deleted %(count)d item.',
+                'Deleted %(count)d items.',
+                len(items),
+            ) % {'count': len(items)}
+        elif action == 'move':
+            if not self.has_item_permission(request, 'change', model):
+                raise PermissionDenied
+
+            target = Album.objects.filter(
+                slug=request.POST.get('target_album', '').strip(),
+            ).first()
+
+            if target is None:
+                self.message_user(
+                    request,
+                    _('Enter the slug of the album to move the items to.'),
+                    messages.ERROR,
+                )
+                return False
+
+            with transaction.atomic():
+                for item in items:
+                    item.album = target
+                    item.save()
+
+            message = ungettext(
+                'Moved %(count)d item to %(album)s.',
+                'Moved %(count)d items to %(album)s.',
+                len(items),
+            ) % {'count': len(items), 'album': target}
+        else:
+            return False
+
+        self.message_user(request, message, messages.SUCCESS)
+
+        return True
+
+
+class AlbumFilter(admin.SimpleListFilter):
+    """
+    Filter items by album without listing every album: the albums whose names
+    contain the text entered in the filter's search box are listed, up to
+    `max_choices` of them.
+    """
+    title = _('album')
+    parameter_name = 'album'
+    search_parameter_name = 'album_q'
+    template = 'media_albums/admin/album_filter.html'
+    max_choices = 20
+
+    def __init__(self, request, params, model, model_admin):
+        # The search text is not a lookup, so the changelist must not see
+        # it.
+        self.search = params.pop(self.search_parameter_name, '').strip()
+        self.hidden_params = [
+            (name, value) for name, value in request.GET.items()
+            if name not in (self.search_parameter_name, 'p')
+        ]
+        super(AlbumFilter, self).__init__(
+            request,
+            params,
+            model,
+            model_admin,
+        )
+
+    def has_output(self):
+        return True
+
+    def get_album_id(self):
+        value = self.value()
+
+        if value and value.isdigit():
+            return int(value)
+
+        return None
+
+    def lookups(self, request, model_admin):
+        album_id = self.get_album_id()
+        albums = Album.objects.order_by('name').values_list('pk', 'name')
+        choices = []
+
+        if album_id is not None:
+            choices.extend(albums.filter(pk=album_id))
+            albums = albums.exclude(pk=album_id)
+
+        if self.search:
+            choices.extend(
+                albums.filter(
+                    name__icontains=self.search,
+                )[:self.max_choices]
+            )
+
+        return [(str(pk), name) for pk, name in choices]
+
+    def queryset(self, request, queryset):
+        album_id = self.get_album_id()
+
+        if album_id is not None:
+            return queryset.filter(album_id=album_id)
+
+        return queryset
+
+
+class AlbumItemAdmin(admin.ModelAdmin):
+    """
+    The admin for photos, video files and audio files, which stays fast on
+    tables with millions of rows.
+    """
     list_display = ('name', 'album', 'ordering', 'created')
-    list_filter = ('album',)
-    ordering = ('album__ordering', 'album__name', 'ordering', 'name')
+    list_filter = (AlbumFilter,)
+    list_select_related = ('album',)
+    # This order can be read from the `(album, ordering, name, id)` index.
+    ordering = ('album_id', 'ordering', 'name', 'id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_list_display(self, request):
+        list_display = tuple(self.list_display)
+
+        if MEDIA_ALBUMS_SETTINGS['admin_thumbnail_rendition']:
+            list_display = ('thumbnail',) + list_display
+
+        return list_display
+
+    def thumbnail(self, obj):
+        rendition = obj.get_rendition(
+            MEDIA_ALBUMS_SETTINGS['admin_thumbnail_rendition']
+        )
+
+        if rendition is None:
+            return ''
+
+        return format_html(
+            '<img src="{}" width="{}" height="{}" alt="">',
+            rendition['url'],
+            rendition['width'],
+            rendition['height'],
+        )
+    thumbnail.short_description = _('thumbnail')
+
+
+class AudioFileAdmin(AlbumItemAdmin):
     form = AudioFileForm
 
 
-class PhotoAdmin(admin.ModelAdmin):
-    list_display = ('name', 'album', 'ordering', 'created')
-    list_filter = ('album',)
-    ordering = ('album__ordering', 'album__name', 'ordering', 'name')
+class PhotoAdmin(AlbumItemAdmin):
     form = PhotoForm
 
 
+def near_duplicates_label(pks):
+    # Clusters are named after their first photo, so that a cluster keeps its
+    # name while photos are added to the queue.
+    return ungettext(
+        'Group %(pk)d (%(count)d photo)',
+        'Group %(pk)d (%(count)d photos)',
+        len(pks),
+    ) % {'pk': pks[0], 'count': len(pks)}
+
+
+class NearDuplicateFilter(admin.SimpleListFilter):
+    """
+    Show only the user photos in one cluster of near-duplicates (or in any of
+    them), so that they can be approved or deleted together.
+    """
+    title = _('near-duplicates')
+    parameter_name = 'near_duplicates'
+
+    def lookups(self, request, model_admin):
+        self.clusters = model_admin.get_near_duplicates(request)
+        lookups = [('all', _('All near-duplicates'))]
+
+        for pks in self.clusters:
+            lookups.append((str(pks[0]), near_duplicates_label(pks)))
+
+        return lookups
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+
+        if self.value() == 'all':
+            pks = [pk for cluster in self.clusters for pk in cluster]
+        else:
+            pks = next(
+                (cluster for cluster in self.clusters if
+                 str(cluster[0]) == self.value()),
+                [],
+            )
+
+        return queryset.filter(pk__in=pks)
+
+
 class UserPhotoAdmin(admin.ModelAdmin):
     actions = ['approve_photo']
     list_display = (
@@ -86,15 +535,55 @@ class UserPhotoAdmin(admin.ModelAdmin):
         'ordering',
         'created',
     )
+    list_filter = (NearDuplicateFilter,)
     readonly_fields = (
         'album',
         'image',
         'added_by',
     )
 
+    def get_near_duplicates(self, request):
+        """
+        Return the clusters of near-duplicates among the photos waiting for
+        approval, found once per request.
+        """
+        if not hasattr(request, '_media_albums_near_duplicates'):
+            request._media_albums_near_duplicates = find_near_duplicates(
+                UserPhoto.objects.all()
+            )
+
+        return request._media_albums_near_duplicates
+
+    def get_list_display(self, request):
+        groups = {
+            pk: pks
+            for pks in self.get_near_duplicates(request)
+            for pk in pks
+        }
+
+        def near_duplicates(obj):
+            pks = groups.get(obj.pk)
+
+            if pks is None:
+                return ''
+
+            return format_html(
+                '<a href="?{}={}">{}</a>',
+                NearDuplicateFilter.parameter_name,
+                pks[0],
+                near_duplicates_label(pks),
+            )
+        near_duplicates.short_description = _('near-duplicates')
+
+        return tuple(self.list_display) + (near_duplicates,)
+
     def approve_photo(modeladmin, request, queryset):
-        for obj in queryset:
-            obj.approve()
+        count = approve_user_photos(queryset)
+        modeladmin.message_user(request, ungettext(
+            'Approved %(count)d photo.',
+            'Approved %(count)d photos.',
+            count,
+        ) % {'count': count})
     approve_photo.short_description = _('Approve Photos')
 
     def has_add_permission(self, request):
@@ -111,10 +600,7 @@ class UserPhotoAdmin(admin.ModelAdmin):
     image_link.short_description = _('view photo')
 
 
-class VideoFileAdmin(admin.ModelAdmin):
-    list_display = ('name', 'album', 'ordering', 'created')
-    list_filter = ('album',)
-    ordering = ('album__ordering', 'album__name', 'ordering', 'name')
+class VideoFileAdmin(AlbumItemAdmin):
     form = VideoFileForm
 
 
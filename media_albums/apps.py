@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MediaAlbumsConfig(AppConfig):
     name = 'media_albums'
     verbose_name = 'Media Albums'
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
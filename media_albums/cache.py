@@ -0,0 +1,40 @@
+import time
+
+from django.core.cache import cache
+
+
+def album_version_key(album_id):
+    return 'media_albums:album:%s:version' % album_id
+
+
+def initial_album_version():
+    # Versions start from the current time rather than from 1, so that a
+    # version key that was evicted from the cache never comes back with a
+    # value that was already used for data that is now stale.
+    return int(time.time() * 1000)
+
+
+def get_album_version(album_id):
+    """
+    Return the current version of an album. The version changes whenever the
+    album or any of its items change, so it can be used in cache keys.
+    """
+    key = album_version_key(album_id)
+    version = cache.get(key)
+
+    if version is None:
+        cache.add(key, initial_album_version(), None)
+        version = cache.get(key, initial_album_version())
+
+    return version
+
+
+def bump_album_version(album_id):
+    key = album_version_key(album_id)
+
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = initial_album_version()
+        cache.set(key, version, None)
+        return version
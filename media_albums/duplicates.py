@@ -0,0 +1,130 @@
+from .settings import MEDIA_ALBUMS_SETTINGS
+
+HASH_MASK = (1 << 64) - 1
+
+
+def hamming_distance(a, b):
+    """
+    Return the number of bits that differ between two perceptual hashes.
+    """
+    return bin((a ^ b) & HASH_MASK).count('1')
+
+
+class BKTree(object):
+    """
+    A Burkhard-Keller tree of perceptual hashes, which finds the hashes within
+    a given Hamming distance of another hash without comparing it to every
+    hash in the tree.
+
+    Each node holds a hash, the keys (for example, photo IDs) that have that
+    hash, and its children keyed by their distance from the node's hash.
+    Since the Hamming distance is a metric, only the children whose distance
+    is within `max_distance` of the distance to the searched hash can contain
+    matches.
+    """
+
+    def __init__(self, items=()):
+        self.root = None
+
+        for value, key in items:
+            self.add(value, key)
+
+    def add(self, value, key):
+        if self.root is None:
+            self.root = (value, [key], {})
+            return
+
+        node = self.root
+
+        while True:
+            node_value, keys, children = node
+            distance = hamming_distance(value, node_value)
+
+            if distance == 0:
+                keys.append(key)
+                return
+
+            if distance not in children:
+                children[distance] = (value, [key], {})
+                return
+
+            node = children[distance]
+
+    def search(self, value, max_distance):
+        """
+        Return a list of `(distance, key)` pairs for the keys whose hashes are
+        within `max_distance` bits of the given hash.
+        """
+        results = []
+        nodes = [self.root] if self.root is not None else []
+
+        while nodes:
+            node_value, keys, children = nodes.pop()
+            distance = hamming_distance(value, node_value)
+
+            if distance <= max_distance:
+                results.extend((distance, key) for key in keys)
+
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    nodes.append(child)
+
+        return results
+
+
+def group_near_duplicates(items, max_distance):
+    """
+    Group the given `(key, perceptual hash)` pairs into clusters of
+    near-duplicates: keys whose hashes are within `max_distance` bits of each
+    other, directly or through other keys in the cluster. Return a list of
+    the clusters that have more than one key, each a sorted list of keys,
+    sorted by their first key.
+    """
+    items = [(key, value) for key, value in items if value is not None]
+    tree = BKTree((value, key) for key, value in items)
+    parents = {key: key for key, value in items}
+
+    def find(key):
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+
+        return key
+
+    for key, value in items:
+        for distance, other_key in tree.search(value, max_distance):
+            root, other_root = find(key), find(other_key)
+
+            if root != other_root:
+                parents[max(root, other_root)] = min(root, other_root)
+
+    clusters = {}
+
+    for key in parents:
+        clusters.setdefault(find(key), []).append(key)
+
+    return sorted(
+        sorted(keys) for keys in clusters.values() if len(keys) > 1
+    )
+
+
+def find_near_duplicates(photos, max_distance=None):
+    """
+    Group the photos in the given queryset (for example, the photos in an
+    album or the user photos waiting for approval) into clusters of
+    near-duplicates, as lists of photo IDs. By default, photos are
+    near-duplicates if their perceptual hashes differ by no more than the
+    `near_duplicate_distance` setting.
+    """
+    if max_distance is None:
+        max_distance = MEDIA_ALBUMS_SETTINGS['near_duplicate_distance']
+
+    return group_near_duplicates(
+        photos.filter(
+            perceptual_hash__isnull=False,
+        ).values_list(
+            'pk',
+            'perceptual_hash',
+        ),
+        max_distance,
+    )
@@ -1,9 +1,101 @@
+import re
+
 from django import forms
+from django.template.defaultfilters import filesizeformat
 from django.utils.translation import ugettext_lazy as _
+from PIL import Image
 
-from .models import AudioFile, Photo, UserPhoto, VideoFile
+from .images import probe_image
+from .models import AudioFile, Photo, UploadSession, UserPhoto, VideoFile
 from .settings import MEDIA_ALBUMS_SETTINGS
 
+DecompressionBombError = getattr(Image, 'DecompressionBombError', None)
+
+
+class ProbedImageField(forms.ImageField):
+    """
+    An image field that only reads the header of the uploaded image (instead
+    of verifying the whole file, like Django's `ImageField`), and rejects
+    images that are larger than the `max_image_bytes` and `max_image_pixels`
+    settings before they are decoded.
+
+    The dimensions, format and metadata that are read are stored in the
+    `probe` attribute of the cleaned file, and are later used by
+    `Photo.save()` so that the file does not have to be read again.
+    """
+    default_error_messages = {
+        'too_many_bytes': _(
+            'The file is too large. It must be %(max_bytes)s or smaller.'
+        ),
+        'too_many_pixels': _(
+            'The image is too large. It must have no more than %(max_pixels)s '
+            'pixels.'
+        ),
+    }
+
+    def to_python(self, data):
+        f = forms.FileField.to_python(self, data)
+
+        if f is None:
+            return None
+
+        max_bytes = MEDIA_ALBUMS_SETTINGS['max_image_bytes']
+        max_pixels = MEDIA_ALBUMS_SETTINGS['max_image_pixels']
+
+        if max_bytes and f.size > max_bytes:
+            raise forms.ValidationError(
+                self.error_messages['too_many_bytes'],
+                code='too_many_bytes',
+                params={'max_bytes': filesizeformat(max_bytes)},
+            )
+
+        too_many_pixels = forms.ValidationError(
+            self.error_messages['too_many_pixels'],
+            code='too_many_pixels',
+            params={'max_pixels': max_pixels},
+        )
+
+        try:
+            probe = probe_image(f)
+        except Exception as e:
+            if DecompressionBombError is not None and isinstance(
+                e,
+                DecompressionBombError,
+            ):
+                raise too_many_pixels
+
+            probe = None
+
+        if probe is None:
+            raise forms.ValidationError(
+                self.error_messages['invalid_image'],
+                code='invalid_image',
+            )
+
+        if max_pixels and probe['width'] * probe['height'] > max_pixels:
+            raise too_many_pixels
+
+        f.probe = probe
+        f.content_type = probe['mime_type']
+
+        if hasattr(f, 'seek') and callable(f.seek):
+            f.seek(0)
+
+        return f
+
+
+class ProbedImageFormMixin(object):
+    """
+    Pass the header of a newly uploaded image, as read by `ProbedImageField`,
+    on to the photo.
+    """
+
+    def save(self, commit=True):
+        image = self.cleaned_data.get('image')
+        self.instance.image_probe = getattr(image, 'probe', None)
+
+        return super(ProbedImageFormMixin, self).save(commit)
+
 
 class AudioFileForm(forms.ModelForm):
     class Meta:
@@ -27,7 +119,9 @@ class AudioFileForm(forms.ModelForm):
             self.fields['audio_file_2'].required = True
 
 
-class PhotoForm(forms.ModelForm):
+class PhotoForm(ProbedImageFormMixin, forms.ModelForm):
+    image = ProbedImageField(label=_('Image'))
+
     class Meta:
         model = Photo
         fields = [
@@ -41,7 +135,9 @@ class PhotoForm(forms.ModelForm):
         ]
 
 
-class UserPhotoForm(forms.ModelForm):
+class UserPhotoForm(ProbedImageFormMixin, forms.ModelForm):
+    image = ProbedImageField(label=_('Image'))
+
     class Meta:
         model = UserPhoto
         fields = [
@@ -56,6 +152,112 @@ class UserPhotoForm(forms.ModelForm):
         self.fields['name'].help_text = _('The name of the photo.')
 
 
+class MultipleFileInput(forms.ClearableFileInput):
+    def __init__(self, attrs=None):
+        attrs = dict(attrs or {}, multiple='multiple')
+        super(MultipleFileInput, self).__init__(attrs)
+
+    def value_from_datadict(self, data, files, name):
+        return files.getlist(name)
+
+
+class UserPhotoMultipleUploadForm(forms.Form):
+    images = forms.Field(
+        label=_('Images'),
+        widget=MultipleFileInput,
+    )
+    caption = forms.CharField(
+        label=_('Caption'),
+        max_length=255,
+        required=False,
+        help_text=_('A brief caption describing the photos.'),
+    )
+    description = forms.CharField(
+        label=_('Description'),
+        required=False,
+        widget=forms.Textarea,
+        help_text=_('A more in-depth description of the photos.'),
+    )
+
+    def clean_images(self):
+        images = self.cleaned_data['images']
+        max_files = MEDIA_ALBUMS_SETTINGS['user_uploaded_photos_max_files']
+
+        if not images:
+            raise forms.ValidationError(_('Choose at least one image.'))
+
+        if len(images) > max_files:
+            raise forms.ValidationError(
+                _('You can upload up to %(max_files)d images at a time.'),
+                params={'max_files': max_files},
+            )
+
+        image_field = ProbedImageField()
+        errors = []
+
+        for image in images:
+            try:
+                image_field.clean(image)
+            except forms.ValidationError as e:
+                errors.extend(
+                    '%s: %s' % (image.name, message) for message in e.messages
+                )
+
+        if errors:
+            raise forms.ValidationError(errors)
+
+        return images
+
+
+class UploadSessionForm(forms.ModelForm):
+    class Meta:
+        model = UploadSession
+        fields = [
+            'name',
+            'caption',
+            'description',
+            'file_name',
+            'size',
+            'sha256',
+        ]
+
+    def clean_size(self):
+        size = self.cleaned_data['size']
+
+        if size <= 0:
+            raise forms.ValidationError(_('The file must not be empty.'))
+
+        # Refuse a file that is too large before any of it is written to
+        # the staging directory.
+        limits = [
+            limit for limit in [
+                MEDIA_ALBUMS_SETTINGS['max_image_bytes'],
+                MEDIA_ALBUMS_SETTINGS['chunked_upload_max_bytes'],
+            ] if limit
+        ]
+        max_bytes = min(limits) if limits else None
+
+        if max_bytes and size > max_bytes:
+            raise forms.ValidationError(
+                _('The file is too large. It must be %(max_bytes)s or '
+                  'smaller.'),
+                code='too_many_bytes',
+                params={'max_bytes': filesizeformat(max_bytes)},
+            )
+
+        return size
+
+    def clean_sha256(self):
+        sha256 = self.cleaned_data['sha256'].lower()
+
+        if not re.match(r'^[0-9a-f]{64}$', sha256):
+            raise forms.ValidationError(
+                _('Enter the SHA-256 checksum of the file in hexadecimal.')
+            )
+
+        return sha256
+
+
 class VideoFileForm(forms.ModelForm):
     class Meta:
         model = VideoFile
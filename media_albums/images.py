@@ -0,0 +1,513 @@
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.utils import six, timezone
+from PIL import Image
+
+from .settings import MEDIA_ALBUMS_SETTINGS
+
+try:
+    from shutil import which
+except ImportError:  # Python 2
+    from distutils.spawn import find_executable as which
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without the `futures` backport
+    ThreadPoolExecutor = None
+
+try:
+    from sorl.thumbnail import delete as delete_thumbnails, get_thumbnail
+    from sorl.thumbnail.images import ImageFile
+except ImportError:
+    delete_thumbnails = get_thumbnail = ImageFile = None
+
+# The perceptual hash compares the brightness of neighbouring pixels in an
+# image scaled down to this many rows (of one more column each), giving a hash
+# of `DHASH_SIZE ** 2` bits.
+DHASH_SIZE = 8
+
+EXIF_MAKE = 0x010f
+EXIF_MODEL = 0x0110
+EXIF_ORIENTATION = 0x0112
+EXIF_DATE_TIME_ORIGINAL = 0x9003
+EXIF_GPS_INFO = 0x8825
+
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+# The jpegtran arguments that undo each EXIF orientation.
+JPEGTRAN_TRANSFORMS = {
+    2: ['-flip', 'horizontal'],
+    3: ['-rotate', '180'],
+    4: ['-flip', 'vertical'],
+    5: ['-transpose'],
+    6: ['-rotate', '90'],
+    7: ['-transverse'],
+    8: ['-rotate', '270'],
+}
+
+
+def get_exif_data(img):
+    try:
+        return img._getexif()
+    except AttributeError:
+        return None
+
+
+def get_orientation(img):
+    """
+    Return the EXIF orientation of an image that has been opened (but not
+    necessarily loaded) by PIL, or 1 if it does not have one.
+    """
+    exif_data = get_exif_data(img)
+
+    if exif_data:
+        orientation = exif_data.get(EXIF_ORIENTATION)
+
+        if orientation in JPEGTRAN_TRANSFORMS:
+            return orientation
+
+    return 1
+
+
+def find_exif_orientation(data):
+    """
+    Return the offset of the value of the EXIF orientation tag in the given
+    JPEG data, along with the byte order of the EXIF data, or `(None, None)`
+    if the data does not have an orientation tag.
+    """
+    if data[:2] != b'\xff\xd8':
+        return None, None
+
+    offset = 2
+
+    while offset + 4 <= len(data) and data[offset:offset + 1] == b'\xff':
+        marker = data[offset + 1:offset + 2]
+        length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+
+        # Start of scan: the image data follows, so there is no more EXIF.
+        if marker == b'\xda':
+            break
+
+        segment = offset + 4
+
+        if marker == b'\xe1' and data[segment:segment + 6] == b'Exif\x00\x00':
+            tiff = segment + 6
+            byte_order = {b'II': '<', b'MM': '>'}.get(data[tiff:tiff + 2])
+
+            if byte_order is None:
+                return None, None
+
+            ifd = tiff + struct.unpack(
+                byte_order + 'I',
+                data[tiff + 4:tiff + 8],
+            )[0]
+            entries = struct.unpack(byte_order + 'H', data[ifd:ifd + 2])[0]
+
+            for i in range(entries):
+                entry = ifd + 2 + i * 12
+                tag, tag_type = struct.unpack(
+                    byte_order + 'HH',
+                    data[entry:entry + 4],
+                )
+
+                # The orientation is a single SHORT (type 3), which is stored
+                # in the first two bytes of the value field.
+                if tag == EXIF_ORIENTATION and tag_type == 3:
+                    return entry + 8, byte_order
+
+            return None, None
+
+        offset += 2 + length
+
+    return None, None
+
+
+def reset_exif_orientation(path):
+    """
+    Set the EXIF orientation of the JPEG file at the given path to 1 without
+    touching anything else in the file.
+    """
+    with open(path, 'r+b') as f:
+        # The EXIF data is always near the start of the file.
+        data = f.read(128 * 1024)
+        offset, byte_order = find_exif_orientation(data)
+
+        if offset is not None:
+            f.seek(offset)
+            f.write(struct.pack(byte_order + 'H', 1))
+
+
+def transform_jpeg_losslessly(path, orientation, output_path=None):
+    """
+    Undo the given EXIF orientation of the JPEG file at the given path by
+    transforming its DCT blocks with jpegtran, which does not decode the image
+    or reduce its quality. All metadata is kept, and the EXIF orientation is
+    set to 1. The transformed file replaces the original, unless an
+    `output_path` is given, in which case it is written there instead.
+
+    Return `True` if the file was transformed.
+    """
+    jpegtran = which(MEDIA_ALBUMS_SETTINGS['jpegtran_path'])
+
+    if jpegtran is None:
+        return False
+
+    if output_path is None:
+        output_path = path
+
+    fd, temp_path = tempfile.mkstemp(
+        suffix='.jpg',
+        dir=os.path.dirname(output_path),
+    )
+    os.close(fd)
+
+    try:
+        # `-perfect` makes jpegtran fail instead of dropping the partial
+        # blocks at the edges of images whose size is not a multiple of the
+        # block size.
+        returncode = subprocess.call(
+            [jpegtran, '-copy', 'all', '-perfect'] +
+            JPEGTRAN_TRANSFORMS[orientation] +
+            ['-outfile', temp_path, path],
+        )
+
+        if returncode != 0:
+            return False
+
+        reset_exif_orientation(temp_path)
+        shutil.copystat(path, temp_path)
+        os.rename(temp_path, output_path)
+        temp_path = None
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+
+    return True
+
+
+def open_image(image_file):
+    """
+    Open the given image file with PIL without decoding it, or return `None`
+    if it cannot be opened.
+    """
+    try:
+        return Image.open(image_file)
+    except IOError:
+        return None
+
+
+def rational_to_float(value):
+    # Older versions of Pillow return rationals as (numerator, denominator)
+    # tuples, newer versions return `IFDRational` objects.
+    if isinstance(value, tuple):
+        numerator, denominator = value
+        return float(numerator) / denominator if denominator else None
+
+    return float(value)
+
+
+def gps_coordinate(gps_info, value_tag, ref_tag, negative_ref):
+    try:
+        degrees, minutes, seconds = [
+            rational_to_float(part) for part in gps_info[value_tag]
+        ]
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+
+    if None in (degrees, minutes, seconds):
+        return None
+
+    coordinate = degrees + minutes / 60 + seconds / 3600
+
+    if gps_info.get(ref_tag) == negative_ref:
+        coordinate = -coordinate
+
+    return round(coordinate, 6)
+
+
+def exif_text(exif_data, tag, max_length):
+    value = exif_data.get(tag)
+
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+
+    if not isinstance(value, six.string_types):
+        return ''
+
+    return value.strip(' \x00')[:max_length]
+
+
+def exif_datetime(exif_data, tag):
+    try:
+        value = datetime.strptime(exif_data[tag], '%Y:%m:%d %H:%M:%S')
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+
+    return value
+
+
+def get_metadata(img, image_file):
+    """
+    Return the metadata of an image that has been opened (but not
+    necessarily loaded) by PIL, as a dictionary of `Photo` field values.
+
+    The width and height are the ones the image has once its EXIF orientation
+    has been applied.
+    """
+    width, height = img.size
+    exif_data = get_exif_data(img) or {}
+
+    if get_orientation(img) in (5, 6, 7, 8):
+        width, height = height, width
+
+    gps_info = exif_data.get(EXIF_GPS_INFO)
+
+    if not isinstance(gps_info, dict):
+        gps_info = {}
+
+    try:
+        file_size = image_file.size
+    except (IOError, OSError):
+        file_size = None
+
+    return {
+        'width': width,
+        'height': height,
+        'file_size': file_size,
+        'mime_type': Image.MIME.get(img.format, ''),
+        'taken_at': exif_datetime(exif_data, EXIF_DATE_TIME_ORIGINAL),
+        'camera_make': exif_text(exif_data, EXIF_MAKE, 100),
+        'camera_model': exif_text(exif_data, EXIF_MODEL, 100),
+        'gps_latitude': gps_coordinate(
+            gps_info, GPS_LATITUDE, GPS_LATITUDE_REF, 'S'
+        ),
+        'gps_longitude': gps_coordinate(
+            gps_info, GPS_LONGITUDE, GPS_LONGITUDE_REF, 'W'
+        ),
+    }
+
+
+def process_image(image_file, output_path=None):
+    """
+    Correct the orientation of the given image file (or, if an `output_path`
+    is given, write a corrected copy of it there; see `correct_orientation()`)
+    and read its metadata and perceptual hash. Return a dictionary of `Photo`
+    field values.
+    """
+    img = open_image(image_file)
+
+    if img is None:
+        return {'orientation': 1}
+
+    values = get_metadata(img, image_file)
+    values['orientation'] = correct_orientation(image_file, img, output_path)
+
+    # The hash is read from the corrected file, so that it is the same as the
+    # hash that `media_albums_backfill_photo_metadata` reads from it later.
+    if output_path is not None and os.path.exists(output_path):
+        with open(output_path, 'rb') as corrected_file:
+            values['perceptual_hash'] = perceptual_hash(corrected_file)
+    else:
+        image_file.open('rb')
+
+        try:
+            values['perceptual_hash'] = perceptual_hash(image_file)
+        finally:
+            image_file.close()
+
+    return values
+
+
+def probe_image(image_file):
+    """
+    Read the format, dimensions, EXIF orientation and other metadata of an
+    image file from its header, without decoding the image. Return a
+    dictionary of `Photo` field values, or `None` if the file is not an
+    image.
+
+    PIL raises `DecompressionBombError` (in recent versions) for images that
+    are far larger than its `MAX_IMAGE_PIXELS` limit; callers should check
+    the dimensions against their own limit as well.
+    """
+    img = open_image(image_file)
+
+    if img is None:
+        return None
+
+    values = get_metadata(img, image_file)
+    values['orientation'] = get_orientation(img)
+
+    return values
+
+
+def perceptual_hash(image_file):
+    """
+    Return the difference hash (dHash) of an image file, a 64-bit integer
+    that is the same or differs in only a few bits for images that look
+    alike (resized, recompressed or slightly edited copies of each other), or
+    `None` if the file is not an image.
+
+    JPEG images are decoded at a reduced scale, which is much faster than
+    decoding them fully. The hash is returned as a signed integer, so that it
+    fits in a `BigIntegerField`.
+    """
+    image_file.seek(0)
+    img = open_image(image_file)
+
+    if img is None:
+        return None
+
+    try:
+        img.draft('L', (DHASH_SIZE * 4, DHASH_SIZE * 4))
+        pixels = list(
+            img.convert('L').resize(
+                (DHASH_SIZE + 1, DHASH_SIZE),
+                Image.BILINEAR,
+            ).getdata()
+        )
+    finally:
+        image_file.seek(0)
+
+    value = 0
+
+    for row in range(DHASH_SIZE):
+        for column in range(DHASH_SIZE):
+            offset = row * (DHASH_SIZE + 1) + column
+            value = value << 1 | (pixels[offset] > pixels[offset + 1])
+
+    if value >= 1 << 63:
+        value -= 1 << 64
+
+    return value
+
+
+def correct_orientation(image_file, img=None, output_path=None):
+    """
+    Correct the orientation of the given image file according to its EXIF
+    orientation tag, without decoding the image.
+
+    JPEG files that are stored on the local filesystem are transformed
+    losslessly with jpegtran, when it is available. Otherwise the file is
+    left alone: sorl-thumbnail applies the EXIF orientation when it generates
+    thumbnails, and web browsers apply it when they show the original.
+
+    If an `output_path` is given, the image file is always left alone, and
+    the transformed file is written to that path instead (if it could be
+    transformed). This is used for files that may be shared by several
+    photos.
+
+    Return the orientation that still needs to be applied to the file (or to
+    the file at `output_path`, if it was written).
+    """
+    if img is None:
+        img = open_image(image_file)
+
+    if img is None:
+        return 1
+
+    orientation = get_orientation(img)
+
+    if orientation == 1 or img.format != 'JPEG':
+        return orientation
+
+    try:
+        path = image_file.path
+    except NotImplementedError:
+        return orientation
+
+    image_file.close()
+
+    if transform_jpeg_losslessly(path, orientation, output_path):
+        return 1
+
+    return orientation
+
+
+def make_rendition(image_name, spec):
+    options = dict(spec)
+    geometry = options.pop('geometry')
+    thumbnail = get_thumbnail(image_name, geometry, **options)
+
+    if not thumbnail.size:
+        # sorl-thumbnail could not read the image.
+        return None
+
+    return {
+        'url': thumbnail.url,
+        'width': thumbnail.width,
+        'height': thumbnail.height,
+    }
+
+
+def make_renditions(image_file):
+    """
+    Generate each rendition in the `renditions` setting of the given image
+    file with sorl-thumbnail and return a dictionary mapping the name of each
+    rendition to its URL and size.
+
+    The renditions are generated in parallel, by `rendition_workers` threads,
+    only when a `processing_backend` is configured. Without one, this runs
+    during the request that saved the item, so the renditions are generated
+    one at a time rather than opening a database connection per thread.
+
+    If sorl-thumbnail is not installed, no renditions are generated.
+    """
+    from .processing import get_backend
+
+    specs = MEDIA_ALBUMS_SETTINGS['renditions']
+
+    if get_thumbnail is None or not specs or not image_file:
+        return {}
+
+    names = sorted(specs)
+    workers = min(MEDIA_ALBUMS_SETTINGS['rendition_workers'], len(names))
+
+    if get_backend() is None:
+        # The renditions are generated during a request, so don't open more
+        # database connections for it.
+        workers = 1
+
+    if ThreadPoolExecutor is None or workers <= 1:
+        results = [make_rendition(image_file.name, specs[name])
+                   for name in names]
+    else:
+        def make(name):
+            try:
+                return make_rendition(image_file.name, specs[name])
+            finally:
+                # sorl-thumbnail keeps its key-value store in the database,
+                # so close the connection this worker thread opened.
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(make, names))
+
+    return {
+        name: result
+        for name, result in zip(names, results)
+        if result is not None
+    }
+
+
+def delete_image_file(storage, name):
+    """
+    Delete a file from storage, along with any thumbnails of it that
+    sorl-thumbnail has generated.
+    """
+    if delete_thumbnails is None:
+        storage.delete(name)
+    else:
+        delete_thumbnails(ImageFile(name, storage))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import UserPhoto
+from ...moderation import approve_user_photos
+
+
+class Command(BaseCommand):
+    help = (
+        'Approve user uploaded photos, moving them to the user photos album.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'photo_ids',
+            nargs='*',
+            type=int,
+            help='The IDs of the user photos to approve.',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='all',
+            default=False,
+            help='Approve every user photo that is waiting for approval.',
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            user_photos = UserPhoto.objects.all()
+        elif options['photo_ids']:
+            user_photos = UserPhoto.objects.filter(pk__in=options['photo_ids'])
+        else:
+            raise CommandError(
+                'Pass the IDs of the photos to approve, or --all.'
+            )
+
+        approved = approve_user_photos(user_photos)
+
+        self.stdout.write('Approved %d photos.' % approved)
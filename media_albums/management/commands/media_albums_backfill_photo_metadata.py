@@ -0,0 +1,125 @@
+from multiprocessing import Pool, cpu_count
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Q
+
+from ...images import get_metadata, open_image, perceptual_hash
+from ...models import Photo
+
+
+def read_photo_metadata(photo):
+    """
+    Return the primary key of the given `(pk, image name)` pair along with the
+    metadata of the image, or `None` if the image could not be read. This runs
+    in a worker process.
+    """
+    pk, name = photo
+    storage = Photo._meta.get_field('image').storage
+
+    try:
+        with storage.open(name) as image_file:
+            img = open_image(image_file)
+
+            if img is None:
+                return pk, None
+
+            metadata = get_metadata(img, image_file)
+            metadata['perceptual_hash'] = perceptual_hash(image_file)
+
+            return pk, metadata
+    except Exception:
+        return pk, None
+
+
+class Command(BaseCommand):
+    help = (
+        'Store the dimensions, file size, MIME type, EXIF metadata and '
+        'perceptual hash of existing photos. The photos are read in '
+        'parallel by a pool of worker processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            dest='chunk_size',
+            help='The number of photos to load and update at a time.',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=cpu_count(),
+            dest='processes',
+            help='The number of worker processes used to read the photos.',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='all',
+            default=False,
+            help=(
+                'Also read the photos that already have their dimensions '
+                'and perceptual hash stored.'
+            ),
+        )
+
+    def get_chunks(self, photos, chunk_size):
+        last_pk = 0
+
+        while True:
+            chunk = list(
+                photos.filter(
+                    pk__gt=last_pk,
+                ).order_by(
+                    'pk',
+                ).values_list(
+                    'pk',
+                    'image',
+                )[:chunk_size]
+            )
+
+            if not chunk:
+                return
+
+            yield chunk
+            last_pk = chunk[-1][0]
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.all()
+
+        if not options['all']:
+            photos = photos.filter(
+                Q(width__isnull=True) | Q(perceptual_hash__isnull=True)
+            )
+
+        # The worker processes must not inherit the database connections.
+        for connection in connections.all():
+            connection.close()
+
+        pool = Pool(processes=max(options['processes'], 1))
+        updated = 0
+        failed = 0
+
+        try:
+            for chunk in self.get_chunks(photos, options['chunk_size']):
+                results = pool.map(read_photo_metadata, chunk)
+
+                with transaction.atomic():
+                    for pk, metadata in results:
+                        if metadata is None:
+                            failed += 1
+                        else:
+                            Photo.objects.filter(pk=pk).update(**metadata)
+                            updated += 1
+        finally:
+            pool.close()
+            pool.join()
+
+        self.stdout.write(
+            'Stored the metadata of %d photos (%d could not be read).' % (
+                updated,
+                failed,
+            )
+        )
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...models import UploadSession
+from ...uploads import remove_staging_file
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the chunked uploads that have not received any data for a '
+        'while, along with their staging files.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            dest='hours',
+            help=(
+                'Delete the uploads that have not received any data for this '
+                'many hours.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted = 0
+
+        for upload in UploadSession.objects.filter(updated__lt=cutoff):
+            remove_staging_file(upload.staging_path)
+            upload.delete()
+            deleted += 1
+
+        self.stdout.write('Deleted %d upload sessions.' % deleted)
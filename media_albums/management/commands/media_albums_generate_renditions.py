@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from ...models import AudioFile, Photo, VideoFile
+from ...processing import generate_renditions
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate the renditions in the "renditions" setting for the photos, '
+        'video file posters and audio file cover art that do not have them '
+        'yet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='all',
+            default=False,
+            help=(
+                'Regenerate the renditions of every item (for example, after '
+                'changing the "renditions" setting).'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        generated = 0
+        failed = 0
+
+        for model in (AudioFile, Photo, VideoFile):
+            items = model.objects.exclude(**{model.cover_field_name: ''})
+
+            if not options['all']:
+                items = items.filter(renditions='')
+
+            for pk in items.values_list('pk', flat=True).iterator():
+                if generate_renditions(
+                    model._meta.app_label,
+                    model._meta.model_name,
+                    pk,
+                ):
+                    generated += 1
+                else:
+                    failed += 1
+
+        self.stdout.write('Generated the renditions of %d items.' % generated)
+
+        if failed:
+            self.stderr.write(
+                'Could not generate the renditions of %d items.' % failed
+            )
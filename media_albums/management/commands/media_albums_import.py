@@ -0,0 +1,386 @@
+import json
+import logging
+import os
+import threading
+from multiprocessing import Pool, cpu_count
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.fields.files import ImageFieldFile
+
+from ...images import make_renditions, process_image
+from ...models import Album, Photo
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without the `futures` backport
+    ThreadPoolExecutor = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.gif', '.jpeg', '.jpg', '.png')
+
+CHECKPOINT_FILE_NAME = '.media_albums_import.log'
+
+
+def prepare_photo(name):
+    """
+    Correct the orientation of a photo that has been copied to storage, read
+    its metadata and generate its renditions. Return the name of the file
+    along with a dictionary of `Photo` field values, or `None` if the file is
+    not an image. This runs in a worker process.
+    """
+    field = Photo._meta.get_field('image')
+    image_file = ImageFieldFile(None, field, name)
+
+    try:
+        values = process_image(image_file)
+    except Exception:
+        logger.exception('Could not process %s', name)
+        return name, None
+    finally:
+        image_file.close()
+
+    if values.get('width') is None:
+        return name, None
+
+    try:
+        values['renditions'] = json.dumps(
+            make_renditions(image_file),
+            sort_keys=True,
+        )
+    except Exception:
+        # The renditions can be generated later with the
+        # `media_albums_generate_renditions` command.
+        logger.exception('Could not generate the renditions of %s', name)
+
+    return name, values
+
+
+class Command(BaseCommand):
+    help = (
+        'Import the images in a directory tree into an album. The files are '
+        'copied to storage by a pool of threads, processed by a pool of '
+        'worker processes, and the photos are created in batches. An '
+        'interrupted import can be resumed by running the command again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directory',
+            help='The directory to import the images from.',
+        )
+        parser.add_argument(
+            '--album',
+            dest='album_slug',
+            required=True,
+            help='The slug of the album to import the images into.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            dest='batch_size',
+            help='The number of photos to copy, process and create at a time.',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=cpu_count(),
+            dest='processes',
+            help='The number of worker processes used to process the photos.',
+        )
+        parser.add_argument(
+            '--copy-workers',
+            type=int,
+            default=8,
+            dest='copy_workers',
+            help='The number of files that are copied to storage at a time.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            dest='checkpoint',
+            help=(
+                'The file that records which images have been imported. '
+                'Defaults to "%s" in the directory being imported.' % (
+                    CHECKPOINT_FILE_NAME,
+                )
+            ),
+        )
+
+    def find_images(self, directory):
+        """
+        Yield the path (relative to `directory`) of each image in the
+        directory tree, in a stable order.
+        """
+        for root, dir_names, file_names in os.walk(directory):
+            dir_names[:] = sorted(
+                dir_name for dir_name in dir_names
+                if not dir_name.startswith('.')
+            )
+
+            for file_name in sorted(file_names):
+                extension = os.path.splitext(file_name)[1].lower()
+
+                if extension in IMAGE_EXTENSIONS:
+                    yield os.path.relpath(
+                        os.path.join(root, file_name),
+                        directory,
+                    )
+
+    def get_batches(self, paths, batch_size):
+        batch = []
+
+        for path in paths:
+            batch.append(path)
+
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def load_checkpoint(self, path, album):
+        """
+        Read the checkpoint file, which has one tab-separated line per file
+        that is being copied to storage, per imported (or unreadable) file
+        and a `committed` line after each batch whose transaction was
+        committed. Return the set of paths that are done, and a dictionary
+        mapping the path of each file copied by a batch that may not have
+        been committed to the names it may have been stored under (the last
+        one is the name it was stored under, if it was stored).
+        """
+        done = set()
+        pending = {}
+
+        if not os.path.exists(path):
+            with open(path, 'w') as checkpoint_file:
+                checkpoint_file.write('album\t%s\n' % album.slug)
+
+            return done, pending
+
+        with open(path) as checkpoint_file:
+            for line in checkpoint_file:
+                if not line.endswith('\n'):
+                    # The last line was cut short by an interruption.
+                    break
+
+                fields = line[:-1].split('\t')
+
+                if fields[0] == 'album' and fields[1] != album.slug:
+                    raise CommandError(
+                        'The checkpoint file "%s" belongs to an import into '
+                        'the "%s" album.' % (path, fields[1])
+                    )
+                elif fields[0] in ('copying', 'imported'):
+                    pending.setdefault(fields[1], []).append(fields[2])
+                elif fields[0] == 'failed':
+                    done.add(fields[1])
+                    pending.pop(fields[1], None)
+                elif fields[0] == 'retry':
+                    pending.pop(fields[1], None)
+                elif fields[0] == 'committed':
+                    done.update(pending)
+                    pending = {}
+
+        return done, pending
+
+    def write_checkpoint(self, checkpoint_file, lines):
+        checkpoint_file.writelines('\t'.join(line) + '\n' for line in lines)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+
+    def recover_pending(self, checkpoint_file, album, pending):
+        """
+        Check which of the files of an interrupted batch were imported, so
+        that the others (and any copies of them that were left in storage)
+        are deleted and imported again, and return the paths of the ones that
+        were.
+        """
+        storage = Photo._meta.get_field('image').storage
+        names = [name for path_names in pending.values()
+                 for name in path_names]
+        imported = set()
+
+        for start in range(0, len(names), 500):
+            imported.update(
+                Photo.objects.filter(
+                    album=album,
+                    image__in=names[start:start + 500],
+                ).values_list(
+                    'image',
+                    flat=True,
+                )
+            )
+
+        lines = []
+
+        for path, path_names in sorted(pending.items()):
+            for name in set(path_names) - imported:
+                storage.delete(name)
+
+            if path_names[-1] not in imported:
+                lines.append(('retry', path))
+
+        lines.append(('committed',))
+        self.write_checkpoint(checkpoint_file, lines)
+
+        return set(
+            path for path, path_names in pending.items()
+            if path_names[-1] in imported
+        )
+
+    def copy_files(self, checkpoint_file, directory, paths, copy_workers):
+        """
+        Copy the given files to the storage of `Photo.image` and return the
+        name each one was stored under.
+
+        The name of each file is recorded in the checkpoint file before the
+        file is copied (and again if it is stored under another name), so
+        that the copy is deleted if the import is interrupted before the
+        file's photo is created.
+        """
+        field = Photo._meta.get_field('image')
+        lock = threading.Lock()
+
+        def record(path, name):
+            with lock:
+                self.write_checkpoint(checkpoint_file, [
+                    ('copying', path, name),
+                ])
+
+        def copy(path):
+            name = field.storage.get_available_name(
+                field.generate_filename(None, os.path.basename(path))
+            )
+            record(path, name)
+
+            with open(os.path.join(directory, path), 'rb') as source:
+                stored_name = field.storage.save(name, File(source))
+
+            if stored_name != name:
+                record(path, stored_name)
+
+            return stored_name
+
+        if ThreadPoolExecutor is None or copy_workers <= 1:
+            return [copy(path) for path in paths]
+
+        with ThreadPoolExecutor(max_workers=copy_workers) as executor:
+            return list(executor.map(copy, paths))
+
+    def create_photos(self, album, paths, results):
+        """
+        Create the photos of a batch and add them to the album's stored
+        photo count. Return the number of photos created.
+        """
+        photos = []
+
+        for path, (name, values) in zip(paths, results):
+            if values is None:
+                continue
+
+            photos.append(Photo(
+                album=album,
+                name=os.path.splitext(os.path.basename(path))[0][:200],
+                image=name,
+                processing_state=Photo.PROCESSING_DONE,
+                **values
+            ))
+
+        if photos:
+            # `bulk_create()` skips `Photo.save()`, so the album's photo
+            # count is updated here instead.
+            Photo.objects.bulk_create(photos)
+            Album.objects.filter(
+                pk=album.pk,
+            ).update(
+                photo_count=F('photo_count') + len(photos),
+            )
+
+        return len(photos)
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+
+        if not os.path.isdir(directory):
+            raise CommandError('"%s" is not a directory.' % directory)
+
+        try:
+            album = Album.objects.get(slug=options['album_slug'])
+        except Album.DoesNotExist:
+            raise CommandError(
+                'There is no album with the slug "%s".' % options['album_slug']
+            )
+
+        checkpoint_path = options['checkpoint'] or os.path.join(
+            directory,
+            CHECKPOINT_FILE_NAME,
+        )
+        done, pending = self.load_checkpoint(checkpoint_path, album)
+        checkpoint_file = open(checkpoint_path, 'a')
+
+        if pending:
+            done |= self.recover_pending(checkpoint_file, album, pending)
+
+        paths = (
+            path for path in self.find_images(directory)
+            if path not in done
+        )
+
+        # The worker processes must not inherit the database connections.
+        for connection in connections.all():
+            connection.close()
+
+        pool = Pool(processes=max(options['processes'], 1))
+        imported = 0
+        failed = 0
+
+        try:
+            for batch in self.get_batches(paths, options['batch_size']):
+                names = self.copy_files(
+                    checkpoint_file,
+                    directory,
+                    batch,
+                    options['copy_workers'],
+                )
+                results = pool.map(prepare_photo, names)
+                lines = []
+
+                for path, (name, values) in zip(batch, results):
+                    if values is None:
+                        Photo._meta.get_field('image').storage.delete(name)
+                        lines.append(('failed', path))
+                    else:
+                        lines.append(('imported', path, name))
+
+                # The batch is recorded before its transaction is committed,
+                # and marked as committed afterwards. If the import is
+                # interrupted in between, the next run checks which of the
+                # batch's photos exist instead of importing them twice.
+                with transaction.atomic():
+                    created = self.create_photos(album, batch, results)
+                    self.write_checkpoint(checkpoint_file, lines)
+
+                self.write_checkpoint(checkpoint_file, [('committed',)])
+                Album.items_changed(album.pk)
+                imported += created
+                failed += len(batch) - created
+                self.stdout.write(
+                    'Imported %d photos so far.' % imported
+                )
+        finally:
+            pool.close()
+            pool.join()
+            checkpoint_file.close()
+
+        self.stdout.write(
+            'Imported %d photos into "%s" (%d files could not be read).' % (
+                imported,
+                album.name,
+                failed,
+            )
+        )
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from ...models import Photo
+from ...processing import process_photo
+
+
+class Command(BaseCommand):
+    help = (
+        'Process the photos that are still waiting to be processed (for '
+        'example, because the process that was going to process them was '
+        'stopped), including the photos whose processing was started too '
+        'long ago to still be running.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            dest='retry_failed',
+            default=False,
+            help='Also process the photos that could not be processed before.',
+        )
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=60,
+            dest='older_than',
+            help=(
+                'The number of minutes after which a photo that is still '
+                'being processed is assumed to have been abandoned, and is '
+                'processed again.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            Photo.objects.filter(
+                processing_state=Photo.PROCESSING_FAILED,
+            ).update(
+                processing_state=Photo.PROCESSING_PENDING,
+            )
+
+        started_before = timezone.now() - timedelta(
+            minutes=options['older_than'],
+        )
+        Photo.objects.filter(
+            Q(processing_started__lt=started_before) |
+            Q(processing_started__isnull=True),
+            processing_state=Photo.PROCESSING_IN_PROGRESS,
+        ).update(
+            processing_state=Photo.PROCESSING_PENDING,
+        )
+
+        photo_ids = Photo.objects.filter(
+            processing_state=Photo.PROCESSING_PENDING,
+        ).values_list('pk', flat=True)
+
+        processed = 0
+
+        for photo_id in photo_ids.iterator():
+            process_photo(photo_id)
+            processed += 1
+
+        self.stdout.write('Processed %d photos.' % processed)
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from ...models import Album, AudioFile, Photo, VideoFile
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the number of photos, video files and audio files that '
+        'are stored on each album.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--album',
+            action='append',
+            dest='album_slugs',
+            default=[],
+            help='Only recount the album with this slug (may be repeated).',
+        )
+
+    def handle(self, *args, **options):
+        albums = Album.objects.all()
+
+        if options['album_slugs']:
+            albums = albums.filter(slug__in=options['album_slugs'])
+
+        album_ids = list(albums.values_list('pk', flat=True))
+        counts = dict(
+            (album_id, {}) for album_id in album_ids
+        )
+
+        for model in (AudioFile, Photo, VideoFile):
+            rows = model.objects.filter(
+                album__in=album_ids,
+            ).order_by().values('album').annotate(
+                count=Count('pk'),
+            ).values_list('album', 'count')
+
+            for album_id, count in rows:
+                counts[album_id][model.count_field_name] = count
+
+        updated = 0
+
+        with transaction.atomic():
+            stored_counts = albums.values(
+                'pk',
+                'audio_file_count',
+                'photo_count',
+                'video_file_count',
+            )
+
+            for stored in stored_counts:
+                album_id = stored.pop('pk')
+                new_counts = dict(
+                    (field, counts[album_id].get(field, 0))
+                    for field in stored
+                )
+
+                if new_counts != stored:
+                    Album.objects.filter(pk=album_id).update(**new_counts)
+                    updated += 1
+
+        self.stdout.write(
+            'Recounted %d albums, %d of which were out of date.' % (
+                len(album_ids),
+                updated,
+            )
+        )
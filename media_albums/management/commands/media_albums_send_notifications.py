@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from ...notifications import send_outbox
+
+
+class Command(BaseCommand):
+    help = (
+        'Send a single digest email for the notifications stored by the '
+        '"OutboxBackend" notification backend.'
+    )
+
+    def handle(self, *args, **options):
+        sent = send_outbox()
+
+        self.stdout.write('Sent %d notifications.' % sent)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='', verbose_name='cover image'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='cover_item_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='cover item ID'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='cover_item_type',
+            field=models.CharField(blank=True, choices=[('audio', 'Audio file'), ('photo', 'Photo'), ('video', 'Video file')], editable=False, max_length=5, verbose_name='cover item type'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def backfill_album_cover_item(apps, schema_editor):
+    Album = apps.get_model('media_albums', 'Album')
+
+    # The order matches the order in which `Album.cover_item()` used to look
+    # for the album photo.
+    item_models = (
+        ('photo', 'Photo', 'image'),
+        ('video', 'VideoFile', 'poster'),
+        ('audio', 'AudioFile', 'cover_art'),
+    )
+
+    for media_type, model_name, cover_field_name in item_models:
+        model = apps.get_model('media_albums', model_name)
+        items = model.objects.filter(
+            album_photo=True,
+        ).order_by(
+            'album', 'ordering', 'name', 'pk',
+        ).values_list(
+            'album', 'pk', cover_field_name,
+        )
+
+        for album_id, item_id, cover_image in items.iterator():
+            Album.objects.filter(
+                pk=album_id,
+                cover_item_id__isnull=True,
+            ).update(
+                cover_image=cover_image or '',
+                cover_item_type=media_type,
+                cover_item_id=item_id,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0002_album_cover_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_album_cover_item,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0003_backfill_album_cover_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='audio_file_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of audio files'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='photo_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of photos'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='video_file_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of video files'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_album_item_counts(apps, schema_editor):
+    Album = apps.get_model('media_albums', 'Album')
+
+    item_models = (
+        ('AudioFile', 'audio_file_count'),
+        ('Photo', 'photo_count'),
+        ('VideoFile', 'video_file_count'),
+    )
+
+    for model_name, count_field_name in item_models:
+        model = apps.get_model('media_albums', model_name)
+        rows = model.objects.order_by().values('album').annotate(
+            count=Count('pk'),
+        ).values_list('album', 'count')
+
+        for album_id, count in rows.iterator():
+            Album.objects.filter(
+                pk=album_id,
+            ).update(**{
+                count_field_name: count,
+            })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0004_album_item_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_album_item_counts,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0005_backfill_album_item_counts'),
+    ]
+
+    operations = [
+        # Existing photos were processed when they were saved.
+        migrations.AddField(
+            model_name='photo',
+            name='processing_state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In progress'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='done', editable=False, max_length=11, verbose_name='processing state'),
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='processing_state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In progress'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', editable=False, max_length=11, verbose_name='processing state'),
+        ),
+    ]
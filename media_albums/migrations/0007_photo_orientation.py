@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0006_photo_processing_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='orientation',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, help_text='The EXIF orientation that still needs to be applied when the image is displayed.', verbose_name='orientation'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0007_photo_orientation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='camera_make',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='camera make'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='camera_model',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100, verbose_name='camera model'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='file_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='file size'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='gps_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='GPS latitude'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='gps_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='GPS longitude'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='height'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='mime_type',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=50, verbose_name='MIME type'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='taken_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='taken at'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='width'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0008_photo_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_renditions',
+            field=models.TextField(blank=True, editable=False, verbose_name='cover renditions'),
+        ),
+        migrations.AddField(
+            model_name='audiofile',
+            name='renditions',
+            field=models.TextField(blank=True, editable=False, help_text='The URLs and sizes of the generated renditions of the image, stored as JSON.', verbose_name='renditions'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='renditions',
+            field=models.TextField(blank=True, editable=False, help_text='The URLs and sizes of the generated renditions of the image, stored as JSON.', verbose_name='renditions'),
+        ),
+        migrations.AddField(
+            model_name='videofile',
+            name='renditions',
+            field=models.TextField(blank=True, editable=False, help_text='The URLs and sizes of the generated renditions of the image, stored as JSON.', verbose_name='renditions'),
+        ),
+    ]
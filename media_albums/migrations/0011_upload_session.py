@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('media_albums', '0010_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200, verbose_name='name')),
+                ('caption', models.CharField(blank=True, max_length=255, verbose_name='caption')),
+                ('description', models.TextField(blank=True, verbose_name='description')),
+                ('file_name', models.CharField(max_length=255, verbose_name='file name')),
+                ('size', models.BigIntegerField(verbose_name='size')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256 checksum')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='offset')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True, verbose_name='updated')),
+                ('added_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'upload session',
+                'verbose_name_plural': 'upload sessions',
+                'ordering': ('created',),
+            },
+        ),
+    ]
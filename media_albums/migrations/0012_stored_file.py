@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0011_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True, verbose_name='content hash')),
+                ('name', models.CharField(db_index=True, max_length=255, verbose_name='name')),
+                ('ref_count', models.PositiveIntegerField(default=1, verbose_name='reference count')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+            ],
+            options={
+                'verbose_name': 'stored file',
+                'verbose_name_plural': 'stored files',
+                'ordering': ('created',),
+            },
+        ),
+        migrations.AddField(
+            model_name='audiofile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='The SHA-256 checksum of the uploaded media file.', max_length=64, verbose_name='content hash'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='The SHA-256 checksum of the uploaded media file.', max_length=64, verbose_name='content hash'),
+        ),
+        migrations.AddField(
+            model_name='videofile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='The SHA-256 checksum of the uploaded media file.', max_length=64, verbose_name='content hash'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0012_stored_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='perceptual_hash',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, help_text='A hash of what the image looks like, which is the same or nearly the same for similar images.', null=True, verbose_name='perceptual hash'),
+        ),
+    ]
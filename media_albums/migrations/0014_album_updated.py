@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0013_perceptual_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, help_text='When the album or any of its items were last changed.', verbose_name='updated'),
+            preserve_default=False,
+        ),
+    ]
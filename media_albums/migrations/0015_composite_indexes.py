@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# SQLite only uses a partial index when the query compares the column with
+# the same literal value, while Django passes `True` as a query parameter, and
+# MySQL does not support partial indexes at all.
+PARTIAL_INDEX_VENDORS = ('postgresql',)
+
+
+def album_photo_indexes(apps):
+    """
+    Yield the table and name of each partial index on the items that are the
+    album photo of their album.
+    """
+    for model_name in ('AudioFile', 'Photo', 'VideoFile'):
+        table = apps.get_model('media_albums', model_name)._meta.db_table
+        yield table, '%s_album_photo_partial' % table
+
+
+def create_album_photo_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+
+    if connection.vendor not in PARTIAL_INDEX_VENDORS:
+        return
+
+    qn = connection.ops.quote_name
+
+    for table, index_name in album_photo_indexes(apps):
+        schema_editor.execute(
+            'CREATE INDEX %s ON %s (%s) WHERE %s' % (
+                qn(index_name),
+                qn(table),
+                qn('album_id'),
+                qn('album_photo'),
+            )
+        )
+
+
+def drop_album_photo_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+
+    if connection.vendor not in PARTIAL_INDEX_VENDORS:
+        return
+
+    qn = connection.ops.quote_name
+
+    for table, index_name in album_photo_indexes(apps):
+        schema_editor.execute('DROP INDEX %s' % qn(index_name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0014_album_updated'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='album',
+            index_together=set([('visibility', 'ordering', 'name')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='audiofile',
+            index_together=set([('album', 'ordering', 'name', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='photo',
+            index_together=set([('album', 'ordering', 'name', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='videofile',
+            index_together=set([('album', 'ordering', 'name', 'id')]),
+        ),
+        migrations.RunPython(
+            create_album_photo_indexes,
+            drop_album_photo_indexes,
+        ),
+    ]
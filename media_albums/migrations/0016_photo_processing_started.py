@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_albums', '0015_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='processing_started',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the photo was last claimed to be processed.', null=True, verbose_name='processing started'),
+        ),
+    ]
@@ -1,16 +1,37 @@
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
 from itertools import chain
 from operator import attrgetter
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import NoReverseMatch, reverse
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import ugettext_lazy as _
-from PIL import Image
 
+from .cache import bump_album_version, get_album_version
+from .processing import schedule
 from .settings import MEDIA_ALBUMS_SETTINGS
 
 
+def load_renditions(value):
+    if not value:
+        return {}
+
+    try:
+        return json.loads(value)
+    except ValueError:
+        return {}
+
+
 def get_format_text(extension):
     extensions = extension.split(',')
 
@@ -20,6 +41,299 @@ def get_format_text(extension):
     return ', '.join(extensions[:-1]) + ', or ' + extensions[-1]
 
 
+def include_update_field(save_kwargs, name):
+    """
+    Make sure a field changed by `save()` itself is written even when the
+    caller only asked for some fields to be updated.
+    """
+    update_fields = save_kwargs.get('update_fields')
+
+    if update_fields is not None and name not in update_fields:
+        save_kwargs['update_fields'] = list(update_fields) + [name]
+
+
+class AlbumItems(object):
+    """
+    A lazily evaluated sequence of the items in an album.
+
+    The items are sorted the same way as `Album.items`, but the photos, video
+    files and audio files are merged and sorted by the database, so slicing
+    this object (which is what `Paginator` does) only loads the rows that are
+    actually going to be displayed.
+    """
+
+    def __init__(self, album):
+        self.album = album
+
+    @property
+    def models(self):
+        # The position of each model in this tuple is used to break ties
+        # between items with the same `ordering` and `name`, which keeps the
+        # order identical to the one produced by `Album.items`.
+        return tuple(
+            (item_type, model)
+            for item_type, model in enumerate((Photo, VideoFile, AudioFile))
+            if MEDIA_ALBUMS_SETTINGS[model.settings_key]
+        )
+
+    def count(self):
+        return sum(
+            self.album.item_count(model)
+            for item_type, model in self.models
+        )
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:self.count()])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise ValueError('Slicing with a step is not supported.')
+
+            start = key.start or 0
+            stop = key.stop
+
+            if stop is None:
+                stop = self.count()
+
+            if start < 0 or stop < 0:
+                raise ValueError('Negative indexing is not supported.')
+
+            # Like a queryset, a slice is only loaded once it is used.
+            return SimpleLazyObject(
+                lambda: self.fetch(start, stop - start)
+            )
+
+        try:
+            return self.fetch(key, 1)[0]
+        except IndexError:
+            raise IndexError('Album item index out of range.')
+
+    def item_type(self, item):
+        for item_type, model in enumerate((Photo, VideoFile, AudioFile)):
+            if isinstance(item, model):
+                return item_type
+
+    def keyset_filter(self, item, item_type, after):
+        """
+        Return a `Q` object that matches the items of the given type that sort
+        after (or before, if `after` is `False`) the given item.
+        """
+        direction = 'gt' if after else 'lt'
+        current_item_type = self.item_type(item)
+
+        q = (
+            Q(**{'ordering__%s' % direction: item.ordering}) |
+            Q(**{
+                'ordering': item.ordering,
+                'name__%s' % direction: item.name,
+            })
+        )
+
+        if item_type == current_item_type:
+            q |= Q(**{
+                'ordering': item.ordering,
+                'name': item.name,
+                'pk__%s' % direction: item.pk,
+            })
+        elif (item_type > current_item_type) == after:
+            q |= Q(ordering=item.ordering, name=item.name)
+
+        return q
+
+    def adjacent(self, item, after):
+        return self.first(
+            after,
+            lambda item_type: self.keyset_filter(item, item_type, after),
+        )
+
+    def first(self, after=True, get_filter=None):
+        """
+        Return the first item in the album (or the last, if `after` is
+        `False`), with one query per item type. If `get_filter` is given, it
+        is called with each item type and returns a `Q` object that the items
+        of that type must match.
+        """
+        candidates = []
+
+        for item_type, model in self.models:
+            order_by = ('ordering', 'name', 'pk')
+
+            if not after:
+                order_by = tuple('-%s' % field for field in order_by)
+
+            queryset = model.objects.filter(album=self.album)
+
+            if get_filter is not None:
+                queryset = queryset.filter(get_filter(item_type))
+
+            candidate = queryset.order_by(*order_by).first()
+
+            if candidate is not None:
+                candidates.append(
+                    (
+                        (
+                            candidate.ordering,
+                            candidate.name,
+                            item_type,
+                            candidate.pk,
+                        ),
+                        candidate,
+                    )
+                )
+
+        if not candidates:
+            return None
+
+        if after:
+            return min(candidates, key=lambda candidate: candidate[0])[1]
+
+        return max(candidates, key=lambda candidate: candidate[0])[1]
+
+    def position(self, item):
+        """
+        Return the zero-based position of the given item in the album.
+        """
+        return sum(
+            model.objects.filter(
+                self.keyset_filter(item, item_type, False),
+                album=self.album,
+            ).count()
+            for item_type, model in self.models
+        )
+
+    def neighbours(self, item):
+        """
+        Return the items before and after the given item (wrapping around at
+        either end of the album), along with the positions of all three items
+        and the total number of items.
+
+        Only a fixed number of queries is needed regardless of the size of
+        the album, and the positions are cached until the album changes.
+        """
+        # The first and last items are looked up like the neighbours are,
+        # rather than by their positions, so that stored counts that have
+        # drifted never lead to a missing item.
+        next_item = self.adjacent(item, after=True)
+        next_wraps = next_item is None
+        if next_wraps:
+            next_item = self.first(after=True)
+
+        previous_item = self.adjacent(item, after=False)
+        previous_wraps = previous_item is None
+        if previous_wraps:
+            previous_item = self.first(after=False)
+
+        cache_key = 'media_albums:album:%s:%s:position:%s:%s:%s' % (
+            self.album.pk,
+            get_album_version(self.album.pk),
+            ''.join(str(item_type) for item_type, model in self.models),
+            self.item_type(item),
+            item.pk,
+        )
+        current_item_position = cache.get(cache_key)
+
+        if current_item_position is None:
+            current_item_position = self.position(item)
+            cache.set(cache_key, current_item_position)
+
+        # There is at least one item after the current one unless the next
+        # item wraps around.
+        total = max(
+            self.count(),
+            current_item_position + (1 if next_wraps else 2),
+        )
+
+        if next_wraps:
+            next_item_position = 0
+        else:
+            next_item_position = current_item_position + 1
+
+        if previous_wraps:
+            previous_item_position = total - 1
+        else:
+            previous_item_position = max(current_item_position - 1, 0)
+
+        return {
+            'next': next_item,
+            'previous': previous_item,
+            'current_item_position': current_item_position + 1,
+            'next_item_position': next_item_position + 1,
+            'previous_item_position': previous_item_position + 1,
+            'total_album_items': total,
+        }
+
+    def get_sql(self, offset, limit):
+        """
+        Return the SQL query (and its parameters) that reads the type, ID,
+        ordering and name of `limit` items in the album, starting at
+        `offset`.
+        """
+        qn = connection.ops.quote_name
+        selects = []
+        params = []
+
+        for item_type, model in self.models:
+            selects.append(
+                'SELECT %d AS item_type, %s AS id, %s AS ordering, '
+                '%s AS name FROM %s WHERE %s = %%s' % (
+                    item_type,
+                    qn(model._meta.pk.column),
+                    qn('ordering'),
+                    qn('name'),
+                    qn(model._meta.db_table),
+                    qn(model._meta.get_field('album').column),
+                )
+            )
+            params.append(self.album.pk)
+
+        # Items of different types with the same ordering and name are sorted
+        # by type. With a single type, the rows can be read in the order of
+        # the `(album, ordering, name, id)` index without sorting them.
+        if len(selects) > 1:
+            order_by = 'ordering, name, item_type, id'
+        else:
+            order_by = 'ordering, name, id'
+
+        sql = '%s ORDER BY %s LIMIT %%s OFFSET %%s' % (
+            ' UNION ALL '.join(selects),
+            order_by,
+        )
+        params.extend([limit, offset])
+
+        return sql, params
+
+    def fetch(self, offset, limit):
+        if not self.models or limit <= 0:
+            return []
+
+        sql, params = self.get_sql(offset, limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        models_by_type = dict(self.models)
+        ids_by_type = {}
+
+        for item_type, pk, ordering, name in rows:
+            ids_by_type.setdefault(item_type, []).append(pk)
+
+        objects_by_type = dict(
+            (item_type, models_by_type[item_type].objects.in_bulk(ids))
+            for item_type, ids in ids_by_type.items()
+        )
+
+        return [
+            objects_by_type[item_type][pk]
+            for item_type, pk, ordering, name in rows
+            if pk in objects_by_type[item_type]
+        ]
+
+
 class Upload(models.Model):
     album = models.ForeignKey('Album', on_delete=models.CASCADE)
     name = models.CharField(_('name'), max_length=200)
@@ -30,41 +344,319 @@ class Upload(models.Model):
         help_text=_('Override automatic ordering.'),
         db_index=True,
     )
+    renditions = models.TextField(
+        _('renditions'),
+        blank=True,
+        editable=False,
+        help_text=_(
+            'The URLs and sizes of the generated renditions of the image, '
+            'stored as JSON.'
+        ),
+    )
+    content_hash = models.CharField(
+        _('content hash'),
+        max_length=64,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text=_('The SHA-256 checksum of the uploaded media file.'),
+    )
 
     is_audio = False
     is_photo = False
     is_video = False
+    settings_key = None
+    media_type = None
+    cover_field_name = None
+    content_field_name = None
+    count_field_name = None
+    album_count_deferred = False
 
     class Meta:
         abstract = True
         ordering = ('ordering', 'name')
+        # The pages of an album are read in this order (see `AlbumItems`).
+        index_together = [
+            ('album', 'ordering', 'name', 'id'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super(Upload, self).__init__(*args, **kwargs)
+        # Remember which album this item was loaded with, whether it was the
+        # album photo and what its cover file was, so that changes to any of
+        # them can be detected when it is saved.
+        self._loaded_album_id = self.__dict__.get('album_id')
+        self._loaded_album_photo = self.__dict__.get('album_photo', False)
+        cover_file = self.__dict__.get(self.cover_field_name)
+        self._loaded_cover_name = getattr(cover_file, 'name', cover_file) or ''
+        self._loaded_file_names = self.get_file_names()
+
+    def get_file_names(self):
+        """
+        Return a dictionary mapping the name of each of this item's (loaded)
+        file fields to the name of its file.
+        """
+        file_names = {}
+
+        for field in self._meta.fields:
+            if isinstance(field, models.FileField) and (
+                field.attname in self.__dict__
+            ):
+                value = self.__dict__[field.attname]
+                file_names[field.attname] = getattr(value, 'name', value) or ''
+
+        return file_names
+
+    def deduplicate_files(self):
+        """
+        If the `deduplicate_files` setting is enabled, store each newly
+        uploaded file of this item by its content: a file whose content has
+        been stored before reuses the stored file, and the number of items
+        that use each stored file is counted.
+
+        Return the storage and name of each file that was saved to storage
+        for the first time.
+        """
+        stored_files = []
+
+        if not MEDIA_ALBUMS_SETTINGS['deduplicate_files']:
+            return stored_files
+
+        for field in self._meta.fields:
+            if not isinstance(field, models.FileField):
+                continue
+
+            field_file = getattr(self, field.attname)
+
+            if not field_file or field_file._committed:
+                continue
+
+            content_hash = StoredFile.hash_file(field_file.file)
+            name, created = StoredFile.objects.acquire(
+                content_hash,
+                field_file,
+            )
+            setattr(self, field.attname, name)
+
+            if created:
+                stored_files.append((field.storage, name))
+
+            if field.attname == self.content_field_name:
+                self.content_hash = content_hash
+
+        return stored_files
+
+    @contextmanager
+    def deduplicating_files(self):
+        """
+        Store the new files of this item by their content (see
+        `deduplicate_files()`) and run the block, in a single transaction. If
+        the block fails, the files that were saved to storage for the first
+        time are deleted again, since no item uses them.
+        """
+        stored_files = []
+
+        try:
+            with transaction.atomic():
+                stored_files = self.deduplicate_files()
+                yield
+        except Exception:
+            for storage, name in stored_files:
+                storage.delete(name)
+
+            raise
+
+    def release_files(self, file_names=None):
+        """
+        Stop using the stored files in the given dictionary of file field
+        names and file names (by default, all of this item's files), so that
+        they are deleted once no other item uses them.
+        """
+        if file_names is None:
+            file_names = self.get_file_names()
+
+        for field_name, name in file_names.items():
+            if name:
+                StoredFile.objects.release(
+                    self._meta.get_field(field_name).storage,
+                    name,
+                )
+
+    @classmethod
+    def save_new_items(cls, items):
+        """
+        Save several new items of this type in a single transaction, and add
+        them to the stored number of items of each album once, instead of
+        once per item.
+        """
+        added = {}
+
+        with transaction.atomic():
+            for item in items:
+                item.album_count_deferred = True
+
+                try:
+                    item.save()
+                finally:
+                    item.album_count_deferred = False
+
+                added[item.album_id] = added.get(item.album_id, 0) + 1
+
+            for album_id, delta in added.items():
+                items[0].update_album_count(album_id, delta)
 
     def save(self, *args, **kwargs):
+        with self.deduplicating_files():
+            cover_file_changed = (
+                self._state.adding or
+                (self.cover_file().name or '') != self._loaded_cover_name
+            )
+
+            if cover_file_changed:
+                self.renditions = ''
+                include_update_field(kwargs, 'renditions')
+
+            self.save_and_update_album(*args, **kwargs)
+
+            file_names = self.get_file_names()
+            self.release_files({
+                field_name: name
+                for field_name, name in self._loaded_file_names.items()
+                if file_names.get(field_name, name) != name
+            })
+            self._loaded_file_names = file_names
+
+        if cover_file_changed:
+            self.cover_file_changed()
+
+    def cover_file_changed(self):
+        """
+        Called after the item has been saved with a new cover file.
+        """
+        if self.cover_file():
+            schedule(
+                'media_albums.processing.generate_renditions',
+                self._meta.app_label,
+                self._meta.model_name,
+                self.pk,
+            )
+
+    def get_rendition(self, name):
+        """
+        Return the rendition of the cover file with the given name (which must
+        be a key of the `renditions` setting) as a dictionary with `url`,
+        `width` and `height` keys, or `None` if it has not been generated.
+        """
+        return load_renditions(self.renditions).get(name)
+
+    def save_and_update_album(self, *args, **kwargs):
         # All of the models that inherit from this abstract base class
         # have an `album_photo` field.
 
-        if self.album_photo:
-            AudioFile.objects.filter(
-                album=self.album,
-                album_photo=True,
-            ).update(
-                album_photo=False,
-            )
+        adding = self._state.adding
+        album_changed = self._loaded_album_id != self.album_id
+        becoming_album_photo = self.album_photo and (
+            adding or album_changed or not self._loaded_album_photo
+        )
 
-            Photo.objects.filter(
-                album=self.album,
-                album_photo=True,
-            ).update(
-                album_photo=False,
-            )
+        if becoming_album_photo:
+            self.unset_album_photo()
 
-            VideoFile.objects.filter(
-                album=self.album,
-                album_photo=True,
+        super(Upload, self).save(*args, **kwargs)
+
+        if adding:
+            if not self.album_count_deferred:
+                self.update_album_count(self.album_id, 1)
+        elif album_changed:
+            self.update_album_count(self._loaded_album_id, -1)
+            self.update_album_count(self.album_id, 1)
+
+        if self._loaded_album_photo and (
+            not self.album_photo or album_changed
+        ):
+            self.clear_album_cover(self._loaded_album_id)
+
+        cover_file_name = self.cover_file().name or ''
+
+        if becoming_album_photo or (
+            self.album_photo and cover_file_name != self._loaded_cover_name
+        ):
+            Album.objects.filter(
+                pk=self.album_id,
             ).update(
-                album_photo=False,
+                cover_image=cover_file_name,
+                cover_item_type=self.media_type,
+                cover_item_id=self.pk,
+                cover_renditions=self.renditions,
             )
-        super(Upload, self).save(*args, **kwargs)
+
+        self._loaded_album_id = self.album_id
+        self._loaded_album_photo = self.album_photo
+        self._loaded_cover_name = cover_file_name
+
+    def unset_album_photo(self):
+        """
+        Clear the `album_photo` flag of the item that is currently the cover
+        of this item's album.
+
+        The album row is locked while this happens, and the album's cover
+        pointer says which item has the flag, so a single UPDATE is issued
+        instead of one per item type.
+        """
+        cover = Album.objects.select_for_update().filter(
+            pk=self.album_id,
+        ).values_list(
+            'cover_item_type',
+            'cover_item_id',
+        ).first()
+
+        if cover is None:
+            return
+
+        cover_item_type, cover_item_id = cover
+
+        if cover_item_type == self.media_type and cover_item_id == self.pk:
+            return
+
+        for model in (AudioFile, Photo, VideoFile):
+            if model.media_type == cover_item_type:
+                model.objects.filter(
+                    pk=cover_item_id,
+                ).update(
+                    album_photo=False,
+                )
+
+    def update_album_count(self, album_id, delta):
+        """
+        Add `delta` to the stored number of items of this type in the given
+        album.
+        """
+        Album.objects.filter(
+            pk=album_id,
+        ).update(**{
+            self.count_field_name: F(self.count_field_name) + delta,
+        })
+
+    def cover_file(self):
+        """
+        Return the file that is shown when this item is the album photo.
+        """
+        return getattr(self, self.cover_field_name)
+
+    def clear_album_cover(self, album_id):
+        """
+        Remove this item as the cover of the given album, if it is the cover.
+        """
+        Album.objects.filter(
+            pk=album_id,
+            cover_item_type=self.media_type,
+            cover_item_id=self.pk,
+        ).update(
+            cover_image='',
+            cover_item_type='',
+            cover_item_id=None,
+            cover_renditions='',
+        )
 
 
 class Album(models.Model):
@@ -92,6 +684,12 @@ class Album(models.Model):
         ),
     )
 
+    COVER_ITEM_TYPE_CHOICES = (
+        ('audio', _('Audio file')),
+        ('photo', _('Photo')),
+        ('video', _('Video file')),
+    )
+
     name = models.CharField(_('name'), max_length=200, unique=True)
     slug = models.SlugField(_('slug'), unique=True)
     description = models.TextField(_('description'), blank=True)
@@ -101,67 +699,146 @@ class Album(models.Model):
         max_length=8,
     )
     created = models.DateTimeField(_('created'), auto_now_add=True)
+    updated = models.DateTimeField(
+        _('updated'),
+        auto_now=True,
+        db_index=True,
+        help_text=_(
+            'When the album or any of its items were last changed.'
+        ),
+    )
     ordering = models.IntegerField(
         _('ordering'),
         default=0,
         help_text=_('Override automatic ordering.'),
     )
+    cover_image = models.ImageField(
+        _('cover image'),
+        blank=True,
+        editable=False,
+    )
+    cover_item_type = models.CharField(
+        _('cover item type'),
+        choices=COVER_ITEM_TYPE_CHOICES,
+        max_length=5,
+        blank=True,
+        editable=False,
+    )
+    cover_item_id = models.PositiveIntegerField(
+        _('cover item ID'),
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    cover_renditions = models.TextField(
+        _('cover renditions'),
+        blank=True,
+        editable=False,
+    )
+    audio_file_count = models.PositiveIntegerField(
+        _('number of audio files'),
+        default=0,
+        editable=False,
+    )
+    photo_count = models.PositiveIntegerField(
+        _('number of photos'),
+        default=0,
+        editable=False,
+    )
+    video_file_count = models.PositiveIntegerField(
+        _('number of video files'),
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('ordering', 'name')
+        # The album list shows the public albums in this order.
+        index_together = [
+            ('visibility', 'ordering', 'name'),
+        ]
         verbose_name = _('album')
         verbose_name_plural = _('albums')
 
     def __unicode__(self):
         return self.name
 
+    @classmethod
+    def items_changed(cls, *album_ids):
+        """
+        Record that items in the albums with the given IDs have been added,
+        changed or removed, by updating the albums' `updated` timestamps and
+        cache versions.
+        """
+        album_ids = set(album_ids) - {None}
+
+        if not album_ids:
+            return
+
+        cls.objects.filter(pk__in=album_ids).update(updated=timezone.now())
+
+        for album_id in album_ids:
+            bump_album_version(album_id)
+
+    def cover_model(self):
+        for model in (AudioFile, Photo, VideoFile):
+            if model.media_type == self.cover_item_type:
+                if MEDIA_ALBUMS_SETTINGS[model.settings_key]:
+                    return model
+
+        return None
+
     def cover_item(self):
-        cover_item = None
+        model = self.cover_model()
 
-        if MEDIA_ALBUMS_SETTINGS['photos_enabled']:
-            try:
-                cover_item = self.photo_set.filter(
-                    album_photo=True,
-                )[0]
-            except IndexError:
-                pass
-
-        if cover_item is None and MEDIA_ALBUMS_SETTINGS['video_files_enabled']:
-            try:
-                cover_item = self.videofile_set.filter(
-                    album_photo=True,
-                )[0]
-            except IndexError:
-                pass
-
-        if cover_item is None and MEDIA_ALBUMS_SETTINGS['audio_files_enabled']:
-            try:
-                cover_item = self.audiofile_set.filter(
-                    album_photo=True,
-                )[0]
-            except IndexError:
-                pass
-
-        return cover_item
+        if model is None:
+            return None
 
-    def image(self):
-        cover_item = self.cover_item()
+        return model.objects.filter(pk=self.cover_item_id).first()
 
-        if cover_item:
-            if cover_item.is_photo:
-                return cover_item.image
-            elif cover_item.is_video:
-                return cover_item.poster
-            elif cover_item.is_audio:
-                return cover_item.cover_art
+    def image(self):
+        if self.cover_image and self.cover_model() is not None:
+            return self.cover_image
 
         return None
 
+    def get_rendition(self, name):
+        """
+        Return the rendition of the album's cover image with the given name,
+        or `None` if it has not been generated.
+        """
+        if self.cover_model() is None:
+            return None
+
+        return load_renditions(self.cover_renditions).get(name)
+
+    def item_count(self, model):
+        """
+        Return the number of items of the given model in this album.
+
+        The stored count is used unless the `item_counts_live` setting is
+        enabled, in which case the items are counted by the database (using
+        the `live_*` annotations, if the queryset added them).
+        """
+        if MEDIA_ALBUMS_SETTINGS['item_counts_live']:
+            live_count = getattr(
+                self,
+                'live_%s' % model.count_field_name,
+                None,
+            )
+
+            if live_count is not None:
+                return live_count
+
+            return model.objects.filter(album=self).count()
+
+        return getattr(self, model.count_field_name)
+
     def num_items(self):
         """
-        Return the number of photos associated with this album
+        Return the number of items associated with this album
         """
-        return len(self.items)
+        return self.lazy_items.count()
     num_items.short_description = _('Items')
 
     @property
@@ -182,9 +859,22 @@ class Album(models.Model):
             key=attrgetter('ordering', 'name'),
         )
 
+    @property
+    def lazy_items(self):
+        """
+        Return the items in this album as an `AlbumItems` sequence, which
+        only loads the items that are sliced out of it.
+        """
+        return AlbumItems(self)
+
 
 class AudioFile(Upload):
     is_audio = True
+    settings_key = 'audio_files_enabled'
+    media_type = 'audio'
+    count_field_name = 'audio_file_count'
+    cover_field_name = 'cover_art'
+    content_field_name = 'audio_file_1'
 
     caption = models.CharField(
         _('caption'),
@@ -284,7 +974,37 @@ class AudioFile(Upload):
 
 
 class Photo(Upload):
+    PROCESSING_PENDING = 'pending'
+    PROCESSING_IN_PROGRESS = 'in_progress'
+    PROCESSING_DONE = 'done'
+    PROCESSING_FAILED = 'failed'
+    PROCESSING_STATE_CHOICES = (
+        (PROCESSING_PENDING, _('Pending')),
+        (PROCESSING_IN_PROGRESS, _('In progress')),
+        (PROCESSING_DONE, _('Done')),
+        (PROCESSING_FAILED, _('Failed')),
+    )
+    METADATA_FIELDS = (
+        'orientation',
+        'width',
+        'height',
+        'file_size',
+        'mime_type',
+        'taken_at',
+        'camera_make',
+        'camera_model',
+        'gps_latitude',
+        'gps_longitude',
+        'perceptual_hash',
+    )
+
     is_photo = True
+    settings_key = 'photos_enabled'
+    media_type = 'photo'
+    count_field_name = 'photo_count'
+    cover_field_name = 'image'
+    content_field_name = 'image'
+    image_probe = None
 
     caption = models.CharField(
         _('caption'),
@@ -306,6 +1026,107 @@ class Photo(Upload):
         default=False,
         help_text=_('Use this photo as the album photo.'),
     )
+    processing_state = models.CharField(
+        _('processing state'),
+        choices=PROCESSING_STATE_CHOICES,
+        default=PROCESSING_PENDING,
+        max_length=11,
+        editable=False,
+        db_index=True,
+    )
+    processing_started = models.DateTimeField(
+        _('processing started'),
+        blank=True,
+        null=True,
+        editable=False,
+        help_text=_('When the photo was last claimed to be processed.'),
+    )
+    orientation = models.PositiveSmallIntegerField(
+        _('orientation'),
+        default=1,
+        editable=False,
+        help_text=_(
+            'The EXIF orientation that still needs to be applied when the '
+            'image is displayed.'
+        ),
+    )
+    width = models.PositiveIntegerField(
+        _('width'),
+        blank=True,
+        null=True,
+        editable=False,
+        db_index=True,
+    )
+    height = models.PositiveIntegerField(
+        _('height'),
+        blank=True,
+        null=True,
+        editable=False,
+        db_index=True,
+    )
+    file_size = models.PositiveIntegerField(
+        _('file size'),
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    mime_type = models.CharField(
+        _('MIME type'),
+        max_length=50,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+    taken_at = models.DateTimeField(
+        _('taken at'),
+        blank=True,
+        null=True,
+        editable=False,
+        db_index=True,
+    )
+    camera_make = models.CharField(
+        _('camera make'),
+        max_length=100,
+        blank=True,
+        editable=False,
+    )
+    camera_model = models.CharField(
+        _('camera model'),
+        max_length=100,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+    gps_latitude = models.FloatField(
+        _('GPS latitude'),
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    gps_longitude = models.FloatField(
+        _('GPS longitude'),
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    perceptual_hash = models.BigIntegerField(
+        _('perceptual hash'),
+        blank=True,
+        null=True,
+        editable=False,
+        db_index=True,
+        help_text=_(
+            'A hash of what the image looks like, which is the same or '
+            'nearly the same for similar images.'
+        ),
+    )
+
+    @property
+    def aspect_ratio(self):
+        if self.width and self.height:
+            return float(self.width) / self.height
+
+        return None
 
     class Meta(Upload.Meta):
         verbose_name = _('photo')
@@ -315,45 +1136,87 @@ class Photo(Upload):
         return self.name
 
     def save(self, *args, **kwargs):
-        super(Photo, self).save(*args, **kwargs)
+        with self.deduplicating_files():
+            image_changed = (
+                self._state.adding or
+                self.image.name != self._loaded_cover_name
+            )
 
-        exif_data = None
+            if image_changed:
+                self.processing_state = self.PROCESSING_PENDING
+                include_update_field(kwargs, 'processing_state')
 
-        try:
-            img = Image.open(self.image)
-        except IOError:
-            pass
-        else:
-            try:
-                exif_data = img._getexif()
-            except AttributeError:
-                pass
-
-        if exif_data:
-            orientation = exif_data.get(0x0112)
-
-            rotated_img = None
-
-            if orientation == 2:
-                rotated_img = img.transpose(Image.FLIP_LEFT_RIGHT)
-            elif orientation == 3:
-                rotated_img = img.rotate(180)
-            elif orientation == 4:
-                rotated_img = img.transpose(Image.FLIP_TOP_BOTTOM)
-            elif orientation == 5:
-                rotated_img = img.rotate(-90).transpose(Image.FLIP_LEFT_RIGHT)
-            elif orientation == 6:
-                rotated_img = img.rotate(-90)
-            elif orientation == 7:
-                rotated_img = img.rotate(90).transpose(Image.FLIP_LEFT_RIGHT)
-            elif orientation == 8:
-                rotated_img = img.rotate(90)
-
-            if rotated_img:
-                try:
-                    rotated_img.save(self.image.file.name, overwrite=True)
-                except IOError:
-                    pass
+                if self.apply_duplicate_metadata() or self.apply_image_probe():
+                    for name in self.METADATA_FIELDS:
+                        include_update_field(kwargs, name)
+
+            self.image_probe = None
+
+            super(Photo, self).save(*args, **kwargs)
+
+        if self.processing_state == self.PROCESSING_PENDING:
+            schedule('media_albums.processing.process_photo', self.pk)
+        elif image_changed and self.perceptual_hash is None:
+            schedule('media_albums.processing.store_perceptual_hash', self.pk)
+
+    def apply_duplicate_metadata(self):
+        """
+        Copy the metadata of a new image from a photo that has already been
+        processed and whose image has the same content, since the two now
+        share the stored file. Return `True` if such a photo was found.
+        """
+        if not self.content_hash:
+            return False
+
+        values = Photo.objects.filter(
+            content_hash=self.content_hash,
+            image=self.image.name,
+            processing_state=self.PROCESSING_DONE,
+        ).exclude(
+            pk=self.pk,
+        ).values(
+            *self.METADATA_FIELDS
+        ).first()
+
+        if values is None:
+            return False
+
+        for name, value in values.items():
+            setattr(self, name, value)
+
+        self.processing_state = self.PROCESSING_DONE
+
+        return True
+
+    def apply_image_probe(self):
+        """
+        Fill in the metadata of a new image from `image_probe` (the values
+        read from the header of the uploaded file by `ProbedImageField`), so
+        that the image does not have to be read again. Return `True` if that
+        was enough to finish processing the photo, which is the case unless
+        the orientation of a JPEG photo still needs to be corrected.
+        """
+        probe = self.image_probe
+
+        if not probe or (
+            probe['orientation'] != 1 and probe['mime_type'] == 'image/jpeg'
+        ):
+            return False
+
+        for name, value in probe.items():
+            setattr(self, name, value)
+
+        # Computing the hash decodes the image, so it is left to a task that
+        # runs once the photo has been saved.
+        self.perceptual_hash = None
+        self.processing_state = self.PROCESSING_DONE
+
+        return True
+
+    def cover_file_changed(self):
+        # The renditions are generated once the photo has been processed.
+        if self.processing_state == self.PROCESSING_DONE:
+            super(Photo, self).cover_file_changed()
 
     def get_absolute_url(self):
         try:
@@ -372,27 +1235,30 @@ class UserPhoto(Photo):
         null=True,
     )
 
+    class Meta:
+        # Without this, `Upload.Meta` would be inherited, and its indexes
+        # refer to fields that are stored in the parent `Photo` table.
+        ordering = ('ordering', 'name')
+
     def approve(self):
-        p = Photo()
-        for attr, val in self.__dict__.items():
-            if attr[0] != '_' and attr != 'id' and hasattr(p, attr):
-                setattr(p, attr, val)
-        p.album = Album.objects.get_or_create(
-            name=MEDIA_ALBUMS_SETTINGS['user_uploaded_photos_album_name'],
-            defaults={
-                'slug': MEDIA_ALBUMS_SETTINGS[
-                    'user_uploaded_photos_album_slug'
-                ],
-                'visibility': Album.VISIBILITY_PUBLIC,
-            },
-        )[0]
-        p.save()
-        self.delete()
-        return p
+        """
+        Move this photo to the user photos album and return it as a `Photo`.
+        Only the `UserPhoto` row is deleted, so the photo keeps its primary
+        key and image.
+        """
+        from .moderation import approve_user_photos
+
+        approve_user_photos([self.pk])
+        return Photo.objects.get(pk=self.pk)
 
 
 class VideoFile(Upload):
     is_video = True
+    settings_key = 'video_files_enabled'
+    media_type = 'video'
+    count_field_name = 'video_file_count'
+    cover_field_name = 'poster'
+    content_field_name = 'video_file_1'
 
     caption = models.CharField(
         _('caption'),
@@ -494,3 +1360,170 @@ class VideoFile(Upload):
 
         if errors:
             raise ValidationError(errors)
+
+
+class Notification(models.Model):
+    """
+    A moderator notification waiting in the outbox of the `OutboxBackend`
+    notification backend.
+    """
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+    admin_url = models.CharField(_('admin URL'), max_length=500)
+    sent = models.DateTimeField(
+        _('sent'),
+        blank=True,
+        null=True,
+        db_index=True,
+    )
+
+    class Meta:
+        ordering = ('created',)
+        verbose_name = _('notification')
+        verbose_name_plural = _('notifications')
+
+    def __unicode__(self):
+        return self.admin_url
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload of a user photo, whose file is sent in chunks to the
+    chunked upload API and appended to a staging file.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    added_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+    )
+    name = models.CharField(_('name'), max_length=200)
+    caption = models.CharField(_('caption'), max_length=255, blank=True)
+    description = models.TextField(_('description'), blank=True)
+    file_name = models.CharField(_('file name'), max_length=255)
+    size = models.BigIntegerField(_('size'))
+    sha256 = models.CharField(_('SHA-256 checksum'), max_length=64)
+    offset = models.BigIntegerField(_('offset'), default=0)
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+    updated = models.DateTimeField(_('updated'), auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ('created',)
+        verbose_name = _('upload session')
+        verbose_name_plural = _('upload sessions')
+
+    def __unicode__(self):
+        return self.file_name
+
+    @property
+    def staging_path(self):
+        staging_dir = MEDIA_ALBUMS_SETTINGS['upload_staging_dir'] or (
+            os.path.join(tempfile.gettempdir(), 'media_albums_uploads')
+        )
+        return os.path.join(staging_dir, '%s.part' % self.pk.hex)
+
+    @property
+    def complete(self):
+        return self.offset >= self.size
+
+
+class StoredFileManager(models.Manager):
+    def acquire(self, content_hash, field_file):
+        """
+        Return the name of the stored file with the given content, counting
+        one more use of it, along with whether it was saved to storage. If
+        there is no such file yet, save `field_file` to storage and record it
+        as the stored file for that content.
+
+        Call this in the transaction that saves the item that uses the file,
+        and delete a newly saved file if that transaction fails.
+        """
+        with transaction.atomic():
+            used = self.filter(
+                content_hash=content_hash,
+            ).update(
+                ref_count=F('ref_count') + 1,
+            )
+
+            if used:
+                return self.get(content_hash=content_hash).name, False
+
+        field_file.save(field_file.name, field_file.file, save=False)
+
+        try:
+            with transaction.atomic():
+                self.create(content_hash=content_hash, name=field_file.name)
+        except IntegrityError:
+            # The same content was stored by a concurrent upload.
+            field_file.storage.delete(field_file.name)
+            return self.acquire(content_hash, field_file)
+
+        return field_file.name, True
+
+    def release(self, storage, name):
+        """
+        Count one less use of the stored file with the given name, and delete
+        it once it is no longer used. Files that were not stored by content
+        are left alone.
+        """
+        with transaction.atomic():
+            self.filter(
+                name=name,
+            ).update(
+                ref_count=F('ref_count') - 1,
+            )
+            deleted = self.filter(name=name, ref_count__lte=0).delete()[0]
+
+        if not deleted:
+            return
+
+        def delete_file():
+            from .images import delete_image_file
+
+            delete_image_file(storage, name)
+
+        if hasattr(transaction, 'on_commit'):
+            transaction.on_commit(delete_file)
+        else:  # Django 1.8
+            delete_file()
+
+
+class StoredFile(models.Model):
+    """
+    A media file stored under the hash of its content, shared by all of the
+    album items whose files have that content (when the `deduplicate_files`
+    setting is enabled).
+    """
+    content_hash = models.CharField(
+        _('content hash'),
+        max_length=64,
+        unique=True,
+    )
+    name = models.CharField(_('name'), max_length=255, db_index=True)
+    ref_count = models.PositiveIntegerField(_('reference count'), default=1)
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+
+    objects = StoredFileManager()
+
+    class Meta:
+        ordering = ('created',)
+        verbose_name = _('stored file')
+        verbose_name_plural = _('stored files')
+
+    def __unicode__(self):
+        return self.name
+
+    @staticmethod
+    def hash_file(f):
+        """
+        Return the SHA-256 checksum of the content of a file, read a chunk at
+        a time.
+        """
+        checksum = hashlib.sha256()
+
+        for chunk in f.chunks():
+            checksum.update(chunk)
+
+        f.seek(0)
+
+        return checksum.hexdigest()
@@ -0,0 +1,107 @@
+from django.db import connection, transaction
+from django.db.models import Count, F
+
+from .models import Album, Photo, UserPhoto
+from .system_albums import USER_PHOTOS, lock_system_album
+
+# The number of primary keys passed to a single `IN (...)` clause, which
+# keeps the statements below SQLite's limit on the number of parameters.
+APPROVAL_BATCH_SIZE = 500
+
+
+def delete_user_photo_rows(pks):
+    """
+    Delete the `UserPhoto` rows with the given primary keys, leaving their
+    parent `Photo` rows alone. (Deleting through the ORM would also delete
+    the parents.)
+    """
+    qn = connection.ops.quote_name
+    db_table = qn(UserPhoto._meta.db_table)
+    pk_column = qn(UserPhoto._meta.pk.column)
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), APPROVAL_BATCH_SIZE):
+            batch = pks[start:start + APPROVAL_BATCH_SIZE]
+            cursor.execute(
+                'DELETE FROM %s WHERE %s IN (%s)' % (
+                    db_table,
+                    pk_column,
+                    ', '.join(['%s'] * len(batch)),
+                ),
+                batch,
+            )
+
+
+def approve_user_photos(user_photos):
+    """
+    Approve the given `UserPhoto` objects (a queryset or a list of primary
+    keys) by moving them to the user photos album, and return the number of
+    photos that were approved.
+
+    The photos keep their primary keys and images: their `Photo` rows are
+    moved to the album and only their `UserPhoto` rows are deleted, with a
+    handful of set-based statements in a single transaction, so the images
+    are neither copied nor processed again. Approved photos are never the
+    album photo of the user photos album.
+    """
+    if hasattr(user_photos, 'values_list'):
+        user_photos = user_photos.values_list('pk', flat=True)
+
+    with transaction.atomic():
+        album_id = lock_system_album(USER_PHOTOS)
+        pks = list(
+            UserPhoto.objects.select_for_update().filter(
+                pk__in=list(user_photos),
+            ).order_by(
+                'pk',
+            ).values_list(
+                'pk',
+                flat=True,
+            )
+        )
+
+        if not pks:
+            return 0
+
+        old_counts = {}
+
+        for start in range(0, len(pks), APPROVAL_BATCH_SIZE):
+            batch = pks[start:start + APPROVAL_BATCH_SIZE]
+            photos = Photo.objects.filter(pk__in=batch)
+
+            for row in photos.values('album_id').annotate(count=Count('pk')):
+                old_counts[row['album_id']] = (
+                    old_counts.get(row['album_id'], 0) + row['count']
+                )
+
+            Album.objects.filter(
+                cover_item_type=Photo.media_type,
+                cover_item_id__in=batch,
+            ).update(
+                cover_image='',
+                cover_item_type='',
+                cover_item_id=None,
+                cover_renditions='',
+            )
+            photos.update(
+                album_id=album_id,
+                album_photo=False,
+            )
+
+        for old_album_id, count in old_counts.items():
+            Album.objects.filter(
+                pk=old_album_id,
+            ).update(
+                photo_count=F('photo_count') - count,
+            )
+
+        Album.objects.filter(
+            pk=album_id,
+        ).update(
+            photo_count=F('photo_count') + len(pks),
+        )
+        delete_user_photo_rows(pks)
+
+    Album.items_changed(album_id, *old_counts)
+
+    return len(pks)
@@ -0,0 +1,198 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import close_old_connections, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .settings import MEDIA_ALBUMS_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+
+def send_pending_photos_digest(admin_url):
+    """
+    Email the site's staff a single message saying how many user uploaded
+    photos are waiting for approval. Nothing is sent if there are none.
+    """
+    from .models import UserPhoto
+
+    count = UserPhoto.objects.count()
+
+    if not count:
+        return False
+
+    context = {
+        'admin_url': admin_url,
+        'count': count,
+    }
+
+    email_subject = render_to_string(
+        'media_albums/emails/user_photo_uploaded-subject.txt',
+        context,
+    ).strip()
+
+    email_body_text = render_to_string(
+        'media_albums/emails/user_photo_uploaded.txt',
+        context,
+    )
+
+    send_mail(
+        email_subject,
+        email_body_text,
+        settings.DEFAULT_FROM_EMAIL,
+        [settings.DEFAULT_FROM_EMAIL],
+    )
+
+    return True
+
+
+class SyncBackend(object):
+    """
+    Send the notification in the current thread, right away.
+    """
+    wait_for_commit = False
+
+    def notify(self, admin_url):
+        send_pending_photos_digest(admin_url)
+
+
+class ThreadBackend(object):
+    """
+    Send notifications from a background thread in the current process.
+
+    The first notification starts a timer of `notification_digest_interval`
+    seconds, and the notifications that arrive before it runs out are
+    coalesced into a single digest. The timer thread is a daemon thread, so
+    it never keeps the process from exiting; a digest that is still waiting
+    is sent when the process exits instead.
+    """
+    wait_for_commit = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timer = None
+        self.admin_url = None
+        atexit.register(self.flush)
+
+    def notify(self, admin_url):
+        with self.lock:
+            self.admin_url = admin_url
+
+            if self.timer is not None:
+                return
+
+            self.timer = threading.Timer(
+                MEDIA_ALBUMS_SETTINGS['notification_digest_interval'],
+                self.flush,
+            )
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """
+        Send the digest that is waiting, if there is one, right away.
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+            admin_url, self.admin_url = self.admin_url, None
+
+        if admin_url is None:
+            return
+
+        close_old_connections()
+
+        try:
+            send_pending_photos_digest(admin_url)
+        except Exception:
+            logger.exception('Could not send the pending photos digest')
+        finally:
+            close_old_connections()
+
+
+class OutboxBackend(object):
+    """
+    Store notifications in the database. The
+    `media_albums_send_notifications` management command (run periodically,
+    for example by cron) sends a single digest for all of them. The
+    notification is stored in the same transaction as the upload.
+    """
+    wait_for_commit = False
+
+    def notify(self, admin_url):
+        from .models import Notification
+
+        Notification.objects.create(admin_url=admin_url)
+
+
+def send_outbox():
+    """
+    Send a single digest for the notifications in the outbox and mark them as
+    sent. Return the number of notifications that were sent.
+    """
+    from .models import Notification
+
+    with transaction.atomic():
+        notifications = list(
+            Notification.objects.select_for_update().filter(
+                sent__isnull=True,
+            )
+        )
+
+        if not notifications:
+            return 0
+
+        send_pending_photos_digest(notifications[-1].admin_url)
+        Notification.objects.filter(
+            pk__in=[notification.pk for notification in notifications],
+        ).update(
+            sent=timezone.now(),
+        )
+
+    return len(notifications)
+
+
+_backends = {}
+
+
+def get_backend():
+    """
+    Return an instance of the backend named by the `notification_backend`
+    setting, or `None` if notifications are disabled.
+    """
+    backend_path = MEDIA_ALBUMS_SETTINGS['notification_backend']
+
+    if not backend_path:
+        return None
+
+    if backend_path not in _backends:
+        _backends[backend_path] = import_string(backend_path)()
+
+    return _backends[backend_path]
+
+
+def notify_user_photo_uploaded(admin_url):
+    """
+    Let the staff know that a user has uploaded a photo that needs to be
+    approved. Backends that send the notification from another thread are
+    only given it once the current transaction has been committed, so that
+    the new photo is counted.
+    """
+    backend = get_backend()
+
+    if backend is None:
+        return
+
+    if not backend.wait_for_commit:
+        backend.notify(admin_url)
+    elif hasattr(transaction, 'on_commit'):
+        transaction.on_commit(lambda: backend.notify(admin_url))
+    else:  # Django 1.8
+        backend.notify(admin_url)
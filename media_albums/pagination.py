@@ -0,0 +1,66 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimate_count(model, using='default'):
+    """
+    Return the database's estimate of the number of rows in a model's table
+    (from the statistics that PostgreSQL and MySQL keep for the query
+    planner), or `None` if the database does not provide one.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass'
+        params = [connection.ops.quote_name(table)]
+    elif connection.vendor == 'mysql':
+        sql = (
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = %s'
+        )
+        params = [table]
+    else:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that does not count every row of an unfiltered queryset on
+    a large table. Counting the rows of a table with millions of rows takes a
+    full scan on most databases, so the database's estimate of the size of
+    the table is used instead when it is above `exact_count_limit`.
+    Filtered querysets are still counted exactly.
+    """
+    exact_count_limit = 10000
+
+    def estimate_count(self):
+        """
+        Return the estimated number of objects, or `None` if the objects must
+        be counted.
+        """
+        queryset = self.object_list
+
+        if getattr(queryset, 'query', None) is None or queryset.query.where:
+            return None
+
+        return estimate_count(queryset.model, queryset.db)
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate_count()
+
+        if estimate is not None and estimate > self.exact_count_limit:
+            return estimate
+
+        return super(EstimatedCountPaginator, self).count
@@ -0,0 +1,310 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from django.apps import apps
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .settings import MEDIA_ALBUMS_SETTINGS
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without the `futures` backport
+    ThreadPoolExecutor = None
+
+logger = logging.getLogger(__name__)
+
+
+class SyncBackend(object):
+    """
+    Run tasks in the current thread (after the current transaction has been
+    committed).
+    """
+
+    def enqueue(self, task_path, *args):
+        run_task(task_path, *args)
+
+
+class ThreadPoolBackend(object):
+    """
+    Run tasks in a pool of background threads in the current process. If the
+    `concurrent.futures` module is not available, tasks are run in the current
+    thread instead.
+    """
+
+    def __init__(self):
+        self.executor = None
+
+        if ThreadPoolExecutor is not None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=MEDIA_ALBUMS_SETTINGS['processing_workers'],
+            )
+
+    def enqueue(self, task_path, *args):
+        if self.executor is None:
+            run_task(task_path, *args)
+        else:
+            self.executor.submit(run_task_in_thread, task_path, *args)
+
+
+def run_task(task_path, *args):
+    return import_string(task_path)(*args)
+
+
+def run_task_in_thread(task_path, *args):
+    close_old_connections()
+
+    try:
+        return run_task(task_path, *args)
+    except Exception:
+        logger.exception('Task %s%r failed', task_path, args)
+    finally:
+        close_old_connections()
+
+
+_backends = {}
+
+
+def get_backend():
+    """
+    Return an instance of the backend named by the `processing_backend`
+    setting, or `None` if tasks should run immediately.
+    """
+    backend_path = MEDIA_ALBUMS_SETTINGS['processing_backend']
+
+    if not backend_path:
+        return None
+
+    if backend_path not in _backends:
+        _backends[backend_path] = import_string(backend_path)()
+
+    return _backends[backend_path]
+
+
+def schedule(task_path, *args):
+    """
+    Run the task with the given dotted path, passing it `args`, once the
+    current transaction has been committed, so that the task never sees
+    uncommitted rows and never runs while the transaction holds its locks.
+
+    If no `processing_backend` is configured, the task runs in the current
+    thread. Otherwise, it is handed to the backend. Since the task only
+    receives its dotted path and (simple) arguments, backends may hand it to
+    an external task queue.
+    """
+    backend = get_backend()
+
+    if backend is None:
+        def run():
+            run_task(task_path, *args)
+    else:
+        def run():
+            backend.enqueue(task_path, *args)
+
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(run)
+    else:  # Django 1.8
+        run()
+
+
+def process_photo(photo_id):
+    """
+    Correct the orientation of a photo (or record the orientation that could
+    not be corrected without decoding the image) and store its dimensions and
+    EXIF metadata. This task is idempotent: it does nothing unless the photo
+    is still waiting to be processed. The time at which it claims the photo
+    is recorded, so that a photo whose processing was interrupted can be
+    found and claimed again (see `media_albums_process_photos`).
+
+    An image that is stored by its content (see the `deduplicate_files`
+    setting) may be shared by several photos, so it is never transformed in
+    place. Its orientation is corrected in a copy instead, which becomes the
+    photo's image (see `replace_stored_image()`).
+    """
+    from .images import process_image
+    from .models import Photo, StoredFile
+
+    claimed = Photo.objects.filter(
+        pk=photo_id,
+        processing_state=Photo.PROCESSING_PENDING,
+    ).update(
+        processing_state=Photo.PROCESSING_IN_PROGRESS,
+        processing_started=timezone.now(),
+    )
+
+    if not claimed:
+        return
+
+    photo = Photo.objects.get(pk=photo_id)
+    temp_dir = None
+    output_path = None
+
+    if StoredFile.objects.filter(name=photo.image.name).exists():
+        temp_dir = tempfile.mkdtemp()
+        output_path = os.path.join(
+            temp_dir,
+            os.path.basename(photo.image.name),
+        )
+
+    try:
+        try:
+            updates = process_image(photo.image, output_path)
+        except Exception:
+            logger.exception('Could not process photo %s', photo_id)
+            updates = {'processing_state': Photo.PROCESSING_FAILED}
+        else:
+            updates['processing_state'] = Photo.PROCESSING_DONE
+
+        if updates['processing_state'] == Photo.PROCESSING_DONE and (
+            output_path is not None and os.path.exists(output_path)
+        ):
+            replace_stored_image(photo, output_path, updates)
+        else:
+            Photo.objects.filter(
+                pk=photo_id,
+            ).update(
+                **updates
+            )
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+    if updates['processing_state'] == Photo.PROCESSING_DONE:
+        generate_renditions('media_albums', 'photo', photo_id)
+
+
+def replace_stored_image(photo, path, updates):
+    """
+    Store the file at `path` (a corrected copy of the photo's image) by its
+    content, and make it the image of the photo, along with the given field
+    values, unless the photo's image has been replaced in the meantime. The
+    photo stops using the stored file of its previous image.
+    """
+    from django.core.files import File
+
+    from .models import Photo, StoredFile
+
+    old_name = photo.image.name
+    storage = photo.image.storage
+    new_name = None
+    created = False
+
+    with open(path, 'rb') as f:
+        photo.image = File(f, name=os.path.basename(old_name))
+        content_hash = StoredFile.hash_file(photo.image.file)
+
+        try:
+            with transaction.atomic():
+                new_name, created = StoredFile.objects.acquire(
+                    content_hash,
+                    photo.image,
+                )
+                replaced = Photo.objects.filter(
+                    pk=photo.pk,
+                    image=old_name,
+                ).update(
+                    image=new_name,
+                    content_hash=content_hash,
+                    **updates
+                )
+                StoredFile.objects.release(
+                    storage,
+                    old_name if replaced else new_name,
+                )
+        except Exception:
+            if created:
+                storage.delete(new_name)
+
+            raise
+
+
+def store_perceptual_hash(photo_id):
+    """
+    Store the perceptual hash of a photo that did not have to be processed,
+    because all of its metadata was read from the header of its image when it
+    was uploaded.
+    """
+    from .images import perceptual_hash
+    from .models import Photo
+
+    photo = Photo.objects.filter(pk=photo_id).first()
+
+    if photo is None or photo.perceptual_hash is not None:
+        return
+
+    try:
+        photo.image.open('rb')
+
+        try:
+            value = perceptual_hash(photo.image)
+        finally:
+            photo.image.close()
+    except Exception:
+        logger.exception(
+            'Could not compute the perceptual hash of photo %s; run the '
+            'media_albums_backfill_photo_metadata command to try again',
+            photo_id,
+        )
+        return
+
+    Photo.objects.filter(
+        pk=photo_id,
+        image=photo.image.name,
+        perceptual_hash__isnull=True,
+    ).update(
+        perceptual_hash=value,
+    )
+
+
+def generate_renditions(app_label, model_name, pk):
+    """
+    Generate the renditions of the cover file of an album item (the image of
+    a photo, the poster of a video file or the cover art of an audio file) and
+    store their URLs on the item, and on its album if it is the album photo.
+    Return `False` if the renditions could not be generated.
+    """
+    from .images import make_renditions
+    from .models import Album
+
+    model = apps.get_model(app_label, model_name)
+    item = model.objects.filter(pk=pk).first()
+
+    if item is None:
+        return True
+
+    cover_file = item.cover_file()
+
+    try:
+        renditions = json.dumps(make_renditions(cover_file), sort_keys=True)
+    except Exception:
+        logger.exception(
+            'Could not generate the renditions of %s.%s %s; run the '
+            'media_albums_generate_renditions command to try again',
+            app_label,
+            model_name,
+            pk,
+        )
+        return False
+
+    # The cover file may have been replaced in the meantime, in which case
+    # the renditions of the new file will be generated by another task.
+    model.objects.filter(
+        pk=pk,
+        **{item.cover_field_name: cover_file.name}
+    ).update(
+        renditions=renditions,
+    )
+    Album.objects.filter(
+        cover_item_type=item.media_type,
+        cover_item_id=pk,
+        cover_image=cover_file.name,
+    ).update(
+        cover_renditions=renditions,
+    )
+    Album.items_changed(item.album_id)
+
+    return True
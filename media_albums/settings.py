@@ -14,7 +14,35 @@ default_settings = {
     'user_uploaded_photos_login_required': True,
     'user_uploaded_photos_album_name': 'User Photos',
     'user_uploaded_photos_album_slug': 'user-photos',
+    'user_uploaded_photos_max_files': 50,
     'paginate_by': 10,
+    'item_counts_live': False,
+    'processing_backend': None,
+    'processing_workers': 2,
+    'jpegtran_path': 'jpegtran',
+    'renditions': {
+        'thumbnail': {
+            'geometry': '200x200',
+        },
+        'large': {
+            'geometry': '550x550',
+        },
+    },
+    'rendition_workers': 4,
+    'max_image_pixels': 50000000,
+    'max_image_bytes': None,
+    'notification_backend': 'media_albums.notifications.ThreadBackend',
+    'notification_digest_interval': 300,
+    'upload_staging_dir': None,
+    'chunked_upload_max_bytes': 100 * 1024 * 1024,
+    'deduplicate_files': False,
+    'near_duplicate_distance': 6,
+    'conditional_responses': True,
+    'fragment_cache_timeout': 3600,
+    'admin_thumbnail_rendition': None,
+    'admin_items_per_page': 24,
+    'stream_offload_header': None,
+    'stream_offload_prefix': '/protected-media/',
 }
 
 MEDIA_ALBUMS_SETTINGS = {}
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save
+
+from .cache import bump_album_version
+from .models import Album, AudioFile, Photo, UserPhoto, VideoFile
+from .system_albums import forget_system_albums
+
+
+def album_changed(sender, instance, **kwargs):
+    bump_album_version(instance.pk)
+    forget_system_albums()
+
+
+def album_item_changed(sender, instance, **kwargs):
+    # The item may have been moved here from another album.
+    Album.items_changed(instance.album_id, instance._loaded_album_id)
+
+
+def album_item_deleted(sender, instance, **kwargs):
+    instance.update_album_count(instance.album_id, -1)
+    instance.clear_album_cover(instance.album_id)
+    instance.release_files()
+
+
+def connect_signals():
+    post_save.connect(album_changed, sender=Album)
+    post_delete.connect(album_changed, sender=Album)
+
+    for model in (AudioFile, Photo, UserPhoto, VideoFile):
+        post_save.connect(album_item_changed, sender=model)
+        post_delete.connect(album_item_changed, sender=model)
+
+    # Deleting a `UserPhoto` also deletes its parent `Photo`, which sends its
+    # own `post_delete` signal, so `UserPhoto` is left out here to avoid
+    # updating the album twice.
+    for model in (AudioFile, Photo, VideoFile):
+        post_delete.connect(album_item_deleted, sender=model)
@@ -0,0 +1,192 @@
+import hashlib
+import re
+
+from django.http import FileResponse, HttpResponse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlquote
+
+from .settings import MEDIA_ALBUMS_SETTINGS
+
+BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile(object):
+    """
+    A file-like object that reads at most `length` bytes of a file, starting
+    at byte `start`, which `FileResponse` streams a block at a time.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(value, size):
+    """
+    Return the first and last byte of the single byte range in a `Range`
+    header value, clipped to a file of the given size. Return `None` if the
+    header is missing, is not valid or asks for several ranges (in which case
+    the whole file is sent), or `False` if the range is not satisfiable.
+    """
+    match = RANGE_RE.match((value or '').replace(' ', ''))
+
+    if match is None:
+        return None
+
+    first, last = match.groups()
+
+    if not first and not last:
+        return None
+
+    if not first:
+        # A suffix range: the last `last` bytes of the file.
+        length = int(last)
+
+        if length == 0 or size == 0:
+            return False
+
+        return max(size - length, 0), size - 1
+
+    first = int(first)
+
+    if last and int(last) < first:
+        return None
+
+    if first >= size:
+        return False
+
+    last = int(last) if last else size - 1
+
+    return first, min(last, size - 1)
+
+
+def file_etag(field_file):
+    # A stored file is never overwritten in place (a new upload gets a new
+    # name), so its name and size identify its content.
+    return '"%s"' % hashlib.md5(force_bytes('%s:%d' % (
+        field_file.name,
+        field_file.size,
+    ))).hexdigest()
+
+
+def strip_weak_prefix(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def etag_matches(value, etag):
+    # `If-None-Match` uses the weak comparison, so a weak version of the
+    # ETag (as sent back for a response that was compressed) matches too.
+    return value is not None and (
+        value.strip() == '*' or
+        etag in [strip_weak_prefix(tag) for tag in value.split(',')]
+    )
+
+
+def offload_response(field_file, content_type):
+    """
+    Return a response that asks the front-end server to send the file, or
+    `None` if the `stream_offload_header` setting is not set (or if it is an
+    `X-Sendfile` style header, which needs a local path, and the file's
+    storage has none).
+    """
+    header = MEDIA_ALBUMS_SETTINGS['stream_offload_header']
+
+    if not header:
+        return None
+
+    if header.lower() == 'x-accel-redirect':
+        value = urlquote(
+            MEDIA_ALBUMS_SETTINGS['stream_offload_prefix'] + field_file.name
+        )
+    else:
+        try:
+            value = field_file.path
+        except NotImplementedError:
+            # The file is not stored on the local filesystem, so the
+            # front-end server cannot send it.
+            return None
+
+    response = HttpResponse(content_type=content_type)
+    response[header] = value
+
+    return response
+
+
+def stream_file(request, field_file, content_type):
+    """
+    Return a response that sends the given file, or the byte range of it that
+    the request asks for, a block at a time.
+
+    Conditional requests (`If-None-Match`) and `If-Range` are answered with
+    the file's ETag. When the `stream_offload_header` setting is set, the
+    transfer (including any range) is handed to the front-end server instead.
+    """
+    response = offload_response(field_file, content_type)
+
+    if response is not None:
+        return response
+
+    size = field_file.size
+    etag = file_etag(field_file)
+
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    byte_range = None
+
+    if request.method == 'GET':
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+        # A client with an outdated copy gets the whole file, instead of a
+        # piece of a different file. `If-Range` uses the strong comparison,
+        # so only the exact ETag allows a partial response: a weak ETag or a
+        # date (the file has no `Last-Modified`) gets the whole file.
+        if_range = request.META.get('HTTP_IF_RANGE')
+
+        if if_range is not None and if_range.strip() != etag:
+            byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+    else:
+        field_file.open('rb')
+
+        if byte_range is None:
+            # Streaming the file object itself lets the WSGI server use
+            # `wsgi.file_wrapper` (and so `sendfile()`) where it can.
+            response = FileResponse(field_file.file, content_type=content_type)
+            response['Content-Length'] = str(size)
+        else:
+            first, last = byte_range
+            response = FileResponse(
+                RangeFile(field_file.file, first, last - first + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response.block_size = BLOCK_SIZE
+            response['Content-Length'] = str(last - first + 1)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+
+    return response
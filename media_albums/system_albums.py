@@ -0,0 +1,145 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.encoding import force_bytes
+
+from .settings import MEDIA_ALBUMS_SETTINGS
+
+PENDING_APPROVAL = 'pending-approval'
+USER_PHOTOS = 'user-photos'
+
+# How long (in seconds) each process remembers a system album without asking
+# the shared cache. Albums are only invalidated in the process that saved or
+# deleted them, so this bounds how long other processes can use a stale ID.
+LOCAL_TIMEOUT = 60
+
+# How long (in seconds) Django's cache remembers a system album.
+SHARED_TIMEOUT = 3600
+
+_album_ids = {}
+
+
+def get_system_album_lookups():
+    """
+    Return a dictionary mapping the name of each system album (an album that
+    the app creates itself) to the `get_or_create()` lookup and defaults that
+    find or create it.
+    """
+    from .models import Album
+
+    return {
+        PENDING_APPROVAL: (
+            {
+                'name': 'User Uploaded Photos Pending Approval',
+                'slug': 'user-uploaded-photos-pending-approval',
+                'visibility': Album.VISIBILITY_PRIVATE,
+                'ordering': 999,
+            },
+            {},
+        ),
+        USER_PHOTOS: (
+            {
+                'name': MEDIA_ALBUMS_SETTINGS[
+                    'user_uploaded_photos_album_name'
+                ],
+            },
+            {
+                'slug': MEDIA_ALBUMS_SETTINGS[
+                    'user_uploaded_photos_album_slug'
+                ],
+                'visibility': Album.VISIBILITY_PUBLIC,
+            },
+        ),
+    }
+
+
+def system_album_key(name, lookup):
+    # The lookup is part of the key, so changing the settings never returns
+    # the album that was found with the old settings.
+    digest = hashlib.md5(force_bytes(repr(sorted(lookup.items()))))
+    return 'media_albums:system_album:%s:%s' % (name, digest.hexdigest())
+
+
+def get_system_album_id(name):
+    """
+    Return the ID of the system album with the given name (`PENDING_APPROVAL`
+    or `USER_PHOTOS`), creating the album if it does not exist yet.
+
+    The ID is remembered by the current process and by Django's cache, so the
+    database is normally not queried at all. `get_or_create()` retries the
+    lookup when a concurrent request creates the album first. An ID read from
+    the database is only remembered once the current transaction has been
+    committed, so a transaction that is rolled back after creating the album
+    never leaves the ID of a missing album behind.
+
+    The album may still have been deleted by another process since its ID was
+    remembered, so use `lock_system_album()` to add items to it.
+    """
+    from .models import Album
+
+    lookup, defaults = get_system_album_lookups()[name]
+    key = system_album_key(name, lookup)
+    now = time.time()
+    album_id, expires = _album_ids.get(key, (None, 0))
+
+    if album_id is not None and expires > now:
+        return album_id
+
+    album_id = cache.get(key)
+
+    if album_id is not None:
+        _album_ids[key] = (album_id, now + LOCAL_TIMEOUT)
+        return album_id
+
+    album_id = Album.objects.get_or_create(
+        defaults=defaults,
+        **lookup
+    )[0].pk
+
+    def remember():
+        cache.set(key, album_id, SHARED_TIMEOUT)
+        _album_ids[key] = (album_id, time.time() + LOCAL_TIMEOUT)
+
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(remember)
+    else:  # Django 1.8
+        remember()
+
+    return album_id
+
+
+def lock_system_album(name):
+    """
+    Return the ID of the system album with the given name, like
+    `get_system_album_id()`, after making sure that the album still exists.
+    The album is locked until the end of the current transaction, so that it
+    cannot be deleted before the items that are added to it are saved.
+
+    If the remembered album no longer exists, it is forgotten and looked up
+    (or created) again, once.
+    """
+    from .models import Album
+
+    albums = Album.objects.select_for_update()
+    album_id = get_system_album_id(name)
+
+    if not albums.filter(pk=album_id).exists():
+        forget_system_albums()
+        album_id = get_system_album_id(name)
+        albums.filter(pk=album_id).exists()
+
+    return album_id
+
+
+def forget_system_albums():
+    """
+    Forget the IDs of the system albums, in this process and in Django's
+    cache. This is called whenever an album is saved or deleted.
+    """
+    _album_ids.clear()
+    cache.delete_many([
+        system_album_key(name, lookup)
+        for name, (lookup, defaults) in get_system_album_lookups().items()
+    ])
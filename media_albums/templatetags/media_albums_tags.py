@@ -48,6 +48,18 @@ def get_mime_type(obj=None, field=None):
     return mime_type
 
 
+@register.filter
+def rendition(obj, name):
+    """
+    Return the pre-generated rendition with the given name of an album item's
+    image, or of an album's cover image, or `None` if it is not available.
+    """
+    try:
+        return obj.get_rendition(name)
+    except AttributeError:
+        return None
+
+
 @register.assignment_tag
 def get_album_items(album_name=None):
     if album_name:
@@ -66,26 +78,4 @@ def get_album_items(album_name=None):
 @register.assignment_tag
 def next_previous_object(media_albums_object):
     mao = media_albums_object
-    album = mao.album
-    album_items = album.items
-    total_album_items = len(album_items)
-    current_item_position = album_items.index(mao)
-
-    if current_item_position + 1 < total_album_items:
-        next_item_position = current_item_position + 1
-    else:
-        next_item_position = 0
-
-    if current_item_position - 1 >= 0:
-        previous_item_position = current_item_position - 1
-    else:
-        previous_item_position = total_album_items - 1
-
-    return {
-        'next': album_items[next_item_position],
-        'previous': album_items[previous_item_position],
-        'current_item_position': current_item_position + 1,
-        'next_item_position': next_item_position + 1,
-        'previous_item_position': previous_item_position + 1,
-        'total_album_items': total_album_items,
-    }
+    return mao.album.lazy_items.neighbours(mao)
@@ -0,0 +1,159 @@
+import errno
+import hashlib
+import os
+import re
+
+from django.core.files.uploadedfile import UploadedFile
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without the `futures` backport
+    ThreadPoolExecutor = None
+
+CHUNK_SIZE = 64 * 1024
+
+# The number of uploaded files that are saved to storage at a time.
+STORE_WORKERS = 4
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    A completed chunked upload, passed to forms like any other uploaded file.
+
+    Like Django's `TemporaryUploadedFile`, it has a `temporary_file_path()`,
+    so the image field validates it without reading it into memory and the
+    file system storage moves it into place instead of copying it.
+    """
+
+    def __init__(self, path, name, size):
+        super(StagedUploadedFile, self).__init__(
+            open(path, 'rb'),
+            name=name,
+            size=size,
+        )
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        try:
+            return self.file.close()
+        except (IOError, OSError):
+            # The file has already been moved into storage.
+            pass
+
+
+def parse_content_range(value):
+    """
+    Return the first byte, last byte and total size in a `Content-Range`
+    header value, or `None` if it is not valid.
+    """
+    match = CONTENT_RANGE_RE.match(value or '')
+
+    if match is None:
+        return None
+
+    start, end, total = [int(group) for group in match.groups()]
+
+    if end < start or end >= total:
+        return None
+
+    return start, end, total
+
+
+def write_chunk(path, stream, start, length):
+    """
+    Copy up to `length` bytes from `stream` into the file at `path`, starting
+    at byte `start`, a small buffer at a time. Return the number of bytes
+    written, which is less than `length` if the stream ended early.
+    """
+    directory = os.path.dirname(path)
+
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    mode = 'r+b' if os.path.exists(path) else 'wb'
+    written = 0
+
+    with open(path, mode) as staging_file:
+        staging_file.seek(start)
+
+        while written < length:
+            data = stream.read(min(CHUNK_SIZE, length - written))
+
+            if not data:
+                break
+
+            staging_file.write(data)
+            written += len(data)
+
+    return written
+
+
+def file_sha256(path):
+    checksum = hashlib.sha256()
+
+    with open(path, 'rb') as staged_file:
+        for data in iter(lambda: staged_file.read(CHUNK_SIZE), b''):
+            checksum.update(data)
+
+    return checksum.hexdigest()
+
+
+def remove_staging_file(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def store_files(field, files, instance=None):
+    """
+    Save the given uploaded files to the storage of a file field, a few at a
+    time, and return the name each one was stored under. If any of the files
+    cannot be saved, the others are deleted again before the error is raised.
+    """
+    def store(uploaded_file):
+        name = field.generate_filename(instance, uploaded_file.name)
+        return field.storage.save(name, uploaded_file)
+
+    if ThreadPoolExecutor is None or len(files) <= 1:
+        names = []
+
+        try:
+            for uploaded_file in files:
+                names.append(store(uploaded_file))
+        except Exception:
+            delete_files(field.storage, names)
+            raise
+
+        return names
+
+    with ThreadPoolExecutor(
+        max_workers=min(STORE_WORKERS, len(files)),
+    ) as executor:
+        futures = [
+            executor.submit(store, uploaded_file) for uploaded_file in files
+        ]
+
+    failed = [future for future in futures if future.exception()]
+
+    if failed:
+        delete_files(field.storage, [
+            future.result() for future in futures if not future.exception()
+        ])
+        failed[0].result()
+
+    return [future.result() for future in futures]
+
+
+def delete_files(storage, names):
+    for name in names:
+        storage.delete(name)
@@ -1,7 +1,9 @@
 from django.conf.urls import url
 
 from .views import (
-    AlbumItemDetailView, AlbumListView, UserPhotoUploadView,
+    AlbumItemDetailView, AlbumItemFileView, AlbumListView,
+    UserPhotoChunkedUploadSessionView, UserPhotoChunkedUploadView,
+    UserPhotoMultipleUploadView, UserPhotoUploadView,
     UserPhotoUploadSuccessView, show_album
 )
 
@@ -12,6 +14,11 @@ urlpatterns = [
         AlbumItemDetailView.as_view(item_type='audio'),
         name='show-audio',
     ),
+    url(
+        r'^audio/(?P<pk>\d+)/(?P<field_name>audio_file_[12])/$',
+        AlbumItemFileView.as_view(item_type='audio'),
+        name='stream-audio',
+    ),
     url(
         r'^photo/(?P<pk>\d+)/$',
         AlbumItemDetailView.as_view(item_type='photo'),
@@ -22,6 +29,21 @@ urlpatterns = [
         UserPhotoUploadView.as_view(),
         name='user-photo-upload',
     ),
+    url(
+        r'^add/multiple/$',
+        UserPhotoMultipleUploadView.as_view(),
+        name='user-photo-multiple-upload',
+    ),
+    url(
+        r'^add/uploads/$',
+        UserPhotoChunkedUploadView.as_view(),
+        name='user-photo-chunked-upload',
+    ),
+    url(
+        r'^add/uploads/(?P<pk>[0-9a-f-]+)/$',
+        UserPhotoChunkedUploadSessionView.as_view(),
+        name='user-photo-chunked-upload-session',
+    ),
     url(
         r'^add/success/$',
         UserPhotoUploadSuccessView.as_view(),
@@ -32,6 +54,11 @@ urlpatterns = [
         AlbumItemDetailView.as_view(item_type='video'),
         name='show-video',
     ),
+    url(
+        r'^video/(?P<pk>\d+)/(?P<field_name>video_file_[12])/$',
+        AlbumItemFileView.as_view(item_type='video'),
+        name='stream-video',
+    ),
     url(
         r'^(?P<album_slug>[-\w]+)/$',
         show_album,
@@ -1,17 +1,95 @@
-from django.conf import settings
+import hashlib
+import os
+
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
 from django.core.paginator import Paginator, InvalidPage
 from django.core.urlresolvers import reverse, reverse_lazy
-from django.http import Http404, HttpResponseRedirect
-from django.shortcuts import render
-from django.template.loader import render_to_string
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import (
+    Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+)
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
-from django.views.generic import DetailView, FormView, ListView, TemplateView
-
-from .models import Album, AudioFile, Photo, VideoFile
-from .forms import UserPhotoForm
+from django.utils.encoding import force_bytes
+from django.views.decorators.http import condition
+from django.views.generic import (
+    DetailView, FormView, ListView, TemplateView, View
+)
+
+from .models import (
+    Album, AudioFile, Photo, UploadSession, UserPhoto, VideoFile
+)
+from .forms import (
+    UploadSessionForm, UserPhotoForm, UserPhotoMultipleUploadForm
+)
+from .cache import get_album_version
+from .notifications import notify_user_photo_uploaded
 from .settings import MEDIA_ALBUMS_SETTINGS
+from .streaming import stream_file
+from .system_albums import PENDING_APPROVAL, lock_system_album
+from .templatetags.media_albums_tags import get_mime_type
+from .uploads import (
+    StagedUploadedFile, delete_files, file_sha256, parse_content_range,
+    remove_staging_file, store_files, write_chunk
+)
+
+
+def make_cache_key(request, *parts):
+    """
+    Return a key (used as an ETag and in the keys of cached template
+    fragments) for a page that depends on the given values, the settings
+    that affect the page, and the role of the user viewing it, since staff
+    members see private albums and the templates may show whether the user
+    is logged in.
+    """
+    if request.user.is_staff:
+        role = 'staff'
+    elif request.user.is_authenticated():
+        role = 'user'
+    else:
+        role = 'anonymous'
+
+    parts += (
+        role,
+        MEDIA_ALBUMS_SETTINGS['paginate_by'],
+        MEDIA_ALBUMS_SETTINGS['photos_enabled'],
+        MEDIA_ALBUMS_SETTINGS['video_files_enabled'],
+        MEDIA_ALBUMS_SETTINGS['audio_files_enabled'],
+    )
+
+    return hashlib.md5(force_bytes(repr(parts))).hexdigest()
+
+
+def conditional(get_validators):
+    """
+    Return a decorator that answers conditional GET and HEAD requests to a
+    view with "304 Not Modified" responses, without running the view, when
+    the page has not changed.
+
+    `get_validators()` is called (once per request) with the view's
+    arguments, and returns the ETag and last modified time of the page, or
+    `None` if the page should not be cached (for example, because it does not
+    exist). It is not called at all if the `conditional_responses` setting is
+    disabled.
+    """
+    def get(request, *args, **kwargs):
+        if not hasattr(request, '_media_albums_validators'):
+            validators = None
+
+            if MEDIA_ALBUMS_SETTINGS['conditional_responses']:
+                validators = get_validators(request, *args, **kwargs)
+
+            request._media_albums_validators = validators or (None, None)
+
+        return request._media_albums_validators
+
+    return condition(
+        etag_func=lambda *args, **kwargs: get(*args, **kwargs)[0],
+        last_modified_func=lambda *args, **kwargs: get(*args, **kwargs)[1],
+    )
 
 
 class AlbumItemDetailView(DetailView):
@@ -38,6 +116,37 @@ class AlbumItemDetailView(DetailView):
 
         raise Http404
 
+    def get(self, request, *args, **kwargs):
+        view = super(AlbumItemDetailView, self).get
+        return conditional(self.get_validators)(view)(
+            request,
+            *args,
+            **kwargs
+        )
+
+    def get_validators(self, request, *args, **kwargs):
+        # The page also shows the album and links to the neighbouring items,
+        # so it changes whenever the album does.
+        item = self.get_queryset().filter(
+            pk=kwargs['pk'],
+        ).values(
+            'album_id',
+            'album__updated',
+        ).first()
+
+        if item is None:
+            return None
+
+        return (
+            make_cache_key(
+                request,
+                self.item_type,
+                kwargs['pk'],
+                get_album_version(item['album_id']),
+            ),
+            item['album__updated'],
+        )
+
     def get_queryset(self):
         qs = self.model.objects.select_related('album').all()
 
@@ -49,19 +158,94 @@ class AlbumItemDetailView(DetailView):
         return qs
 
 
+class AlbumItemFileView(AlbumItemDetailView):
+    """
+    Send one of the audio or video files of an item, to the visitors who can
+    see the item's page, with support for range requests so that players can
+    seek without downloading the whole file.
+    """
+
+    def get(self, request, *args, **kwargs):
+        item = self.get_object()
+        field_name = kwargs['field_name']
+        field_file = getattr(item, field_name)
+
+        if not field_file or not field_file.storage.exists(field_file.name):
+            raise Http404
+
+        response = stream_file(
+            request,
+            field_file,
+            get_mime_type(item, field_name) or 'application/octet-stream',
+        )
+
+        if item.album.visibility == Album.VISIBILITY_PRIVATE:
+            patch_cache_control(response, private=True)
+
+        return response
+
+
 class AlbumListView(ListView):
     queryset = Album.objects.filter(
         visibility=Album.VISIBILITY_PUBLIC,
     )
 
+    def get(self, request, *args, **kwargs):
+        view = super(AlbumListView, self).get
+        return conditional(self.get_validators)(view)(
+            request,
+            *args,
+            **kwargs
+        )
+
+    def get_validators(self, request, *args, **kwargs):
+        albums = self.get_albums_state()
+
+        return (
+            make_cache_key(
+                request,
+                albums['count'],
+                albums['updated'],
+                request.GET.get('page'),
+            ),
+            albums['updated'],
+        )
+
+    def get_albums_state(self):
+        # Adding, changing or removing an album changes the latest update
+        # time or the number of albums (or both).
+        if not hasattr(self, 'albums_state'):
+            self.albums_state = self.get_queryset().aggregate(
+                count=Count('pk'),
+                updated=Max('updated'),
+            )
+
+        return self.albums_state
+
+    def get_context_data(self, **kwargs):
+        context = super(AlbumListView, self).get_context_data(**kwargs)
+        albums = self.get_albums_state()
+        context['fragment_cache_key'] = make_cache_key(
+            self.request,
+            albums['count'],
+            albums['updated'],
+            context['page_obj'] and context['page_obj'].number,
+        )
+        context['fragment_cache_timeout'] = MEDIA_ALBUMS_SETTINGS[
+            'fragment_cache_timeout'
+        ]
+
+        return context
+
     def get_paginate_by(self, queryset):
         return MEDIA_ALBUMS_SETTINGS['paginate_by']
 
 
-class UserPhotoUploadView(FormView):
-    form_class = UserPhotoForm
-    success_url = reverse_lazy('user-photo-upload-success')
-    template_name = 'media_albums/upload.html'
+class UserUploadsMixin(object):
+    """
+    Only allow the view to be used if user uploaded photos are enabled (and
+    the user is logged in, if that is required).
+    """
 
     def dispatch(self, request, *args, **kwargs):
         if not MEDIA_ALBUMS_SETTINGS['user_uploaded_photos_enabled']:
@@ -74,7 +258,7 @@ class UserPhotoUploadView(FormView):
                 **kwargs
             )
 
-        return super(UserPhotoUploadView, self).dispatch(
+        return super(UserUploadsMixin, self).dispatch(
             request,
             *args,
             **kwargs
@@ -82,103 +266,308 @@ class UserPhotoUploadView(FormView):
 
     @method_decorator(login_required)
     def dispatch_login_required(self, request, *args, **kwargs):
-        return super(UserPhotoUploadView, self).dispatch(
+        return super(UserUploadsMixin, self).dispatch(
             request,
             *args,
             **kwargs
         )
 
-    def form_valid(self, form):
-        u_photo = form.save(commit=False)
 
-        if self.request.user.is_authenticated():
-            u_photo.added_by = self.request.user
-
-        u_photo.album = Album.objects.get_or_create(
-            name='User Uploaded Photos Pending Approval',
-            slug='user-uploaded-photos-pending-approval',
-            visibility=Album.VISIBILITY_PRIVATE,
-            ordering=999,
-        )[0]
+def save_user_photo(request, u_photo):
+    """
+    Save a photo uploaded by a user to the album of photos pending approval
+    and let the staff know about it.
+    """
+    if request.user.is_authenticated():
+        u_photo.added_by = request.user
 
+    with transaction.atomic():
+        u_photo.album_id = lock_system_album(PENDING_APPROVAL)
         u_photo.save()
 
-        email_subject_context = {}
+    notify_user_photo_uploaded(
+        request.build_absolute_uri(
+            reverse('admin:media_albums_userphoto_changelist')
+        )
+    )
 
-        email_subject = render_to_string(
-            'media_albums/emails/user_photo_uploaded-subject.txt',
-            email_subject_context,
-        ).strip()
 
-        email_body_context = {
-            'admin_url': self.request.build_absolute_uri(
-                reverse('admin:media_albums_userphoto_changelist')
-            ),
-        }
+def upload_session_url(upload):
+    return reverse('user-photo-chunked-upload-session', args=[upload.pk])
 
-        email_body_text = render_to_string(
-            'media_albums/emails/user_photo_uploaded.txt',
-            email_body_context,
-        )
 
-        send_mail(
-            email_subject,
-            email_body_text,
-            settings.DEFAULT_FROM_EMAIL,
-            [settings.DEFAULT_FROM_EMAIL],
+def upload_status_response(upload, status=200):
+    response = JsonResponse({
+        'url': upload_session_url(upload),
+        'offset': upload.offset,
+        'size': upload.size,
+        'complete': False,
+    }, status=status)
+
+    if upload.offset:
+        response['Range'] = 'bytes=0-%d' % (upload.offset - 1)
+
+    return response
+
+
+class UserPhotoUploadView(UserUploadsMixin, FormView):
+    form_class = UserPhotoForm
+    success_url = reverse_lazy('user-photo-upload-success')
+    template_name = 'media_albums/upload.html'
+
+    def form_valid(self, form):
+        save_user_photo(self.request, form.save(commit=False))
+
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class UserPhotoMultipleUploadView(UserUploadsMixin, FormView):
+    """
+    Upload several photos at once. The files are saved to storage
+    concurrently and the photos are created in a single transaction, which
+    updates the album's number of photos once. If the transaction fails, the
+    saved files are deleted again. The photos are processed once it has been
+    committed, and the staff are notified once for the whole batch.
+    """
+    form_class = UserPhotoMultipleUploadForm
+    success_url = reverse_lazy('user-photo-upload-success')
+    template_name = 'media_albums/upload-multiple.html'
+
+    def form_valid(self, form):
+        images = form.cleaned_data['images']
+        field = UserPhoto._meta.get_field('image')
+        stored_names = []
+        added_by = None
+
+        if self.request.user.is_authenticated():
+            added_by = self.request.user
+
+        try:
+            with transaction.atomic():
+                if MEDIA_ALBUMS_SETTINGS['deduplicate_files']:
+                    # Each file is stored by its content when its photo is
+                    # saved, so that a file that has been uploaded before is
+                    # shared instead of being saved again.
+                    files = images
+                else:
+                    files = stored_names = store_files(field, images)
+
+                album_id = lock_system_album(PENDING_APPROVAL)
+                user_photos = []
+
+                for image, f in zip(images, files):
+                    user_photo = UserPhoto(
+                        album_id=album_id,
+                        added_by=added_by,
+                        name=os.path.splitext(image.name)[0][:200],
+                        caption=form.cleaned_data['caption'],
+                        description=form.cleaned_data['description'],
+                        image=f,
+                    )
+                    user_photo.image_probe = image.probe
+                    user_photos.append(user_photo)
+
+                UserPhoto.save_new_items(user_photos)
+        except Exception:
+            delete_files(field.storage, stored_names)
+            raise
+
+        notify_user_photo_uploaded(
+            self.request.build_absolute_uri(
+                reverse('admin:media_albums_userphoto_changelist')
+            )
         )
 
         return HttpResponseRedirect(self.get_success_url())
 
 
-class UserPhotoUploadSuccessView(TemplateView):
+class UserPhotoUploadSuccessView(UserUploadsMixin, TemplateView):
     template_name = 'media_albums/upload-success.html'
 
-    def dispatch(self, request, *args, **kwargs):
-        if not MEDIA_ALBUMS_SETTINGS['user_uploaded_photos_enabled']:
+
+class UserPhotoChunkedUploadView(UserUploadsMixin, View):
+    """
+    Start a resumable upload. The response's `Location` header is the URL
+    that the chunks of the file are sent to.
+    """
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        form = UploadSessionForm(request.POST)
+
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        upload = form.save(commit=False)
+
+        if request.user.is_authenticated():
+            upload.added_by = request.user
+
+        upload.save()
+
+        response = upload_status_response(upload, status=201)
+        response['Location'] = upload_session_url(upload)
+
+        return response
+
+
+class UserPhotoChunkedUploadSessionView(UserUploadsMixin, View):
+    """
+    Send a chunk of a resumable upload with a `PATCH` (or `PUT`) request
+    that has a `Content-Range` header, find out how much of the file has been
+    received with a `GET` request, or abandon the upload with a `DELETE`
+    request.
+
+    The chunks are streamed to a staging file, so memory use does not depend
+    on the size of the file. Once the whole file has been received, its
+    checksum is verified and the photo is created.
+    """
+    http_method_names = ['get', 'head', 'patch', 'put', 'delete']
+
+    def get_upload(self, queryset=UploadSession.objects):
+        upload = get_object_or_404(queryset, pk=self.kwargs['pk'])
+
+        if upload.added_by_id is not None and (
+            upload.added_by_id != self.request.user.pk
+        ):
             raise Http404
 
-        if MEDIA_ALBUMS_SETTINGS['user_uploaded_photos_login_required']:
-            return self.dispatch_login_required(
+        return upload
+
+    def get(self, request, *args, **kwargs):
+        return upload_status_response(self.get_upload())
+
+    def delete(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        remove_staging_file(upload.staging_path)
+        upload.delete()
+
+        return HttpResponse(status=204)
+
+    def patch(self, request, *args, **kwargs):
+        content_range = parse_content_range(
+            request.META.get('HTTP_CONTENT_RANGE')
+        )
+
+        # The upload is locked while the chunk is written, so a concurrent
+        # request for the same offset waits, and is then refused, instead of
+        # writing over the chunk.
+        with transaction.atomic():
+            upload = self.get_upload(
+                UploadSession.objects.select_for_update()
+            )
+
+            if content_range is None or content_range[2] != upload.size:
+                return JsonResponse(
+                    {'errors': {'Content-Range': ['Invalid Content-Range.']}},
+                    status=400,
+                )
+
+            start, end, total = content_range
+
+            if start != upload.offset:
+                return upload_status_response(upload, status=409)
+
+            upload.offset = start + write_chunk(
+                upload.staging_path,
                 request,
-                *args,
-                **kwargs
+                start,
+                end - start + 1,
             )
+            upload.updated = timezone.now()
+            upload.save(update_fields=['offset', 'updated'])
 
-        return super(UserPhotoUploadSuccessView, self).dispatch(
-            request,
-            *args,
-            **kwargs
-        )
+        if not upload.complete:
+            return upload_status_response(upload)
 
-    @method_decorator(login_required)
-    def dispatch_login_required(self, request, *args, **kwargs):
-        return super(UserPhotoUploadSuccessView, self).dispatch(
-            request,
-            *args,
-            **kwargs
-        )
+        return self.complete(upload)
 
+    put = patch
 
-def show_album(
-    request, album_slug, template_name='media_albums/album_detail.html'
-):
-    album = Album.objects.filter(
-        slug=album_slug,
-    )
+    def complete(self, upload):
+        path = upload.staging_path
+
+        if file_sha256(path) != upload.sha256:
+            # Start over: the file was corrupted on the way.
+            remove_staging_file(path)
+            UploadSession.objects.filter(pk=upload.pk).update(offset=0)
+
+            return JsonResponse(
+                {'errors': {'sha256': ['The checksum does not match.']}},
+                status=400,
+            )
+
+        image = StagedUploadedFile(path, upload.file_name, upload.size)
+
+        try:
+            form = UserPhotoForm({
+                'name': upload.name,
+                'caption': upload.caption,
+                'description': upload.description,
+            }, {
+                'image': image,
+            })
+
+            if form.is_valid():
+                save_user_photo(self.request, form.save(commit=False))
+        finally:
+            image.close()
+            remove_staging_file(path)
+            upload.delete()
+
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        return JsonResponse({
+            'complete': True,
+            'success_url': reverse('user-photo-upload-success'),
+        }, status=201)
+
+
+def get_visible_albums(request):
+    albums = Album.objects.all()
 
     if not request.user.is_staff:
-        album = album.exclude(
+        albums = albums.exclude(
             visibility=Album.VISIBILITY_PRIVATE,
         )
 
+    return albums
+
+
+def get_album_validators(request, album_slug, **kwargs):
+    album = get_visible_albums(request).filter(
+        slug=album_slug,
+    ).values(
+        'pk',
+        'updated',
+    ).first()
+
+    if album is None:
+        return None
+
+    return (
+        make_cache_key(
+            request,
+            album['pk'],
+            get_album_version(album['pk']),
+            request.GET.get('page'),
+        ),
+        album['updated'],
+    )
+
+
+@conditional(get_album_validators)
+def show_album(
+    request, album_slug, template_name='media_albums/album_detail.html'
+):
     try:
-        album = album.get()
+        album = get_visible_albums(request).get(slug=album_slug)
     except Album.DoesNotExist:
         raise Http404
 
     paginator = Paginator(
-        album.items,
+        album.lazy_items,
         MEDIA_ALBUMS_SETTINGS['paginate_by'],
         allow_empty_first_page=True
     )
@@ -195,8 +584,19 @@ def show_album(
     except InvalidPage:
         raise Http404
 
+    # The items are only loaded if the cached fragment of the template that
+    # shows them has expired.
     context_data = {
         'album': album,
+        'fragment_cache_key': make_cache_key(
+            request,
+            album.pk,
+            get_album_version(album.pk),
+            items.number,
+        ),
+        'fragment_cache_timeout': MEDIA_ALBUMS_SETTINGS[
+            'fragment_cache_timeout'
+        ],
         'items': items.object_list,
         'is_paginated': paginator.num_pages > 1,
         'page': items.number,
@@ -1,18 +1,13 @@
-try:
-    from importlib import reload
-except ImportError:
-    pass
+import json
 
 from django.contrib.auth import get_user_model
-from django.core.urlresolvers import NoReverseMatch, clear_url_caches, reverse
+from django.core.urlresolvers import NoReverseMatch, reverse
 from django.test import TestCase
 from django.test.utils import override_settings
 
-from media_albums.models import Album, UserPhoto
+from media_albums.models import Album, Photo, UserPhoto
 
-from media_albums import admin as media_albums_admin
-from media_albums.settings import compute_settings
-from . import urls as test_urls
+from .utils import reload_admin
 
 
 class ViewsTest(TestCase):
@@ -21,10 +16,7 @@ class ViewsTest(TestCase):
     ]
 
     def reload(self):
-        compute_settings()
-        reload(media_albums_admin)
-        clear_url_caches()
-        reload(test_urls)
+        reload_admin()
 
     def setUp(self):
         credentials = {
@@ -76,6 +68,88 @@ class ViewsTest(TestCase):
             response = self.client.get(url)
             self.assertEqual(response.status_code, 200)
 
+    @override_settings(MEDIA_ALBUMS={
+        'admin_items_per_page': 4,
+    })
+    def test_album_media_manager(self):
+        self.reload()
+
+        album = Album.objects.get(slug='cat-photos')
+        other_album = Album.objects.exclude(pk=album.pk).first()
+        other_count = other_album.photo_count
+
+        # Existing albums have no inlines, only a link to the media manager.
+        response = self.client.get(
+            reverse('admin:media_albums_album_change', args=[album.pk])
+        )
+        self.assertNotContains(response, 'photo_set-TOTAL_FORMS')
+        self.assertContains(response, 'Manage photos (10 items)')
+
+        url = reverse('admin:media_albums_album_media', args=[album.pk])
+        response = self.client.get(url, {'p': '3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['panels']), 2)
+        self.assertEqual(response.context['paginator'].num_pages, 3)
+
+        # Each item is saved on its own, and shown with its errors if it is
+        # not valid.
+        photo = response.context['panels'][0]['item']
+        prefix = 'item-%d-' % photo.pk
+        data = {
+            'item': photo.pk,
+            prefix + 'name': '',
+            prefix + 'caption': '',
+            prefix + 'ordering': photo.ordering,
+        }
+        response = self.client.post(url + '?p=3', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('name', response.context['panels'][0]['form'].errors)
+
+        data[prefix + 'name'] = 'Renamed'
+        response = self.client.post(url + '?p=3', data)
+        self.assertRedirects(response, url + '?p=3')
+        self.assertEqual(Photo.objects.get(pk=photo.pk).name, 'Renamed')
+
+        pks = list(
+            album.photo_set.order_by('pk').values_list('pk', flat=True)
+        )
+        response = self.client.post(url, {
+            'action': 'move',
+            'target_album': other_album.slug,
+            '_selected': pks[:2],
+        })
+        self.assertRedirects(response, url)
+        response = self.client.post(url, {
+            'action': 'delete',
+            '_selected': pks[2:4],
+        })
+        self.assertRedirects(response, url)
+
+        self.assertEqual(Album.objects.get(pk=album.pk).photo_count, 6)
+        self.assertEqual(
+            Album.objects.get(pk=other_album.pk).photo_count,
+            other_count + 2
+        )
+        self.assertFalse(Photo.objects.filter(pk__in=pks[2:4]).exists())
+
+    @override_settings(MEDIA_ALBUMS={
+        'item_counts_live': True,
+    })
+    def test_album_changelist_with_live_item_counts(self):
+        self.reload()
+
+        Album.objects.filter(slug='cat-photos').update(photo_count=0)
+
+        url = reverse('admin:media_albums_album_changelist')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        albums = dict(
+            (album.slug, album)
+            for album in response.context['cl'].result_list
+        )
+        self.assertEqual(albums['cat-photos'].num_items(), 10)
+
     def test_audiofile_views_are_disabled_by_default(self):
         self.reload()
 
@@ -235,6 +309,42 @@ class ViewsTest(TestCase):
                 args=test['url_args'],
             )
 
+    @override_settings(MEDIA_ALBUMS={
+        'admin_thumbnail_rendition': 'thumbnail',
+    })
+    def test_photo_changelist(self):
+        self.reload()
+
+        Photo.objects.filter(album__slug='cat-photos').update(
+            renditions=json.dumps({
+                'thumbnail': {
+                    'url': '/media/thumbnail.jpg',
+                    'width': 100,
+                    'height': 75,
+                },
+            }),
+        )
+        album = Album.objects.get(slug='cat-photos')
+        url = reverse('admin:media_albums_photo_changelist')
+
+        # Only the albums matching the search are offered by the filter.
+        response = self.client.get(url, {'album_q': 'cat'})
+        self.assertEqual(response.status_code, 200)
+        album_filter = response.context['cl'].filter_specs[0]
+        self.assertEqual(
+            [name for pk, name in album_filter.lookup_choices],
+            [album.name]
+        )
+
+        response = self.client.get(url, {'album': str(album.pk)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 10)
+        self.assertContains(
+            response,
+            '<img src="/media/thumbnail.jpg" width="100" height="75" alt="">',
+            count=10,
+        )
+
     def test_userphoto_views_are_disabled_by_default(self):
         self.reload()
 
@@ -372,6 +482,35 @@ class ViewsTest(TestCase):
             1
         )
 
+    @override_settings(MEDIA_ALBUMS={
+        'user_uploaded_photos_enabled': True,
+    })
+    def test_userphoto_near_duplicates(self):
+        self.reload()
+
+        hashes = {32: 0, 33: 3, 34: -1}
+
+        for pk, value in hashes.items():
+            if pk != 32:
+                UserPhoto.objects.create(
+                    pk=pk,
+                    album_id=8,
+                    name='Photo %d' % pk,
+                    image='media_albums/photo-%d.jpg' % pk,
+                )
+
+            UserPhoto.objects.filter(pk=pk).update(perceptual_hash=value)
+
+        url = reverse('admin:media_albums_userphoto_changelist')
+        response = self.client.get(url)
+        self.assertContains(response, 'Group 32 (2 photos)')
+
+        response = self.client.get(url, {'near_duplicates': '32'})
+        self.assertEqual(
+            sorted(photo.pk for photo in response.context['cl'].result_list),
+            [32, 33]
+        )
+
     def test_videofile_views_are_disabled_by_default(self):
         self.reload()
 
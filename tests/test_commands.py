@@ -0,0 +1,391 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from media_albums.models import (
+    Album, Notification, Photo, UploadSession, UserPhoto
+)
+from media_albums.notifications import (
+    ThreadBackend, notify_user_photo_uploaded
+)
+from media_albums.settings import MEDIA_ALBUMS_SETTINGS, compute_settings
+
+from .utils import make_jpeg
+
+
+class CommandsTest(TestCase):
+    fixtures = [
+        'media_albums_test_data.json',
+    ]
+
+    def test_recount_items(self):
+        Album.objects.update(
+            audio_file_count=0,
+            photo_count=0,
+            video_file_count=0,
+        )
+
+        out = StringIO()
+        call_command('media_albums_recount_items', stdout=out)
+        self.assertIn('Recounted 8 albums, 7 of which', out.getvalue())
+
+        album = Album.objects.get(slug='miscellaneous')
+        self.assertEqual(album.audio_file_count, 1)
+        self.assertEqual(album.photo_count, 1)
+        self.assertEqual(album.video_file_count, 1)
+
+        out = StringIO()
+        call_command(
+            'media_albums_recount_items',
+            album_slugs=['cat-photos'],
+            stdout=out,
+        )
+        self.assertIn('Recounted 1 albums, 0 of which', out.getvalue())
+
+    def test_process_photos(self):
+        Photo.objects.filter(pk__in=[1, 2]).update(
+            processing_state=Photo.PROCESSING_PENDING,
+        )
+        Photo.objects.filter(pk=3).update(
+            processing_state=Photo.PROCESSING_FAILED,
+        )
+
+        out = StringIO()
+        call_command('media_albums_process_photos', stdout=out)
+        self.assertIn('Processed 2 photos.', out.getvalue())
+        self.assertEqual(
+            Photo.objects.filter(
+                processing_state=Photo.PROCESSING_DONE,
+            ).count(),
+            31
+        )
+
+        out = StringIO()
+        call_command(
+            'media_albums_process_photos',
+            retry_failed=True,
+            stdout=out,
+        )
+        self.assertIn('Processed 1 photos.', out.getvalue())
+
+    def test_process_photos_reclaims_abandoned_photos(self):
+        now = timezone.now()
+        Photo.objects.filter(pk=1).update(
+            processing_state=Photo.PROCESSING_IN_PROGRESS,
+            processing_started=now - timedelta(hours=2),
+        )
+        Photo.objects.filter(pk=2).update(
+            processing_state=Photo.PROCESSING_IN_PROGRESS,
+            processing_started=now,
+        )
+
+        out = StringIO()
+        call_command('media_albums_process_photos', stdout=out)
+        self.assertIn('Processed 1 photos.', out.getvalue())
+        self.assertEqual(
+            Photo.objects.get(pk=1).processing_state,
+            Photo.PROCESSING_DONE
+        )
+
+        # A photo that is probably still being processed is left alone.
+        photo = Photo.objects.get(pk=2)
+        self.assertEqual(photo.processing_state, Photo.PROCESSING_IN_PROGRESS)
+
+        out = StringIO()
+        call_command(
+            'media_albums_process_photos',
+            older_than=0,
+            stdout=out,
+        )
+        self.assertIn('Processed 1 photos.', out.getvalue())
+        self.assertEqual(
+            Photo.objects.get(pk=2).processing_state,
+            Photo.PROCESSING_DONE
+        )
+
+    def test_backfill_photo_metadata(self):
+        photo = Photo.objects.create(
+            album=Album.objects.get(slug='cat-photos'),
+            name='Metadata',
+            image=make_jpeg(size=(40, 20)),
+        )
+        Photo.objects.filter(pk=photo.pk).update(
+            width=None,
+            height=None,
+            mime_type='',
+        )
+
+        out = StringIO()
+        call_command(
+            'media_albums_backfill_photo_metadata',
+            chunk_size=10,
+            processes=2,
+            stdout=out,
+        )
+
+        # The photos in the test data are not stored locally.
+        self.assertIn(
+            'Stored the metadata of 1 photos (32 could not be read).',
+            out.getvalue()
+        )
+
+        photo = Photo.objects.get(pk=photo.pk)
+        self.assertEqual(photo.width, 40)
+        self.assertEqual(photo.height, 20)
+        self.assertEqual(photo.mime_type, 'image/jpeg')
+
+    # The worker processes can't use the test database, so the renditions
+    # (which are tracked in sorl-thumbnail's database tables) are left to the
+    # `media_albums_generate_renditions` command.
+    @override_settings(MEDIA_ALBUMS={
+        'renditions': {},
+    })
+    def test_import(self):
+        compute_settings()
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        os.mkdir(os.path.join(directory, 'day2'))
+
+        for path, size in (
+            ('first.jpg', (40, 20)),
+            ('day2/second.JPG', (30, 60)),
+        ):
+            with open(os.path.join(directory, path), 'wb') as f:
+                f.write(make_jpeg(size=size).read())
+
+        with open(os.path.join(directory, 'day2/broken.jpg'), 'wb') as f:
+            f.write(b'Not an image')
+
+        with open(os.path.join(directory, 'notes.txt'), 'wb') as f:
+            f.write(b'Not an image either')
+
+        out = StringIO()
+        call_command(
+            'media_albums_import',
+            directory,
+            '--album',
+            'empty-album',
+            batch_size=2,
+            processes=1,
+            copy_workers=1,
+            stdout=out,
+        )
+        self.assertIn(
+            'Imported 2 photos into "Empty Album" '
+            '(1 files could not be read).',
+            out.getvalue()
+        )
+
+        album = Album.objects.get(slug='empty-album')
+        self.assertEqual(album.photo_count, 2)
+        photos = {photo.name: photo for photo in album.photo_set.all()}
+        self.assertEqual(sorted(photos), ['first', 'second'])
+        self.assertEqual(photos['second'].width, 30)
+        self.assertEqual(photos['second'].height, 60)
+        self.assertEqual(
+            photos['second'].processing_state,
+            Photo.PROCESSING_DONE
+        )
+
+        checkpoint_path = os.path.join(directory, '.media_albums_import.log')
+
+        with open(checkpoint_path) as f:
+            lines = [line.rstrip('\n').split('\t')[:2] for line in f]
+
+        self.assertEqual(lines, [
+            ['album', 'empty-album'],
+            ['copying', 'first.jpg'],
+            ['copying', 'day2/broken.jpg'],
+            ['imported', 'first.jpg'],
+            ['failed', 'day2/broken.jpg'],
+            ['committed'],
+            ['copying', 'day2/second.JPG'],
+            ['imported', 'day2/second.JPG'],
+            ['committed'],
+        ])
+
+        # A batch that was recorded but not committed is checked against the
+        # database when the import is resumed.
+        with open(checkpoint_path) as f:
+            uncommitted = f.read().rsplit('committed\n', 1)[0]
+
+        with open(checkpoint_path, 'w') as f:
+            f.write(uncommitted)
+
+        photos['second'].delete()
+        out = StringIO()
+        call_command(
+            'media_albums_import',
+            directory,
+            '--album',
+            'empty-album',
+            processes=1,
+            stdout=out,
+        )
+        self.assertIn('Imported 1 photos', out.getvalue())
+        self.assertEqual(Album.objects.get(slug='empty-album').photo_count, 2)
+
+        # Running the import again resumes from the checkpoint.
+        out = StringIO()
+        call_command(
+            'media_albums_import',
+            directory,
+            '--album',
+            'empty-album',
+            processes=1,
+            stdout=out,
+        )
+        self.assertIn('Imported 0 photos', out.getvalue())
+        self.assertEqual(Album.objects.get(slug='empty-album').photo_count, 2)
+
+        # A file that was copied to storage before the import was
+        # interrupted, but whose photo was never created, is deleted and
+        # imported again.
+        with open(os.path.join(directory, 'third.jpg'), 'wb') as f:
+            f.write(make_jpeg().read())
+
+        storage = Photo._meta.get_field('image').storage
+        orphan_name = storage.save('media_albums/third.jpg', make_jpeg())
+
+        with open(checkpoint_path, 'a') as f:
+            f.write('copying\tthird.jpg\t%s\n' % orphan_name)
+
+        out = StringIO()
+        call_command(
+            'media_albums_import',
+            directory,
+            '--album',
+            'empty-album',
+            processes=1,
+            stdout=out,
+        )
+        self.assertIn('Imported 1 photos', out.getvalue())
+        self.assertFalse(storage.exists(orphan_name))
+        self.assertEqual(Album.objects.get(slug='empty-album').photo_count, 3)
+
+    @override_settings(MEDIA_ALBUMS={
+        'user_uploaded_photos_enabled': True,
+    })
+    def test_approve_user_photos(self):
+        compute_settings()
+
+        pending_album = Album.objects.get(pk=8)
+        user_photo = UserPhoto.objects.get(pk=32)
+        user_photo.album_photo = True
+        user_photo.save()
+        self.assertEqual(Album.objects.get(pk=8).cover_item_id, 32)
+
+        out = StringIO()
+        call_command('media_albums_approve_user_photos', 32, 999, stdout=out)
+        self.assertIn('Approved 1 photos.', out.getvalue())
+
+        # The photo keeps its primary key and image.
+        self.assertFalse(UserPhoto.objects.filter(pk=32).exists())
+        photo = Photo.objects.get(pk=32)
+        self.assertEqual(photo.image.name, user_photo.image.name)
+        self.assertFalse(photo.album_photo)
+
+        album = Album.objects.get(slug='user-photos')
+        self.assertEqual(photo.album, album)
+        self.assertEqual(album.photo_count, 1)
+        pending_album = Album.objects.get(pk=pending_album.pk)
+        self.assertEqual(pending_album.photo_count, 0)
+        self.assertIsNone(pending_album.cover_item_id)
+
+        out = StringIO()
+        call_command('media_albums_approve_user_photos', all=True, stdout=out)
+        self.assertIn('Approved 0 photos.', out.getvalue())
+
+    @override_settings(MEDIA_ALBUMS={
+        'notification_backend': 'media_albums.notifications.OutboxBackend',
+    })
+    def test_send_notifications(self):
+        compute_settings()
+
+        for i in range(3):
+            notify_user_photo_uploaded('http://example.com/admin/')
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Notification.objects.filter(sent=None).count(), 3)
+
+        out = StringIO()
+        call_command('media_albums_send_notifications', stdout=out)
+        self.assertIn('Sent 3 notifications.', out.getvalue())
+
+        # The notifications are coalesced into a single digest.
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            mail.outbox[0].subject,
+            'A new photo needs to be approved'
+        )
+        self.assertIn('http://example.com/admin/', mail.outbox[0].body)
+        self.assertEqual(Notification.objects.filter(sent=None).count(), 0)
+
+        out = StringIO()
+        call_command('media_albums_send_notifications', stdout=out)
+        self.assertIn('Sent 0 notifications.', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(MEDIA_ALBUMS={
+        'notification_digest_interval': 3600,
+    })
+    def test_thread_notification_backend_flush(self):
+        compute_settings()
+        backend = ThreadBackend()
+
+        for i in range(3):
+            backend.notify('http://example.com/admin/')
+
+        self.assertEqual(len(mail.outbox), 0)
+
+        # The waiting digest is sent when the process exits.
+        backend.flush()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIsNone(backend.timer)
+        self.assertTrue(UserPhoto.objects.exists())
+
+        backend.flush()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_clean_upload_sessions(self):
+        staging_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_dir)
+        compute_settings()
+        MEDIA_ALBUMS_SETTINGS['upload_staging_dir'] = staging_dir
+
+        old, new = [
+            UploadSession.objects.create(
+                name=name,
+                file_name='%s.jpg' % name,
+                size=10,
+                sha256='0' * 64,
+            )
+            for name in ('old', 'new')
+        ]
+
+        for upload in (old, new):
+            with open(upload.staging_path, 'wb') as f:
+                f.write(b'12345')
+
+        UploadSession.objects.filter(pk=old.pk).update(
+            updated=timezone.now() - timedelta(days=2),
+        )
+
+        out = StringIO()
+        call_command('media_albums_clean_upload_sessions', stdout=out)
+        self.assertIn('Deleted 1 upload sessions.', out.getvalue())
+        self.assertEqual(
+            list(UploadSession.objects.values_list('name', flat=True)),
+            ['new']
+        )
+        self.assertEqual(os.listdir(staging_dir), [os.path.basename(
+            new.staging_path
+        )])
@@ -0,0 +1,690 @@
+import os
+import shutil
+from datetime import datetime
+from tempfile import NamedTemporaryFile, mkdtemp
+from unittest import skipUnless
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
+
+from media_albums.duplicates import (
+    BKTree, group_near_duplicates, hamming_distance
+)
+from media_albums.forms import PhotoForm
+from media_albums.models import (
+    Album, AudioFile, Photo, StoredFile, UserPhoto, VideoFile
+)
+from media_albums.pagination import EstimatedCountPaginator
+from media_albums.images import (
+    perceptual_hash, reset_exif_orientation, which
+)
+from media_albums.processing import process_photo
+from media_albums.settings import MEDIA_ALBUMS_SETTINGS, compute_settings
+from media_albums.system_albums import (
+    USER_PHOTOS, get_system_album_id, lock_system_album
+)
+from PIL import Image
+
+from .utils import make_jpeg, run_commit_hooks
+
+
+PHOTO_EXIF_TAGS = {
+    0x010f: 'Canon',
+    0x0110: 'EOS 5D',
+    0x8769: {
+        0x9003: '2016:05:20 10:11:12',
+    },
+    0x8825: {
+        1: 'S',
+        2: (12.0, 30.0, 0.0),
+        3: 'W',
+        4: (45.0, 15.0, 36.0),
+    },
+}
+
+
+class ModelsTest(TestCase):
+    fixtures = [
+        'media_albums_test_data.json',
+    ]
+
+    def test_album_cover_item(self):
+        compute_settings()
+
+        album = Album.objects.get(slug='cat-photos')
+        self.assertEqual(album.cover_item(), Photo.objects.get(pk=1))
+        self.assertEqual(album.image().name, 'http://i.imgur.com/WIInzxA.jpg')
+
+        album = Album.objects.get(slug='empty-album')
+        self.assertIsNone(album.cover_item())
+        self.assertIsNone(album.image())
+
+        # Audio files are disabled by default.
+        album = Album.objects.get(slug='audio-files')
+        self.assertIsNone(album.cover_item())
+        self.assertIsNone(album.image())
+
+    @override_settings(MEDIA_ALBUMS={
+        'audio_files_enabled': True,
+    })
+    def test_album_cover_item_audio_enabled(self):
+        compute_settings()
+
+        album = Album.objects.get(slug='audio-files')
+        self.assertEqual(album.cover_item(), AudioFile.objects.get(pk=1))
+        self.assertEqual(
+            album.image().name,
+            'https://upload.wikimedia.org/wikipedia/commons/a/a2/'
+            'Audacity-Screenshot.jpg'
+        )
+
+    def test_album_cover_item_is_kept_current(self):
+        compute_settings()
+
+        photo = Photo.objects.get(pk=2)
+        photo.album_photo = True
+        photo.save()
+
+        album = Album.objects.get(slug='cat-photos')
+        self.assertEqual(album.cover_item(), photo)
+        self.assertEqual(album.image().name, photo.image.name)
+        self.assertFalse(Photo.objects.get(pk=1).album_photo)
+
+        photo.album_photo = False
+        photo.save()
+
+        album = Album.objects.get(slug='cat-photos')
+        self.assertIsNone(album.cover_item())
+        self.assertIsNone(album.image())
+
+        photo = Photo.objects.get(pk=1)
+        photo.album_photo = True
+        photo.save()
+        photo.album = Album.objects.get(slug='dog-photos')
+        photo.save()
+
+        self.assertIsNone(Album.objects.get(slug='cat-photos').cover_item())
+        self.assertEqual(
+            Album.objects.get(slug='dog-photos').cover_item(),
+            photo
+        )
+
+        photo.delete()
+        self.assertIsNone(Album.objects.get(slug='dog-photos').cover_item())
+
+    def test_album_photo_is_unset_with_a_single_update(self):
+        compute_settings()
+
+        def count_updates(item):
+            with CaptureQueriesContext(connection) as queries:
+                item.save()
+
+            # Every save also updates the album's `updated` timestamp.
+            return len([
+                query for query in queries.captured_queries
+                if query['sql'].startswith('UPDATE') and not
+                query['sql'].startswith(
+                    'UPDATE "media_albums_album" SET "updated"'
+                )
+            ])
+
+        # Saving the album photo again does not touch the other items.
+        photo = Photo.objects.get(pk=31)
+        self.assertEqual(count_updates(photo), 1)
+
+        # Making another item the album photo unsets the flag on the old
+        # album photo (even if it is a different type of item) and updates
+        # the album's cover.
+        video_file = VideoFile.objects.get(pk=4)
+        video_file.album_photo = True
+        self.assertEqual(count_updates(video_file), 3)
+
+        self.assertFalse(Photo.objects.get(pk=31).album_photo)
+        self.assertTrue(VideoFile.objects.get(pk=4).album_photo)
+        self.assertEqual(
+            Album.objects.get(slug='miscellaneous').cover_item_type,
+            'video'
+        )
+
+        audio_file = AudioFile.objects.get(pk=4)
+        audio_file.album_photo = True
+        audio_file.save()
+
+        self.assertFalse(Photo.objects.get(pk=31).album_photo)
+        self.assertFalse(VideoFile.objects.get(pk=4).album_photo)
+        self.assertTrue(AudioFile.objects.get(pk=4).album_photo)
+
+    def test_album_item_counts_are_kept_current(self):
+        compute_settings()
+
+        cat_photos = Album.objects.get(slug='cat-photos')
+        dog_photos = Album.objects.get(slug='dog-photos')
+        self.assertEqual(cat_photos.num_items(), 10)
+        self.assertEqual(dog_photos.num_items(), 15)
+
+        photo = Photo.objects.create(
+            album=cat_photos,
+            name='New',
+            image='http://example.com/new.jpg',
+        )
+        self.assertEqual(Album.objects.get(pk=cat_photos.pk).photo_count, 11)
+
+        photo.album = dog_photos
+        photo.save()
+        self.assertEqual(Album.objects.get(pk=cat_photos.pk).photo_count, 10)
+        self.assertEqual(Album.objects.get(pk=dog_photos.pk).photo_count, 16)
+
+        photo.delete()
+        self.assertEqual(Album.objects.get(pk=dog_photos.pk).photo_count, 15)
+
+        pending_album = UserPhoto.objects.get(pk=32).album
+        self.assertEqual(pending_album.photo_count, 1)
+        UserPhoto.objects.get(pk=32).delete()
+        self.assertEqual(Album.objects.get(pk=pending_album.pk).photo_count, 0)
+
+    @override_settings(MEDIA_ALBUMS={
+        'item_counts_live': True,
+    })
+    def test_album_item_counts_live(self):
+        compute_settings()
+
+        Album.objects.filter(slug='cat-photos').update(photo_count=0)
+        album = Album.objects.get(slug='cat-photos')
+        self.assertEqual(album.num_items(), 10)
+
+    def test_user_photo_approve_keeps_the_photo(self):
+        compute_settings()
+
+        user_photo = UserPhoto.objects.get(pk=32)
+
+        with CaptureQueriesContext(connection) as queries:
+            photo = user_photo.approve()
+
+        self.assertEqual(photo.pk, 32)
+        self.assertEqual(photo.image.name, user_photo.image.name)
+        self.assertEqual(photo.album.slug, 'user-photos')
+        self.assertFalse(UserPhoto.objects.filter(pk=32).exists())
+        self.assertFalse(
+            any('INSERT INTO "media_albums_photo"' in query['sql']
+                for query in queries.captured_queries)
+        )
+        self.assertEqual(Album.objects.get(pk=8).photo_count, 0)
+        self.assertEqual(photo.album.photo_count, 1)
+
+    def test_system_album_id_is_cached(self):
+        compute_settings()
+
+        # An album created by a transaction that is rolled back is never
+        # remembered.
+        with self.assertRaises(ZeroDivisionError):
+            with transaction.atomic():
+                with run_commit_hooks():
+                    get_system_album_id(USER_PHOTOS)
+                    1 / 0
+
+        self.assertFalse(Album.objects.filter(slug='user-photos').exists())
+
+        with run_commit_hooks():
+            album_id = get_system_album_id(USER_PHOTOS)
+
+        album = Album.objects.get(pk=album_id)
+        self.assertEqual(album.slug, 'user-photos')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_system_album_id(USER_PHOTOS), album_id)
+
+        # An album deleted by another process is only forgotten by this one
+        # when it is locked.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM %s WHERE id = %%s' % Album._meta.db_table,
+                [album_id],
+            )
+
+        self.assertEqual(get_system_album_id(USER_PHOTOS), album_id)
+
+        with run_commit_hooks():
+            new_album_id = lock_system_album(USER_PHOTOS)
+
+        self.assertNotEqual(new_album_id, album_id)
+        self.assertTrue(Album.objects.filter(pk=new_album_id).exists())
+        self.assertEqual(get_system_album_id(USER_PHOTOS), new_album_id)
+
+        # Deleting the album here forgets it, so it is created again.
+        Album.objects.get(pk=new_album_id).delete()
+        self.assertNotEqual(get_system_album_id(USER_PHOTOS), new_album_id)
+
+    @override_settings(MEDIA_ALBUMS={
+        'jpegtran_path': 'jpegtran-that-does-not-exist',
+    })
+    def test_photo_orientation_is_recorded(self):
+        compute_settings()
+
+        upload = make_jpeg(size=(40, 20), orientation=6)
+        original_data = upload.read()
+        upload.seek(0)
+
+        with run_commit_hooks():
+            photo = Photo.objects.create(
+                album=Album.objects.get(slug='cat-photos'),
+                name='Rotated',
+                image=upload,
+            )
+
+        photo = Photo.objects.get(pk=photo.pk)
+        self.assertEqual(photo.processing_state, Photo.PROCESSING_DONE)
+        self.assertEqual(photo.orientation, 6)
+
+        # The original file is left alone.
+        with open(photo.image.path, 'rb') as f:
+            self.assertEqual(f.read(), original_data)
+
+    @skipUnless(which('jpegtran'), 'jpegtran is not installed')
+    def test_photo_orientation_is_corrected_losslessly(self):
+        compute_settings()
+
+        with run_commit_hooks():
+            photo = Photo.objects.create(
+                album=Album.objects.get(slug='cat-photos'),
+                name='Rotated',
+                image=make_jpeg(size=(32, 16), orientation=6),
+            )
+
+        photo = Photo.objects.get(pk=photo.pk)
+        self.assertEqual(photo.processing_state, Photo.PROCESSING_DONE)
+        self.assertEqual(photo.orientation, 1)
+
+        img = Image.open(photo.image.path)
+        self.assertEqual(img.size, (16, 32))
+        self.assertEqual(img._getexif()[0x0112], 1)
+
+    @override_settings(MEDIA_ALBUMS={
+        'jpegtran_path': 'jpegtran-that-does-not-exist',
+    })
+    def test_photo_metadata_is_stored(self):
+        compute_settings()
+
+        upload = make_jpeg(
+            size=(40, 20),
+            orientation=6,
+            exif_tags=PHOTO_EXIF_TAGS,
+        )
+        with run_commit_hooks():
+            photo = Photo.objects.create(
+                album=Album.objects.get(slug='cat-photos'),
+                name='Metadata',
+                image=upload,
+            )
+
+        photo = Photo.objects.get(pk=photo.pk)
+        self.assertEqual(photo.width, 20)
+        self.assertEqual(photo.height, 40)
+        self.assertEqual(photo.aspect_ratio, 0.5)
+        self.assertEqual(photo.file_size, upload.size)
+        self.assertEqual(photo.mime_type, 'image/jpeg')
+        self.assertEqual(
+            photo.taken_at.replace(tzinfo=None),
+            datetime(2016, 5, 20, 10, 11, 12)
+        )
+        self.assertEqual(photo.camera_make, 'Canon')
+        self.assertEqual(photo.camera_model, 'EOS 5D')
+        self.assertEqual(photo.gps_latitude, -12.5)
+        self.assertEqual(photo.gps_longitude, -45.26)
+
+    def test_photo_renditions_are_generated(self):
+        compute_settings()
+
+        with run_commit_hooks():
+            photo = Photo.objects.create(
+                album=Album.objects.get(slug='cat-photos'),
+                name='Renditions',
+                image=make_jpeg(size=(600, 300)),
+                album_photo=True,
+            )
+
+        photo = Photo.objects.get(pk=photo.pk)
+        thumbnail = photo.get_rendition('thumbnail')
+        self.assertEqual((thumbnail['width'], thumbnail['height']), (200, 100))
+        large = photo.get_rendition('large')
+        self.assertEqual((large['width'], large['height']), (550, 275))
+        self.assertIsNone(photo.get_rendition('missing'))
+
+        album = Album.objects.get(slug='cat-photos')
+        self.assertEqual(album.get_rendition('thumbnail'), thumbnail)
+
+        # Replacing the image throws the old renditions away.
+        photo.image = make_jpeg(name='other.jpg', size=(100, 400))
+        with run_commit_hooks():
+            photo.save(update_fields=['image'])
+        photo = Photo.objects.get(pk=photo.pk)
+        thumbnail = photo.get_rendition('thumbnail')
+        self.assertEqual((thumbnail['width'], thumbnail['height']), (50, 200))
+
+    @override_settings(MEDIA_ALBUMS={
+        'renditions': {},
+    })
+    def test_photo_renditions_disabled(self):
+        compute_settings()
+
+        photo = Photo.objects.create(
+            album=Album.objects.get(slug='cat-photos'),
+            name='Renditions',
+            image=make_jpeg(),
+        )
+
+        photo = Photo.objects.get(pk=photo.pk)
+        self.assertIsNone(photo.get_rendition('thumbnail'))
+
+    @override_settings(MEDIA_ALBUMS={
+        'processing_backend': 'media_albums.processing.SyncBackend',
+        'rendition_workers': 1,
+    })
+    def test_photo_form_probe_is_used(self):
+        compute_settings()
+
+        album = Album.objects.get(slug='cat-photos')
+        data = {'album': album.pk, 'name': 'Probed', 'ordering': 0}
+
+        form = PhotoForm(data, {
+            'image': make_jpeg(size=(40, 20), exif_tags=PHOTO_EXIF_TAGS),
+        })
+        self.assertTrue(form.is_valid())
+
+        with run_commit_hooks():
+            photo = Photo.objects.get(pk=form.save().pk)
+
+            # The values read from the header are stored right away, without
+            # waiting for the (deferred) processing.
+            self.assertEqual(photo.processing_state, Photo.PROCESSING_DONE)
+            self.assertEqual((photo.width, photo.height), (40, 20))
+            self.assertEqual(photo.mime_type, 'image/jpeg')
+            self.assertEqual(photo.camera_model, 'EOS 5D')
+            self.assertIsNone(photo.perceptual_hash)
+
+        # The image is only decoded for the hash once the photo is saved.
+        self.assertIsNotNone(Photo.objects.get(pk=photo.pk).perceptual_hash)
+
+        # The form does not decode the image, so a truncated image whose
+        # header can be read is not an error.
+        form = PhotoForm(data, {
+            'image': SimpleUploadedFile(
+                'truncated.jpg',
+                make_jpeg(size=(400, 200)).read()[:800],
+            ),
+        })
+        self.assertTrue(form.is_valid())
+
+        # Rotated JPEG photos still have to be processed.
+        form = PhotoForm(data, {
+            'image': make_jpeg(size=(40, 20), orientation=6),
+        })
+        self.assertTrue(form.is_valid())
+        photo = Photo.objects.get(pk=form.save().pk)
+        self.assertEqual(photo.processing_state, Photo.PROCESSING_PENDING)
+
+    @override_settings(MEDIA_ALBUMS={
+        'max_image_pixels': 100,
+        'max_image_bytes': 100000,
+    })
+    def test_photo_form_image_limits(self):
+        compute_settings()
+
+        data = {
+            'album': Album.objects.get(slug='cat-photos').pk,
+            'name': 'Too large',
+            'ordering': 0,
+        }
+
+        form = PhotoForm(data, {'image': make_jpeg(size=(40, 20))})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code,
+            'too_many_pixels'
+        )
+
+        MEDIA_ALBUMS_SETTINGS['max_image_pixels'] = None
+        MEDIA_ALBUMS_SETTINGS['max_image_bytes'] = 10
+        form = PhotoForm(data, {'image': make_jpeg(size=(40, 20))})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code,
+            'too_many_bytes'
+        )
+
+        MEDIA_ALBUMS_SETTINGS['max_image_bytes'] = None
+        form = PhotoForm(data, {
+            'image': SimpleUploadedFile('broken.jpg', b'Not an image'),
+        })
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code,
+            'invalid_image'
+        )
+
+    @override_settings(MEDIA_ALBUMS={
+        'deduplicate_files': True,
+        'rendition_workers': 1,
+    })
+    def test_duplicate_files_are_stored_once(self):
+        compute_settings()
+
+        album = Album.objects.get(slug='cat-photos')
+        with run_commit_hooks():
+            first = Photo.objects.create(
+                album=album,
+                name='Original',
+                image=make_jpeg(size=(40, 20)),
+            )
+        second = Photo.objects.create(
+            album=album,
+            name='Duplicate',
+            image=make_jpeg(name='copy.jpg', size=(40, 20)),
+        )
+
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(len(second.content_hash), 64)
+        self.assertEqual(second.content_hash, first.content_hash)
+        stored_file = StoredFile.objects.get(name=first.image.name)
+        self.assertEqual(stored_file.ref_count, 2)
+
+        # The metadata of the duplicate is copied from the processed photo.
+        second = Photo.objects.get(pk=second.pk)
+        self.assertEqual(second.processing_state, Photo.PROCESSING_DONE)
+        self.assertEqual((second.width, second.height), (40, 20))
+
+        first.delete()
+        self.assertEqual(
+            StoredFile.objects.get(pk=stored_file.pk).ref_count,
+            1
+        )
+
+        # Replacing the image releases the stored file.
+        second.image = make_jpeg(size=(20, 40))
+        second.save()
+        self.assertFalse(
+            StoredFile.objects.filter(pk=stored_file.pk).exists()
+        )
+        self.assertEqual(
+            StoredFile.objects.get(name=second.image.name).ref_count,
+            1
+        )
+
+        second.delete()
+        self.assertFalse(StoredFile.objects.exists())
+
+    @override_settings(MEDIA_ALBUMS={
+        'deduplicate_files': True,
+    })
+    def test_shared_image_is_not_transformed_in_place(self):
+        compute_settings()
+
+        # A stand-in for jpegtran that copies the file unchanged, so that
+        # only its EXIF orientation is reset.
+        bin_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, bin_dir)
+        jpegtran = os.path.join(bin_dir, 'jpegtran')
+
+        with open(jpegtran, 'w') as f:
+            f.write(
+                '#!/bin/sh\n'
+                'while [ "$1" != -outfile ]; do shift; done\n'
+                'cp "$3" "$2"\n'
+            )
+
+        os.chmod(jpegtran, 0o755)
+        MEDIA_ALBUMS_SETTINGS['jpegtran_path'] = jpegtran
+
+        album = Album.objects.get(slug='cat-photos')
+        upload = make_jpeg(orientation=6)
+        original_data = upload.read()
+        upload.seek(0)
+        first = Photo.objects.create(album=album, name='First', image=upload)
+        second = Photo.objects.create(
+            album=album,
+            name='Second',
+            image=make_jpeg(name='copy.jpg', orientation=6),
+        )
+        shared_name = first.image.name
+        self.assertEqual(second.image.name, shared_name)
+
+        with run_commit_hooks():
+            process_photo(first.pk)
+
+        # The photo that shares the original file still sees it unchanged.
+        with open(second.image.path, 'rb') as f:
+            self.assertEqual(f.read(), original_data)
+
+        with run_commit_hooks():
+            process_photo(second.pk)
+
+        first = Photo.objects.get(pk=first.pk)
+        second = Photo.objects.get(pk=second.pk)
+        self.assertNotEqual(first.image.name, shared_name)
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual((first.orientation, second.orientation), (1, 1))
+        self.assertEqual(
+            first.content_hash,
+            StoredFile.hash_file(first.image)
+        )
+        first.image.close()
+
+        with open(first.image.path, 'rb') as f:
+            self.assertEqual(Image.open(f)._getexif()[0x0112], 1)
+
+        stored_file = StoredFile.objects.get()
+        self.assertEqual(stored_file.name, first.image.name)
+        self.assertEqual(stored_file.ref_count, 2)
+        self.assertFalse(first.image.storage.exists(shared_name))
+
+    @override_settings(MEDIA_ALBUMS={
+        'deduplicate_files': True,
+    })
+    def test_new_stored_file_is_deleted_on_rollback(self):
+        compute_settings()
+
+        def fail(**kwargs):
+            raise ValueError
+
+        post_save.connect(fail, sender=Photo)
+        self.addCleanup(post_save.disconnect, fail, sender=Photo)
+
+        photo = Photo(
+            album=Album.objects.get(slug='cat-photos'),
+            name='Failed',
+            image=make_jpeg(),
+        )
+
+        with self.assertRaises(ValueError):
+            photo.save()
+
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(photo.image.storage.exists(photo.image.name))
+
+    def test_estimated_count_paginator(self):
+        class Paginator(EstimatedCountPaginator):
+            def estimate_count(self):
+                return 50000
+
+        photos = Photo.objects.order_by('pk')
+        count = photos.count()
+
+        # SQLite has no estimate, so the photos are counted.
+        self.assertIsNone(EstimatedCountPaginator(photos, 10).estimate_count())
+        self.assertEqual(EstimatedCountPaginator(photos, 10).count, count)
+
+        paginator = Paginator(photos, 10)
+        self.assertEqual(paginator.count, 50000)
+        self.assertEqual(paginator.num_pages, 5000)
+        self.assertEqual(len(paginator.page(1)), 10)
+
+        # Small estimates are not trusted.
+        Paginator.exact_count_limit = 100000
+        self.assertEqual(Paginator(photos, 10).count, count)
+
+    def test_perceptual_hash(self):
+        small = perceptual_hash(make_jpeg(size=(40, 20)))
+        large = perceptual_hash(make_jpeg(size=(400, 200)))
+        self.assertLessEqual(hamming_distance(small, large), 6)
+        self.assertIsNone(
+            perceptual_hash(SimpleUploadedFile('broken.jpg', b'Not an image'))
+        )
+
+        # Copies of the same image are grouped, even through other copies.
+        hashes = [(1, 0), (2, 1), (3, 3), (4, -1), (5, None), (6, -1)]
+        self.assertEqual(
+            group_near_duplicates(hashes, 1),
+            [[1, 2, 3], [4, 6]]
+        )
+        tree = BKTree((value, key) for key, value in hashes[:4])
+        self.assertEqual(sorted(tree.search(2, 1)), [(1, 1), (1, 3)])
+        self.assertEqual(sorted(tree.search(2, 2)), [(1, 1), (1, 3), (2, 2)])
+
+    def test_reset_exif_orientation(self):
+        for byte_order in ('<', '>'):
+            upload = make_jpeg(orientation=8, byte_order=byte_order)
+
+            with NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+                f.write(upload.read())
+
+            try:
+                reset_exif_orientation(f.name)
+
+                img = Image.open(f.name)
+                self.assertEqual(img._getexif()[0x0112], 1)
+                self.assertEqual(os.path.getsize(f.name), upload.size)
+            finally:
+                os.remove(f.name)
+
+    @override_settings(MEDIA_ALBUMS={
+        'processing_backend': 'media_albums.processing.SyncBackend',
+        'rendition_workers': 1,
+    })
+    def test_photo_processing_is_deferred(self):
+        compute_settings()
+
+        photo = Photo.objects.create(
+            album=Album.objects.get(slug='cat-photos'),
+            name='Rotated',
+            image=make_jpeg(size=(40, 40), orientation=3),
+        )
+
+        # The backend is only used once the transaction is committed, which
+        # never happens inside of a test case.
+        photo = Photo.objects.get(pk=photo.pk)
+        self.assertEqual(photo.processing_state, Photo.PROCESSING_PENDING)
+
+        process_photo(photo.pk)
+        photo = Photo.objects.get(pk=photo.pk)
+        self.assertEqual(photo.processing_state, Photo.PROCESSING_DONE)
+
+        # Processing a photo again does nothing.
+        modified = Photo.objects.filter(pk=photo.pk)
+        process_photo(photo.pk)
+        self.assertEqual(
+            modified.get().processing_state,
+            Photo.PROCESSING_DONE
+        )
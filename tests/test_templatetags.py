@@ -1,7 +1,8 @@
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.utils import override_settings
 
-from media_albums.models import Album, AudioFile, VideoFile
+from media_albums.models import Album, AudioFile, Photo, VideoFile
 from media_albums.templatetags import media_albums_tags
 from media_albums.settings import compute_settings
 
@@ -11,6 +12,9 @@ class TemplateTagsTest(TestCase):
         'media_albums_test_data.json',
     ]
 
+    def setUp(self):
+        cache.clear()
+
     def test_get_mime_type(self):
         compute_settings()
 
@@ -94,6 +98,21 @@ class TemplateTagsTest(TestCase):
             for album_item in album_items:
                 self.assertEqual(album_item.album.name, test['album_name'])
 
+    @override_settings(MEDIA_ALBUMS={
+        'audio_files_enabled': True,
+        'video_files_enabled': True,
+    })
+    def test_lazy_items_match_items(self):
+        compute_settings()
+
+        for album in Album.objects.all():
+            items = album.items
+            lazy_items = album.lazy_items
+
+            self.assertEqual(len(lazy_items), len(items))
+            self.assertEqual(list(lazy_items), items)
+            self.assertEqual(lazy_items[1:3], items[1:3])
+
     def test_next_previous_object(self):
         compute_settings()
 
@@ -127,3 +146,69 @@ class TemplateTagsTest(TestCase):
         next_previous_item_2 = media_albums_tags.next_previous_object(items[2])
         self.assertEqual(next_previous_item_2['next'], items[0])
         self.assertEqual(next_previous_item_2['previous'], items[1])
+
+    @override_settings(MEDIA_ALBUMS={
+        'audio_files_enabled': True,
+        'video_files_enabled': True,
+    })
+    def test_next_previous_object_matches_items(self):
+        compute_settings()
+
+        for album in Album.objects.exclude(slug='empty-album'):
+            items = album.items
+            total = len(items)
+
+            for i, item in enumerate(items):
+                next_previous = media_albums_tags.next_previous_object(item)
+                self.assertEqual(next_previous['next'], items[(i + 1) % total])
+                self.assertEqual(next_previous['previous'], items[i - 1])
+                self.assertEqual(
+                    next_previous['current_item_position'],
+                    i + 1
+                )
+                self.assertEqual(
+                    next_previous['next_item_position'],
+                    (i + 1) % total + 1
+                )
+                self.assertEqual(
+                    next_previous['previous_item_position'],
+                    (i - 1) % total + 1
+                )
+                self.assertEqual(next_previous['total_album_items'], total)
+
+    def test_next_previous_object_position_cache_is_invalidated(self):
+        compute_settings()
+
+        album = Album.objects.get(slug='cat-photos')
+        last_item = album.items[-1]
+
+        next_previous = media_albums_tags.next_previous_object(last_item)
+        self.assertEqual(next_previous['current_item_position'], 10)
+
+        first_item = album.items[0]
+        first_item.album = Album.objects.get(slug='dog-photos')
+        first_item.save()
+
+        next_previous = media_albums_tags.next_previous_object(
+            Photo.objects.get(pk=last_item.pk)
+        )
+        self.assertEqual(next_previous['current_item_position'], 9)
+        self.assertEqual(next_previous['total_album_items'], 9)
+
+    def test_next_previous_object_with_drifted_counts(self):
+        compute_settings()
+
+        album = Album.objects.get(slug='cat-photos')
+        items = album.items
+
+        for photo_count in (0, 50):
+            Album.objects.filter(pk=album.pk).update(photo_count=photo_count)
+            cache.clear()
+
+            next_previous = media_albums_tags.next_previous_object(
+                Photo.objects.get(pk=items[0].pk)
+            )
+            self.assertEqual(next_previous['previous'], items[-1])
+            self.assertEqual(next_previous['next'], items[1])
+            self.assertEqual(next_previous['current_item_position'], 1)
+            self.assertEqual(next_previous['next_item_position'], 2)
@@ -1,21 +1,25 @@
 from collections import OrderedDict
-
-try:
-    from importlib import reload
-except ImportError:
-    pass
-
+import hashlib
+import json
 import os
+import shutil
+import tempfile
 
 from django.contrib.auth import get_user_model
 from django.core import mail
-from django.core.urlresolvers import clear_url_caches, reverse
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 
-from media_albums import admin as media_albums_admin
-from media_albums.settings import compute_settings
-from . import urls as test_urls
+from media_albums.models import AudioFile, Photo, StoredFile, UserPhoto
+from media_albums.settings import MEDIA_ALBUMS_SETTINGS, compute_settings
+from media_albums.streaming import offload_response
+from .utils import make_jpeg, reload_admin, run_commit_hooks
 
 
 class ViewsTest(TestCase):
@@ -145,6 +149,68 @@ class ViewsTest(TestCase):
                 self.assertEqual(len(items), 1)
                 self.assertEqual(items[0].is_photo, True)
 
+    def test_conditional_responses(self):
+        compute_settings()
+        urls = [
+            reverse('list-albums'),
+            reverse('show-album', kwargs={'album_slug': 'cat-photos'}),
+            reverse('show-photo', kwargs={'pk': 1}),
+        ]
+
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            self.assertTrue(response.has_header('Last-Modified'))
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+            # Changing an item in the album changes the page.
+            photo = Photo.objects.get(pk=1)
+            photo.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+            # So does logging in.
+            etag = response['ETag']
+            self.client.login(username='staff_user', password='testing!')
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.client.logout()
+
+        response = self.client.get(
+            reverse('show-album', kwargs={'album_slug': 'miscellaneous'}),
+            HTTP_IF_NONE_MATCH='*',
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_album_grid_is_cached(self):
+        compute_settings()
+        url = reverse('show-album', kwargs={'album_slug': 'cat-photos'})
+
+        def get_item_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'media-albums-item-col', count=10)
+
+            return [
+                query for query in queries.captured_queries
+                if 'AS item_type' in query['sql']
+            ]
+
+        # Other tests may have cached the grid with the same album version.
+        cache.clear()
+        self.assertEqual(len(get_item_queries()), 1)
+        self.assertEqual(get_item_queries(), [])
+
+        # Changing an item in the album invalidates the cached grid.
+        Photo.objects.get(pk=1).save()
+        self.assertEqual(len(get_item_queries()), 1)
+
     @override_settings(MEDIA_ALBUMS={
         'audio_files_enabled': True,
     })
@@ -262,6 +328,34 @@ class ViewsTest(TestCase):
                 self.assertEqual(items[0].is_audio, True)
                 self.assertEqual(items[1].is_photo, True)
 
+    @override_settings(MEDIA_ALBUMS={
+        'audio_files_enabled': True,
+        'video_files_enabled': True,
+        'paginate_by': 2,
+    })
+    def test_show_album_audio_and_video_enabled_with_pagination_page_2(self):
+        compute_settings()
+        url = reverse('show-album', kwargs={'album_slug': 'miscellaneous'})
+
+        for user_type in self.get_user_types():
+            response = self.client.get(url, {'page': 2})
+
+            if user_type == 'staff':
+                expected_status_code = 200
+            else:
+                expected_status_code = 404
+
+            self.assertEqual(response.status_code, expected_status_code)
+
+            if expected_status_code == 200:
+                items = response.context['items']
+                self.assertEqual(len(items), 1)
+                self.assertEqual(items[0].is_video, True)
+                self.assertEqual(response.context['pages'], 2)
+
+            response = self.client.get(url, {'page': 3})
+            self.assertEqual(response.status_code, 404)
+
     def test_show_audio(self):
         compute_settings()
         urls = {
@@ -307,6 +401,134 @@ class ViewsTest(TestCase):
 
             self.assertEqual(response.status_code, expected_status_code)
 
+    @override_settings(MEDIA_ALBUMS={
+        'audio_files_enabled': True,
+    })
+    def test_stream_audio(self):
+        compute_settings()
+        content = bytes(bytearray(range(256))) * 4
+        name = default_storage.save(
+            'media_albums/stream-test.mp3',
+            ContentFile(content),
+        )
+        self.addCleanup(default_storage.delete, name)
+        AudioFile.objects.filter(pk__in=[1, 4]).update(audio_file_1=name)
+
+        url = reverse('stream-audio', args=[1, 'audio_file_1'])
+        private_url = reverse('stream-audio', args=[4, 'audio_file_1'])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), content)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1024')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(
+            b''.join(response.streaming_content),
+            content[100:200]
+        )
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-24')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[-24:])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+        # A range of an outdated copy returns the whole file.
+        response = self.client.get(
+            url,
+            HTTP_RANGE='bytes=100-199',
+            HTTP_IF_RANGE='"outdated"',
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            url,
+            HTTP_RANGE='bytes=100-199',
+            HTTP_IF_RANGE=etag,
+        )
+        self.assertEqual(response.status_code, 206)
+
+        # Weak validators never allow a partial response.
+        for if_range in ['W/' + etag, 'Sat, 17 Oct 2026 12:00:00 GMT']:
+            response = self.client.get(
+                url,
+                HTTP_RANGE='bytes=100-199',
+                HTTP_IF_RANGE=if_range,
+            )
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='W/' + etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(
+            self.client.get(
+                reverse('stream-audio', args=[2, 'audio_file_1'])
+            ).status_code,
+            404
+        )
+
+        # Files in private albums are only sent to staff members.
+        for user_type in self.get_user_types():
+            response = self.client.get(private_url)
+
+            if user_type == 'staff':
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('private', response['Cache-Control'])
+            else:
+                self.assertEqual(response.status_code, 404)
+
+        # The page links to the view instead of the media URL.
+        response = self.client.get(reverse('show-audio', args=[1]))
+        self.assertContains(response, url)
+
+    @override_settings(MEDIA_ALBUMS={
+        'audio_files_enabled': True,
+        'stream_offload_header': 'X-Accel-Redirect',
+    })
+    def test_stream_audio_offloaded(self):
+        compute_settings()
+        name = default_storage.save(
+            'media_albums/stream-test.mp3',
+            ContentFile(b'audio'),
+        )
+        self.addCleanup(default_storage.delete, name)
+        AudioFile.objects.filter(pk=1).update(audio_file_1=name)
+
+        response = self.client.get(
+            reverse('stream-audio', args=[1, 'audio_file_1'])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/' + name
+        )
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_ALBUMS={
+        'stream_offload_header': 'X-Sendfile',
+    })
+    def test_stream_offload_without_local_path(self):
+        compute_settings()
+
+        class RemoteFile(object):
+            name = 'media_albums/remote.mp3'
+
+            @property
+            def path(self):
+                raise NotImplementedError
+
+        # The file is streamed by the view instead.
+        self.assertIsNone(offload_response(RemoteFile(), 'audio/mpeg'))
+
     def test_show_photo(self):
         compute_settings()
         urls = {
@@ -451,12 +673,10 @@ class ViewsTest(TestCase):
 
     @override_settings(MEDIA_ALBUMS={
         'user_uploaded_photos_enabled': True,
+        'notification_backend': 'media_albums.notifications.SyncBackend',
     })
     def test_user_photo_upload_uploads_enabled_post(self):
-        compute_settings()
-        reload(media_albums_admin)
-        clear_url_caches()
-        reload(test_urls)
+        reload_admin()
         urls = {
             'form': reverse('user-photo-upload'),
             'success': reverse('user-photo-upload-success'),
@@ -495,6 +715,220 @@ class ViewsTest(TestCase):
                 )
                 mail.outbox = []
 
+    @override_settings(MEDIA_ALBUMS={
+        'user_uploaded_photos_enabled': True,
+        'notification_backend': 'media_albums.notifications.SyncBackend',
+    })
+    def test_user_photo_multiple_upload(self):
+        reload_admin()
+        url = reverse('user-photo-multiple-upload')
+        self.client.login(username='normal_user', password='testing!')
+
+        response = self.client.post(url, {
+            'caption': 'Batch',
+            'images': [
+                make_jpeg(name='first.jpg'),
+                SimpleUploadedFile('broken.jpg', b'Not an image'),
+            ],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'broken.jpg',
+            response.context['form'].errors['images'][0]
+        )
+        self.assertFalse(UserPhoto.objects.filter(caption='Batch').exists())
+
+        with run_commit_hooks():
+            response = self.client.post(url, {
+                'caption': 'Batch',
+                'images': [
+                    make_jpeg(name='first.jpg'),
+                    make_jpeg(name='second.jpg', size=(60, 30)),
+                ],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(
+            reverse('user-photo-upload-success'),
+            response['Location']
+        )
+
+        user_photos = UserPhoto.objects.filter(
+            caption='Batch',
+        ).order_by(
+            'name',
+        )
+        self.assertEqual(
+            [user_photo.name for user_photo in user_photos],
+            ['first', 'second']
+        )
+        self.assertEqual(
+            len(set(user_photo.image.name for user_photo in user_photos)),
+            2
+        )
+        self.assertEqual(user_photos[0].added_by.username, 'normal_user')
+        # The staff are notified once for the whole batch.
+        self.assertEqual(len(mail.outbox), 1)
+
+        album = user_photos[0].album
+        self.assertEqual(
+            album.photo_count,
+            Photo.objects.filter(album=album).count()
+        )
+
+        # The renditions are generated once the photos have been committed.
+        for user_photo in user_photos:
+            self.assertEqual(
+                user_photo.processing_state,
+                Photo.PROCESSING_DONE
+            )
+            self.assertIsNotNone(user_photo.get_rendition('thumbnail'))
+
+    @override_settings(MEDIA_ALBUMS={
+        'user_uploaded_photos_enabled': True,
+        'notification_backend': 'media_albums.notifications.SyncBackend',
+        'deduplicate_files': True,
+    })
+    def test_user_photo_multiple_upload_deduplicated(self):
+        reload_admin()
+        self.client.login(username='normal_user', password='testing!')
+
+        with run_commit_hooks():
+            response = self.client.post(
+                reverse('user-photo-multiple-upload'),
+                {
+                    'caption': 'Copies',
+                    'images': [
+                        make_jpeg(name='first.jpg'),
+                        make_jpeg(name='copy.jpg'),
+                    ],
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+
+        user_photos = UserPhoto.objects.filter(caption='Copies')
+        self.assertEqual(len(user_photos), 2)
+        self.assertEqual(
+            len(set(user_photo.image.name for user_photo in user_photos)),
+            1
+        )
+        self.assertEqual(
+            StoredFile.objects.get(name=user_photos[0].image.name).ref_count,
+            2
+        )
+
+    @override_settings(MEDIA_ALBUMS={
+        'user_uploaded_photos_enabled': True,
+        'notification_backend': 'media_albums.notifications.SyncBackend',
+    })
+    def test_user_photo_chunked_upload(self):
+        reload_admin()
+        staging_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_dir)
+        MEDIA_ALBUMS_SETTINGS['upload_staging_dir'] = staging_dir
+        self.client.login(username='normal_user', password='testing!')
+
+        data = make_jpeg(size=(60, 30)).read()
+        start_data = {
+            'name': 'Chunked',
+            'caption': 'Chunked caption',
+            'file_name': 'chunked.jpg',
+            'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        }
+
+        response = self.client.post(
+            reverse('user-photo-chunked-upload'),
+            dict(start_data, sha256='not a checksum'),
+        )
+        self.assertEqual(response.status_code, 400)
+
+        # A file that is too large is refused before it is sent.
+        response = self.client.post(
+            reverse('user-photo-chunked-upload'),
+            dict(start_data, size=100 * 1024 * 1024 + 1),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(
+            'size',
+            json.loads(response.content.decode())['errors'],
+        )
+
+        response = self.client.post(
+            reverse('user-photo-chunked-upload'),
+            start_data,
+        )
+        self.assertEqual(response.status_code, 201)
+        url = response['Location']
+        self.assertEqual(json.loads(response.content.decode())['offset'], 0)
+
+        def send(start, end):
+            return self.client.generic(
+                'PATCH',
+                url,
+                data[start:end + 1],
+                content_type='application/octet-stream',
+                HTTP_CONTENT_RANGE='bytes %d-%d/%d' % (start, end, len(data)),
+            )
+
+        middle = len(data) // 2
+        response = send(0, middle - 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Range'], 'bytes=0-%d' % (middle - 1))
+
+        # A chunk that does not start where the upload left off is refused.
+        response = send(0, middle - 1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            json.loads(self.client.get(url).content.decode())['offset'],
+            middle
+        )
+
+        response = send(middle, len(data) - 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(os.listdir(staging_dir), [])
+
+        user_photo = UserPhoto.objects.get(name='Chunked')
+        self.assertEqual(user_photo.caption, 'Chunked caption')
+        self.assertEqual(user_photo.image.read(), data)
+        user_photo.image.close()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(MEDIA_ALBUMS={
+        'user_uploaded_photos_enabled': True,
+    })
+    def test_user_photo_chunked_upload_checksum_mismatch(self):
+        compute_settings()
+        staging_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_dir)
+        MEDIA_ALBUMS_SETTINGS['upload_staging_dir'] = staging_dir
+        self.client.login(username='normal_user', password='testing!')
+
+        data = make_jpeg().read()
+        response = self.client.post(reverse('user-photo-chunked-upload'), {
+            'name': 'Corrupted',
+            'file_name': 'corrupted.jpg',
+            'size': len(data),
+            'sha256': hashlib.sha256(b'something else').hexdigest(),
+        })
+        url = response['Location']
+
+        response = self.client.generic(
+            'PATCH',
+            url,
+            data,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE='bytes 0-%d/%d' % (len(data) - 1, len(data)),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserPhoto.objects.filter(name='Corrupted').exists())
+
+        # The upload starts over.
+        self.assertEqual(
+            json.loads(self.client.get(url).content.decode())['offset'],
+            0
+        )
+
     def test_user_photo_upload_success(self):
         compute_settings()
         url = reverse('user-photo-upload-success')
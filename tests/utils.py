@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+from io import BytesIO
+
+try:
+    from importlib import reload
+except ImportError:
+    pass
+
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.admin.sites import NotRegistered
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import clear_url_caches
+from django.db import connection
+from PIL import Image
+
+from media_albums import admin as media_albums_admin
+from media_albums.settings import compute_settings
+from . import urls as test_urls
+
+
+def make_jpeg(
+    name='photo.jpg',
+    size=(40, 20),
+    orientation=None,
+    byte_order='<',
+    exif_tags=None,
+):
+    """
+    Return an uploaded JPEG file with the given size and, optionally, the
+    given EXIF orientation and other EXIF tags (stored in the given byte
+    order).
+    """
+    img = Image.new('RGB', size, (255, 0, 0))
+    # Make the top left corner easy to find after the image is rotated.
+    img.paste((0, 0, 255), (0, 0, size[0] // 4, size[1] // 4))
+
+    save_kwargs = {}
+
+    if orientation is not None or exif_tags:
+        exif = Image.Exif()
+        exif.endian = byte_order
+
+        if orientation is not None:
+            exif[0x0112] = orientation
+
+        for tag, value in (exif_tags or {}).items():
+            exif[tag] = value
+
+        save_kwargs['exif'] = exif.tobytes()
+
+    data = BytesIO()
+    img.save(data, 'JPEG', **save_kwargs)
+
+    return SimpleUploadedFile(name, data.getvalue(), 'image/jpeg')
+
+
+def reload_admin():
+    """
+    Apply the current `MEDIA_ALBUMS` settings to the admin and the URLs.
+
+    The app's models are unregistered first, so that reloading the admin
+    module registers instances of its new classes instead of keeping the
+    instances of the classes it replaced.
+    """
+    compute_settings()
+
+    for model in apps.get_app_config('media_albums').get_models():
+        try:
+            admin.site.unregister(model)
+        except NotRegistered:
+            pass
+
+    reload(media_albums_admin)
+    clear_url_caches()
+    reload(test_urls)
+
+
+@contextmanager
+def run_commit_hooks():
+    """
+    Run the `transaction.on_commit()` callbacks registered in the block when
+    it exits, as if its transaction had been committed (which never happens
+    inside of a test case). Callbacks registered by those callbacks are run
+    too.
+    """
+    start = len(getattr(connection, 'run_on_commit', []))
+
+    yield
+
+    # Django 1.8 has no `on_commit()`, so the tasks have already run.
+    while len(getattr(connection, 'run_on_commit', [])) > start:
+        callbacks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+
+        for sids, func in callbacks:
+            func()